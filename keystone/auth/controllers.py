@@ -367,9 +367,9 @@ class Auth(controller.V3Controller):
         token_ref = self.token_api.get_token(context=context,
                                              token_id=token_id)
         if cms.is_ans1_token(token_id):
-            verified_token = cms.cms_verify(cms.token_to_cms(token_id),
-                                            CONF.signing.certfile,
-                                            CONF.signing.ca_certs)
+            verified_token = cms.verify_token(token_id,
+                                              CONF.signing.certfile,
+                                              CONF.signing.ca_certs)
             token_ref = json.loads(verified_token)
         if belongs_to:
             assert token_ref['project']['id'] == belongs_to
@@ -21,8 +21,8 @@ import subprocess
 import uuid
 import webob
 
-from keystone.common import cms
 from keystone.common import logging
+from keystone.common import signing
 from keystone.common import utils
 from keystone import catalog
 from keystone import config
@@ -303,40 +303,50 @@ def create_token(context, auth_context, auth_info):
         auth_context.get('expires_at', None),
         trust)
 
+    expiry = token_data['token']['expires_at']
+    if isinstance(expiry, basestring):
+        expiry = timeutils.normalize_time(timeutils.parse_isotime(expiry))
+    role_ids = []
+    if 'project' in token_data['token']:
+        # project-scoped token, fill in the v2 token data
+        # all we care are the role IDs
+        role_ids = [role['id'] for role in token_data['token']['roles']]
+    metadata_ref = {'roles': role_ids}
+    data = dict(expires=expiry,
+                user=token_data['token']['user'],
+                tenant=token_data['token'].get('project'),
+                metadata=metadata_ref,
+                token_data=token_data,
+                trust_id=trust['id'] if trust else None)
+
+    token_api = token_module.Manager()
     if CONF.signing.token_format == 'UUID':
         token_id = uuid.uuid4().hex
     elif CONF.signing.token_format == 'PKI':
         try:
-            token_id = cms.cms_sign_token(json.dumps(token_data),
-                                          CONF.signing.certfile,
-                                          CONF.signing.keyfile)
+            token_id = signing.cms_sign_token(json.dumps(token_data),
+                                              CONF.signing.certfile,
+                                              CONF.signing.keyfile)
         except subprocess.CalledProcessError:
             raise exception.UnexpectedError(_(
                 'Unable to sign token.'))
+    elif CONF.signing.token_format == 'PKIZ':
+        try:
+            token_id = signing.pkiz_sign(json.dumps(token_data),
+                                         CONF.signing.certfile,
+                                         CONF.signing.keyfile)
+        except subprocess.CalledProcessError:
+            raise exception.UnexpectedError(_(
+                'Unable to sign token.'))
+    elif CONF.signing.token_format == 'ENCRYPTED':
+        token_id = token_api.encrypt_token(context, data)
     else:
         raise exception.UnexpectedError(_(
             'Invalid value for token_format: %s.'
-            '  Allowed values are PKI or UUID.') %
+            '  Allowed values are PKI, PKIZ, UUID or ENCRYPTED.') %
             CONF.signing.token_format)
-    token_api = token_module.Manager()
+    data.update(key=token_id, id=token_id)
     try:
-        expiry = token_data['token']['expires_at']
-        if isinstance(expiry, basestring):
-            expiry = timeutils.normalize_time(timeutils.parse_isotime(expiry))
-        role_ids = []
-        if 'project' in token_data['token']:
-            # project-scoped token, fill in the v2 token data
-            # all we care are the role IDs
-            role_ids = [role['id'] for role in token_data['token']['roles']]
-        metadata_ref = {'roles': role_ids}
-        data = dict(key=token_id,
-                    id=token_id,
-                    expires=expiry,
-                    user=token_data['token']['user'],
-                    tenant=token_data['token'].get('project'),
-                    metadata=metadata_ref,
-                    token_data=token_data,
-                    trust_id=trust['id'] if trust else None)
         token_api.create_token(context, token_id, data)
     except Exception as e:
         # an identical token may have been created already.
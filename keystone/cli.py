@@ -111,7 +111,34 @@ class SSLSetup(BaseCertificateSetup):
         conf_ssl.run()
 
 
-class ImportLegacy(BaseApp):
+class TokenKeyRotate(BaseCertificateSetup):
+    """Add a new key for encrypted tokens, retiring the oldest ones."""
+
+    name = 'token_key_rotate'
+
+    @classmethod
+    def main(cls):
+        from keystone.token import encrypted
+        keystone_user_id, keystone_group_id = cls.get_user_group()
+        encrypted.get_key_repository().rotate(keystone_user_id,
+                                              keystone_group_id)
+
+
+class BaseBulkImport(BaseApp):
+    """Common options for commands that import identity data in bulk"""
+
+    @classmethod
+    def add_argument_parser(cls, subparsers):
+        parser = super(BaseBulkImport, cls).add_argument_parser(subparsers)
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows to insert in each statement.')
+        parser.add_argument('--workers', type=int,
+                            help='Processes hashing passwords; defaults '
+                                 'to the number of CPUs.')
+        return parser
+
+
+class ImportLegacy(BaseBulkImport):
     """Import a legacy database."""
 
     name = 'import_legacy'
@@ -125,7 +152,9 @@ class ImportLegacy(BaseApp):
     @staticmethod
     def main():
         from keystone.common.sql import legacy
-        migration = legacy.LegacyMigration(CONF.command.old_db)
+        migration = legacy.LegacyMigration(CONF.command.old_db,
+                                           CONF.command.batch_size,
+                                           CONF.command.workers)
         migration.migrate_all()
 
 
@@ -148,7 +177,7 @@ class ExportLegacyCatalog(BaseApp):
         print '\n'.join(migration.dump_catalog())
 
 
-class ImportNovaAuth(BaseApp):
+class ImportNovaAuth(BaseBulkImport):
     """Import a dump of nova auth data into keystone."""
 
     name = 'import_nova_auth'
@@ -163,7 +192,9 @@ class ImportNovaAuth(BaseApp):
     def main():
         from keystone.common.sql import nova
         dump_data = jsonutils.loads(open(CONF.command.dump_file).read())
-        nova.import_auth(dump_data)
+        nova.import_auth(dump_data,
+                         CONF.command.batch_size,
+                         CONF.command.workers)
 
 
 CMDS = [
@@ -173,6 +204,7 @@ CMDS = [
     ImportNovaAuth,
     PKISetup,
     SSLSetup,
+    TokenKeyRotate,
 ]
 
 
@@ -1,4 +1,6 @@
+import base64
 import hashlib
+import zlib
 
 from keystone.common import logging
 
@@ -6,6 +8,9 @@ from keystone.common import logging
 subprocess = None
 LOG = logging.getLogger(__name__)
 PKI_ANS1_PREFIX = 'MII'
+PKIZ_PREFIX = 'PKIZ_'
+# documents are signed with this digest, whatever openssl's default
+DIGEST = 'sha256'
 
 
 def _ensure_subprocess():
@@ -24,17 +29,22 @@ def _ensure_subprocess():
             import subprocess
 
 
-def cms_verify(formatted, signing_cert_file_name, ca_file_name):
+def cms_verify(formatted, signing_cert_file_name, ca_file_name,
+               inform='PEM'):
     """
         verifies the signature of the contents IAW CMS syntax
     """
     _ensure_subprocess()
-    process = subprocess.Popen(["openssl", "cms", "-verify",
-                                "-certfile", signing_cert_file_name,
-                                "-CAfile", ca_file_name,
-                                "-inform", "PEM",
-                                "-nosmimecap", "-nodetach",
-                                "-nocerts", "-noattr"],
+    args = ["openssl", "cms", "-verify",
+            "-certfile", signing_cert_file_name,
+            "-CAfile", ca_file_name,
+            "-inform", inform,
+            "-nosmimecap", "-nodetach",
+            "-nocerts", "-noattr"]
+    if inform == 'DER':
+        # the content is binary, so must not be translated to MIME text
+        args.append("-binary")
+    process = subprocess.Popen(args,
                                stdin=subprocess.PIPE,
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE)
@@ -66,6 +76,8 @@ def token_to_cms(signed_text):
 
 
 def verify_token(token, signing_cert_file_name, ca_file_name):
+    if is_pkiz(token):
+        return pkiz_verify(token, signing_cert_file_name, ca_file_name)
     return cms_verify(token_to_cms(token),
                       signing_cert_file_name,
                       ca_file_name)
@@ -109,22 +121,36 @@ def is_ans1_token(token):
     Max length of the content using 2 octets is 7FFF or 32767
     It's not practical to support a token of this length or greater in http
     therefore, we will check for MII only and ignore the case of larger tokens
+
+    Compressed PKI tokens carry the signed document in DER form behind
+    PKIZ_PREFIX, so they are recognized by that prefix instead.
     '''
-    return token[:3] == PKI_ANS1_PREFIX
+    return token[:3] == PKI_ANS1_PREFIX or is_pkiz(token)
+
+
+def is_pkiz(token):
+    return token[:len(PKIZ_PREFIX)] == PKIZ_PREFIX
 
 
-def cms_sign_text(text, signing_cert_file_name, signing_key_file_name):
+def cms_sign_text(text, signing_cert_file_name, signing_key_file_name,
+                  outform='PEM'):
     """ Uses OpenSSL to sign a document
     Produces a Base64 encoding of a DER formatted CMS Document
     http://en.wikipedia.org/wiki/Cryptographic_Message_Syntax
+
+    With outform='DER', produces the DER formatted CMS Document itself.
     """
     _ensure_subprocess()
-    process = subprocess.Popen(["openssl", "cms", "-sign",
-                                "-signer", signing_cert_file_name,
-                                "-inkey", signing_key_file_name,
-                                "-outform", "PEM",
-                                "-nosmimecap", "-nodetach",
-                                "-nocerts", "-noattr"],
+    args = ["openssl", "cms", "-sign",
+            "-signer", signing_cert_file_name,
+            "-inkey", signing_key_file_name,
+            "-md", DIGEST,
+            "-outform", outform,
+            "-nosmimecap", "-nodetach",
+            "-nocerts", "-noattr"]
+    if outform == 'DER':
+        args.append("-binary")
+    process = subprocess.Popen(args,
                                stdin=subprocess.PIPE,
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE)
@@ -146,6 +172,26 @@ def cms_sign_token(text, signing_cert_file_name, signing_key_file_name):
     return cms_to_token(output)
 
 
+def pkiz_sign(text, signing_cert_file_name, signing_key_file_name):
+    """Sign a deflated copy of a document, producing a compressed token.
+
+    The token is PKIZ_PREFIX followed by the URL safe Base64 encoding of
+    the DER formatted CMS Document, which skips the PEM line wrapping and
+    is typically less than half the size of a cms_sign_token token.
+    """
+    output = cms_sign_text(zlib.compress(text, 9), signing_cert_file_name,
+                           signing_key_file_name, outform='DER')
+    return PKIZ_PREFIX + base64.urlsafe_b64encode(output)
+
+
+def pkiz_verify(token, signing_cert_file_name, ca_file_name):
+    """Verify a token produced by pkiz_sign, returning the document."""
+    der = base64.urlsafe_b64decode(str(token[len(PKIZ_PREFIX):]))
+    output = cms_verify(der, signing_cert_file_name, ca_file_name,
+                        inform='DER')
+    return zlib.decompress(output)
+
+
 def cms_to_token(cms_text):
 
     start_delim = "-----BEGIN CMS-----"
@@ -208,6 +208,7 @@ def configure():
     register_str(
         'member_role_id', default='9fe2ff9ee4384b1894a90878d3e92bab')
     register_str('member_role_name', default='_member_')
+    register_bool('instrument_backends', default=False)
 
     # identity
     register_str('default_domain_id', group='identity', default='default')
@@ -254,11 +255,26 @@ def configure():
     register_str('ca_password', group='signing', default=None)
     register_str('cert_subject', group='signing',
                  default='/C=US/ST=Unset/L=Unset/O=Unset/CN=www.example.com')
+    register_str('key_repository', group='signing',
+                 default='/etc/keystone/token-keys')
+    register_int('max_active_keys', group='signing', default=3)
+    register_int('workers', group='signing', default=0)
+    register_int('worker_batch_size', group='signing', default=16)
+
+    # kvs
+    register_str('path', group='kvs', default=None)
+    register_int('fsync_batch_size', group='kvs', default=32)
+    register_int('compact_ratio', group='kvs', default=50)
 
     # sql
     register_str('connection', group='sql', secret=True,
                  default='sqlite:///keystone.db')
     register_int('idle_timeout', group='sql', default=200)
+    register_int('ping_interval', group='sql', default=10)
+    register_str('pool_class', group='sql', default=None)
+    register_int('pool_size', group='sql', default=None)
+    register_int('max_overflow', group='sql', default=None)
+    register_int('pool_timeout', group='sql', default=None)
 
     register_str(
         'driver',
@@ -278,10 +294,16 @@ def configure():
         'driver', group='trust', default='keystone.trust.backends.sql.Trust')
     register_str(
         'driver', group='ec2', default='keystone.contrib.ec2.backends.kvs.Ec2')
+    register_int('token_cache_size', group='ec2', default=10000)
+    register_int('token_reuse_margin', group='ec2', default=300)
+    register_int('credential_cache_ttl', group='ec2', default=60)
+    register_int('credential_cache_size', group='ec2', default=10000)
     register_str(
         'driver',
         group='stats',
         default='keystone.contrib.stats.backends.kvs.Stats')
+    register_int('flush_interval', group='stats', default=10)
+    register_int('max_tracked_values', group='stats', default=100)
 
     # ldap
     register_str('url', group='ldap', default='ldap://localhost')
@@ -293,6 +315,11 @@ def configure():
     register_bool('allow_subtree_delete', group='ldap', default=False)
     register_str('query_scope', group='ldap', default='one')
     register_int('page_size', group='ldap', default=0)
+    register_int('search_chunk_size', group='ldap', default=100)
+    register_int('dn_cache_size', group='ldap', default=10000)
+    register_bool('use_auth_pool', group='ldap', default=False)
+    register_int('auth_pool_size', group='ldap', default=100)
+    register_int('auth_pool_connection_lifetime', group='ldap', default=60)
     register_str('alias_dereferencing', group='ldap', default='default')
 
     register_str('user_tree_dn', group='ldap', default=None)
@@ -314,6 +341,8 @@ def configure():
     register_bool('user_allow_delete', group='ldap', default=True)
     register_bool('user_enabled_emulation', group='ldap', default=False)
     register_str('user_enabled_emulation_dn', group='ldap', default=None)
+    register_int(
+        'user_enabled_emulation_cache_time', group='ldap', default=0)
     register_list(
         'user_additional_attribute_mapping', group='ldap', default=None)
 
@@ -333,6 +362,8 @@ def configure():
     register_bool('tenant_allow_delete', group='ldap', default=True)
     register_bool('tenant_enabled_emulation', group='ldap', default=False)
     register_str('tenant_enabled_emulation_dn', group='ldap', default=None)
+    register_int(
+        'tenant_enabled_emulation_cache_time', group='ldap', default=0)
     register_list(
         'tenant_additional_attribute_mapping', group='ldap', default=None)
 
@@ -380,6 +411,8 @@ def configure():
     register_bool('domain_allow_delete', group='ldap', default=True)
     register_bool('domain_enabled_emulation', group='ldap', default=False)
     register_str('domain_enabled_emulation_dn', group='ldap', default=None)
+    register_int(
+        'domain_enabled_emulation_cache_time', group='ldap', default=0)
     register_list(
         'domain_additional_attribute_mapping', group='ldap', default=None)
 
@@ -1,5 +1,6 @@
 import collections
 import functools
+import itertools
 import uuid
 
 from keystone.common import dependency
@@ -155,22 +156,13 @@ class V2Controller(wsgi.Application):
 
     def _delete_tokens_for_trust(self, context, user_id, trust_id):
         try:
-            token_list = self.token_api.list_tokens(context, user_id,
-                                                    trust_id=trust_id)
-            for token in token_list:
-                self.token_api.delete_token(context, token)
+            self.token_api.delete_tokens(context, user_id, trust_id=trust_id)
         except exception.NotFound:
             pass
 
     def _delete_tokens_for_user(self, context, user_id, project_id=None):
         #First delete tokens that could get other tokens.
-        for token_id in self.token_api.list_tokens(context,
-                                                   user_id,
-                                                   tenant_id=project_id):
-            try:
-                self.token_api.delete_token(context, token_id)
-            except exception.NotFound:
-                pass
+        self.token_api.delete_tokens(context, user_id, tenant_id=project_id)
 
         #delete tokens generated from trusts
         for trust in self.trust_api.list_trusts_for_trustee(context, user_id):
@@ -180,6 +172,20 @@ class V2Controller(wsgi.Application):
                                           trust['trustee_user_id'],
                                           trust['id'])
 
+    def _delete_tokens_for_users(self, context, user_ids):
+        """Like _delete_tokens_for_user, for many users at once."""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        self.token_api.delete_tokens_for_users(context, user_ids)
+
+        for trust in self.trust_api.list_trusts(context):
+            if (trust['trustee_user_id'] in user_ids or
+                    trust['trustor_user_id'] in user_ids):
+                self._delete_tokens_for_trust(context,
+                                              trust['trustee_user_id'],
+                                              trust['id'])
+
     def _require_attribute(self, ref, attr):
         """Ensures the reference contains the specified attribute."""
         if ref.get(attr) is None or ref.get(attr) == '':
@@ -247,21 +253,53 @@ class V3Controller(V2Controller):
 
     @classmethod
     def wrap_collection(cls, context, refs, filters=[]):
+        """Wraps a collection of references for rendering.
+
+        Filtering, pagination and member wrapping are applied lazily, so the
+        collection is returned as an iterator which the response renderer
+        streams one member at a time.
+
+        """
         for f in filters:
             refs = cls.filter_by_attribute(context, refs, f)
 
         refs = cls.paginate(context, refs)
 
-        for ref in refs:
-            cls.wrap_member(context, ref)
-
-        container = {cls.collection_name: refs}
+        container = {cls.collection_name: cls._wrap_members(context, refs)}
         container['links'] = {
             'next': None,
             'self': cls.base_url(path=context['path']),
             'previous': None}
         return container
 
+    @classmethod
+    def wrap_batch(cls, context, results):
+        """Wraps the results of a batch operation for rendering.
+
+        Each result is either a reference, wrapped as a member, or the error
+        raised for that item, rendered as the body of an error response.
+
+        """
+        items = []
+        for result in results:
+            if isinstance(result, exception.Error):
+                items.append(cls._wrap_error(result))
+            else:
+                items.append(cls.wrap_member(context, result))
+        return {cls.collection_name: items}
+
+    @classmethod
+    def _wrap_error(cls, error):
+        return {'error': {'code': error.code,
+                          'title': error.title,
+                          'message': str(error)}}
+
+    @classmethod
+    def _wrap_members(cls, context, refs):
+        for ref in refs:
+            cls.wrap_member(context, ref)
+            yield ref
+
     @classmethod
     def paginate(cls, context, refs):
         """Paginates a list of references by page & per_page query strings."""
@@ -270,7 +308,7 @@ class V3Controller(V2Controller):
 
         page = context['query_string'].get('page', 1)
         per_page = context['query_string'].get('per_page', 30)
-        return refs[per_page * (page - 1):per_page * page]
+        return itertools.islice(refs, per_page * (page - 1), per_page * page)
 
     @classmethod
     def filter_by_attribute(cls, context, refs, attr):
@@ -296,7 +334,7 @@ class V3Controller(V2Controller):
 
         if attr in context['query_string']:
             value = context['query_string'][attr]
-            return [r for r in refs if _attr_match(r[attr], value)]
+            return (r for r in refs if _attr_match(r[attr], value))
         return refs
 
     def _require_matching_id(self, value, ref):
@@ -304,6 +342,45 @@ class V3Controller(V2Controller):
         if 'id' in ref and ref['id'] != value:
             raise exception.ValidationError('Cannot change ID')
 
+    def _require_batch(self, name, refs):
+        """Ensures a batch request carries a list of references."""
+        if not isinstance(refs, list):
+            msg = '%s must be a list' % name
+            raise exception.ValidationError(message=msg)
+        return refs
+
+    def _apply_batch(self, refs, check, apply):
+        """Applies a batch operation to the references that pass a check.
+
+        Batches are best-effort: a reference that fails does not stop the
+        others from being applied, and those applied are kept.
+
+        :param check: raises keystone.exception.Error for an invalid
+                      reference, which becomes its result; references
+                      that are not dicts never pass
+        :param apply: takes the list of valid references, and returns a
+                      result for each
+        :returns: a result for each reference in turn
+
+        """
+        results = [None] * len(refs)
+        valid = []
+        for i, ref in enumerate(refs):
+            try:
+                if not isinstance(ref, dict):
+                    raise exception.ValidationError(
+                        message='Each item must be an object')
+                if check is not None:
+                    check(ref)
+            except exception.Error as e:
+                results[i] = e
+            else:
+                valid.append(i)
+        applied = apply([refs[i] for i in valid]) if valid else []
+        for i, result in zip(valid, applied):
+            results[i] = result
+        return results
+
     def _assign_unique_id(self, ref):
         """Generates and assigns a unique identifer to a reference."""
         ref = ref.copy()
@@ -340,6 +417,18 @@ class V3Controller(V2Controller):
                     ref['domain_id'] = DEFAULT_DOMAIN_ID
         return ref
 
+    def _normalize_domain_ids(self, context, refs):
+        """Like _normalize_domain_id, for a batch of references."""
+        domain_id = None
+        for ref in refs:
+            if 'domain_id' not in ref:
+                # the default only needs to be looked up once
+                if domain_id is None:
+                    domain_id = self._normalize_domain_id(
+                        context, {})['domain_id']
+                ref['domain_id'] = domain_id
+        return refs
+
     def _filter_domain_id(self, ref):
         """Override v2 filter to let domain_id out for v3 calls."""
         return ref
@@ -0,0 +1,110 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Accounting of the backend work done on behalf of each request.
+
+While a request is being accounted for (see :func:`start_request`), every
+call through a :class:`keystone.common.manager.Manager` and every SQL
+statement executed is recorded against it. Outside of a request nothing is
+recorded, so the cost when instrumentation is disabled is a single
+greenthread-local lookup per backend call.
+
+Requests are told apart by greenthread, whether or not eventlet has patched
+the ``thread`` module (it doesn't with ``standard_threads`` set, or while
+debugging with pydev).
+
+"""
+
+from eventlet import corolocal
+
+
+_local = corolocal.local()
+
+
+class RequestAccounting(object):
+    """Backend calls and SQL statements made while serving one request."""
+
+    def __init__(self):
+        # {(manager, method): [call count, cumulative seconds]}
+        self.calls = {}
+        self.sql_statements = 0
+        self.depth = 0
+
+    def record_call(self, manager, method, elapsed):
+        totals = self.calls.get((manager, method))
+        if totals is None:
+            totals = self.calls[(manager, method)] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+
+    def record_statement(self):
+        self.sql_statements += 1
+
+    @property
+    def call_count(self):
+        return sum(count for count, elapsed in self.calls.itervalues())
+
+    def summary(self):
+        """Totals for the request, formatted for the access log."""
+        return 'backend_calls=%d sql_statements=%d' % (
+            self.call_count, self.sql_statements)
+
+    def breakdown(self):
+        """Per (manager, method) totals, most time consuming first."""
+        calls = sorted(self.calls.iteritems(),
+                       key=lambda x: x[1][1],
+                       reverse=True)
+        lines = []
+        for (manager, method), (count, elapsed) in calls:
+            lines.append('%s.%s calls=%d time=%.1fms' % (
+                manager, method, count, elapsed * 1000))
+        return lines
+
+
+def start_request():
+    """Begin accounting for the request served by the current thread.
+
+    Calls may be nested, in which case the innermost caller shares the
+    accounting started by the outermost one.
+
+    """
+    accounting = current()
+    if accounting is None:
+        accounting = _local.accounting = RequestAccounting()
+    accounting.depth += 1
+    return accounting
+
+
+def end_request():
+    """Stop accounting and return what was recorded, if anything."""
+    accounting = current()
+    if accounting is not None:
+        accounting.depth -= 1
+        if accounting.depth <= 0:
+            _local.accounting = None
+    return accounting
+
+
+def current():
+    """Return the accounting for the current request, if there is one."""
+    return getattr(_local, 'accounting', None)
+
+
+def count_statement(*args, **kwargs):
+    """SQLAlchemy ``before_cursor_execute`` listener."""
+    accounting = current()
+    if accounting is not None:
+        accounting.record_statement()
@@ -14,26 +14,331 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import bisect
+import datetime
+import fcntl
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import eventlet
+from eventlet import semaphore
+from eventlet import tpool
+
+from keystone.common import config
+from keystone.common import logging
 from keystone import exception
+from keystone.openstack.common import timeutils
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+def _encode_object(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': timeutils.strtime(value)}
+    raise TypeError(_('%r cannot be stored') % value)
+
+
+def _decode_object(value):
+    if len(value) == 1 and '__datetime__' in value:
+        return timeutils.parse_strtime(value['__datetime__'])
+    return value
+
+
+def _dumps(value):
+    return json.dumps(value, default=_encode_object, separators=(',', ':'))
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode_object)
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(_('Stored records are read-only'))
+
+
+class FrozenDict(dict):
+    """A dict stored in a DictKvs, which may no longer be modified."""
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce_ex__(self, protocol):
+        # copies and pickles are ordinary, mutable dicts
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """A list stored in a DictKvs, which may no longer be modified."""
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _read_only
+    __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+def freeze(value):
+    """Return a frozen copy of the dicts and lists making up a record.
+
+    Parts of the record which are already frozen are shared rather than
+    copied, so storing a modified view of a record only copies what was
+    modified. Other values (strings, numbers, datetimes...) are stored as
+    they are.
+
+    """
+    t = type(value)
+    if t is FrozenDict or t is FrozenList:
+        return value
+    if isinstance(value, dict):
+        # bypass the views' accessors, which would copy what they return
+        return FrozenDict((k, freeze(v)) for k, v in dict.iteritems(value))
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in list.__iter__(value))
+    return value
+
+
+def _view(value):
+    """Return a copy-on-write view of a frozen container, if it is one."""
+    t = type(value)
+    if t is FrozenDict:
+        return CopyOnWriteDict(value)
+    if t is FrozenList:
+        return CopyOnWriteList(value)
+    return value
+
+
+class CopyOnWriteDict(dict):
+    """A private, mutable view of a frozen record.
+
+    The view starts out as a shallow copy of the record. Nested dicts and
+    lists are replaced by views of their own when first accessed through
+    it, so parts of the record a caller never looks at are never copied.
+    Those parts remain frozen even when the view is copied with ``dict()``,
+    which bypasses the methods below: modifying them raises TypeError
+    rather than changing the stored record.
+
+    """
+
+    def _wrap(self, key, value):
+        view = _view(value)
+        if view is not value:
+            dict.__setitem__(self, key, view)
+        return view
+
+    def __getitem__(self, key):
+        return self._wrap(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def pop(self, key, *args):
+        return _view(dict.pop(self, key, *args))
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        return key, _view(value)
+
+    def itervalues(self):
+        for key in self.keys():
+            yield self[key]
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        return CopyOnWriteDict(self)
+
+
+class CopyOnWriteList(list):
+    """A private, mutable view of a frozen list; see CopyOnWriteDict."""
+
+    def _wrap(self, index, value):
+        view = _view(value)
+        if view is not value:
+            list.__setitem__(self, index, view)
+        return view
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CopyOnWriteList(list.__getitem__(self, index))
+        return self._wrap(index, list.__getitem__(self, index))
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def pop(self, *args):
+        return _view(list.pop(self, *args))
+
+
+class Index(object):
+    """Maps values derived from records to the keys holding them.
+
+    Only records stored under keys starting with ``prefix`` are indexed;
+    ``index_func`` returns the values a record should be found under.
+
+    """
+
+    def __init__(self, prefix, index_func):
+        self.prefix = prefix
+        self.index_func = index_func
+        self.entries = {}
+        # the values each key was indexed under, to remove it by
+        self.indexed = {}
+
+    def add(self, key, ref):
+        values = frozenset(self.index_func(ref))
+        if values:
+            self.indexed[key] = values
+        for value in values:
+            self.entries.setdefault(value, set()).add(key)
+
+    def remove(self, key):
+        for value in self.indexed.pop(key, ()):
+            keys = self.entries[value]
+            keys.discard(key)
+            if not keys:
+                del self.entries[value]
+
+    def lookup(self, value):
+        return list(self.entries.get(value, ()))
+
+    def clear(self):
+        self.entries = {}
+        self.indexed = {}
+
+
+class OrderedIndex(object):
+    """Keeps the keys of records sorted by a value derived from each record.
+
+    Records for which ``index_func`` returns None are not indexed.
+
+    """
+
+    def __init__(self, prefix, index_func):
+        self.prefix = prefix
+        self.index_func = index_func
+        self.entries = []
+        self.indexed = {}
+
+    def add(self, key, ref):
+        value = self.index_func(ref)
+        if value is None:
+            return
+        self.indexed[key] = value
+        bisect.insort(self.entries, (value, key))
+
+    def remove(self, key):
+        if key not in self.indexed:
+            return
+        entry = (self.indexed.pop(key), key)
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def lookup(self, lower):
+        """Return the keys whose value is greater than ``lower``."""
+        i = bisect.bisect_right(self.entries, (lower, None))
+        return [key for value, key in self.entries[i:] if value > lower]
+
+    def clear(self):
+        self.entries = []
+        self.indexed = {}
 
 
 class DictKvs(dict):
+    """An in memory key value store.
+
+    Records are stored frozen (see ``freeze``), and handed out as
+    copy-on-write views, so callers may modify what they get without
+    affecting what is stored, and only pay for copying what they modify.
+
+    Drivers may declare secondary indexes over the records they store, which
+    are kept up to date by ``set`` and ``delete`` so that lookups by other
+    attributes need not scan every key in the store.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DictKvs, self).__init__(*args, **kwargs)
+        self.indexes = {}
+
+    def add_index(self, name, prefix, index_func, ordered=False):
+        """Declare an index, unless one of the same name already exists.
+
+        :param prefix: only records under keys with this prefix are indexed
+        :param index_func: returns the values a record is indexed under, or
+                           with ``ordered``, the single value it is sorted by
+
+        """
+        if name in self.indexes:
+            return
+        index = (OrderedIndex if ordered else Index)(prefix, index_func)
+        for key, value in self.iteritems():
+            if key.startswith(prefix):
+                index.add(key, value)
+        self.indexes[name] = index
+
+    def lookup(self, name, value):
+        """Return the keys indexed under ``value`` by the named index.
+
+        For ordered indexes, return the keys sorted by the value they were
+        indexed under, for records whose value is greater than ``value``.
+
+        """
+        return self.indexes[name].lookup(value)
+
+    def _index(self, key, value):
+        for index in self.indexes.itervalues():
+            if key.startswith(index.prefix):
+                index.add(key, value)
+
+    def _unindex(self, key):
+        for index in self.indexes.itervalues():
+            if key.startswith(index.prefix):
+                index.remove(key)
+
     def get(self, key, default=None):
+        """Return a copy-on-write view of the record stored under key."""
         try:
-            if isinstance(self[key], dict):
-                return self[key].copy()
-            else:
-                return self[key][:]
+            return _view(self[key])
         except KeyError:
             if default is not None:
                 return default
             raise exception.NotFound(target=key)
 
     def set(self, key, value):
-        if isinstance(value, dict):
-            self[key] = value.copy()
-        else:
-            self[key] = value[:]
+        self._store(key, freeze(value))
+
+    def _store(self, key, value):
+        if self.indexes:
+            self._unindex(key)
+            self._index(key, value)
+        self[key] = value
 
     def delete(self, key):
         """Deletes an item, returning True on success, False otherwise."""
@@ -41,15 +346,355 @@ class DictKvs(dict):
             del self[key]
         except KeyError:
             raise exception.NotFound(target=key)
+        if self.indexes:
+            self._unindex(key)
+
+    def clear(self):
+        super(DictKvs, self).clear()
+        for index in self.indexes.itervalues():
+            index.clear()
+
+
+class FileKvs(DictKvs):
+    """A key value store persisted to an append-only log file.
+
+    Every ``set`` and ``delete`` appends a JSON record to the log, and the
+    whole store is kept in memory, so reads never touch the disk. Several
+    processes may share the same file: writes are serialized with a lock
+    file, and each process replays the records appended by others (reading
+    them through a memory map) before serving a read. The lock file also
+    holds the size of the log, memory mapped by every process, so a read
+    only looks at the log once it has changed.
+
+    Writes reach the operating system immediately and so survive a crash
+    of the process, but are only fsync'ed to disk every ``fsync_batch_size``
+    writes. A torn record left at the end of the log by a crash is
+    discarded the next time the log is written to.
+
+    Once more than ``compact_ratio`` percent of the log is taken up by
+    records that have since been overwritten or deleted, it is rewritten in
+    the background to contain only the live records.
+
+    """
+
+    HEADER = struct.Struct('!cII')
+    SET = 'S'
+    DELETE = 'D'
+
+    # the generation of the log, bumped when it is compacted, and its size
+    STATE = struct.Struct('!QQ')
+
+    # logs smaller than this are never worth compacting
+    MIN_COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, path, fsync_batch_size=32, compact_ratio=50):
+        super(FileKvs, self).__init__()
+        self.path = path
+        self.fsync_batch_size = fsync_batch_size
+        self.compact_ratio = compact_ratio
+        self._fd = None
+        self._lock_fd = None
+        self._state = None
+        self._pid = None
+        self._semaphore = semaphore.Semaphore()
+        self._compactor = None
+        self._reset()
+        self._lock()
+        try:
+            self.refresh(repair=True)
+        finally:
+            self._unlock()
+
+    def _reset(self):
+        DictKvs.clear(self)
+        self._inode = None
+        self._offset = 0
+        self._seen = None
+        self._sizes = {}
+        self._garbage = 0
+        self._unsynced = 0
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT,
+                           0600)
+        self._inode = os.fstat(self._fd).st_ino
+
+    def _lock(self):
+        # other green threads of this process would share the flock()
+        self._semaphore.acquire()
+        # flock() locks belong to the open file, which a forked child would
+        # otherwise share with its parent
+        if self._pid != os.getpid():
+            self._lock_fd = os.open(self.path + '.lock',
+                                    os.O_RDWR | os.O_CREAT, 0600)
+            if os.fstat(self._lock_fd).st_size < self.STATE.size:
+                os.ftruncate(self._lock_fd, self.STATE.size)
+            self._state = mmap.mmap(self._lock_fd, self.STATE.size)
+            self._pid = os.getpid()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._semaphore.release()
+
+    def _publish(self, compacted=False):
+        """Record the size of the log for other processes; needs the lock."""
+        generation, size = self.STATE.unpack_from(self._state)
+        if compacted:
+            generation += 1
+        self.STATE.pack_into(self._state, 0, generation, self._offset)
+        self._seen = (generation, self._offset)
+
+    def refresh(self, repair=False):
+        """Apply the records other processes have appended to the log.
+
+        :param repair: truncate a torn record found at the end of the log;
+                       only safe while holding the lock
+
+        """
+        state = self.STATE.unpack_from(self._state)
+        if state == self._seen and not repair:
+            return
+        self._seen = state
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        if stat is None or stat.st_ino != self._inode:
+            # first use, or the log was compacted by another process
+            self._reset()
+            self._seen = state
+            self._open()
+            stat = os.fstat(self._fd)
+        if stat.st_size > self._offset:
+            self._replay(stat.st_size)
+            if repair and self._offset < stat.st_size:
+                LOG.warning(_('Discarding %(count)s bytes of incomplete '
+                              'records at the end of %(path)s'),
+                            {'count': stat.st_size - self._offset,
+                             'path': self.path})
+                os.ftruncate(self._fd, self._offset)
+                self._publish()
+
+    def _replay(self, size):
+        log = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        try:
+            offset = self._offset
+            while offset + self.HEADER.size <= size:
+                op, length, crc = self.HEADER.unpack_from(log, offset)
+                start = offset + self.HEADER.size
+                end = start + length
+                if end > size:
+                    break
+                payload = log[start:end]
+                if zlib.crc32(payload) & 0xffffffff != crc:
+                    break
+                self._apply(op, _loads(payload), end - offset)
+                offset = end
+            self._offset = offset
+        finally:
+            log.close()
+
+    def _apply(self, op, payload, size):
+        if op == self.SET:
+            key, value = payload
+            self._garbage += self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._store(key, freeze(value))
+        else:
+            key = payload
+            self._garbage += self._sizes.pop(key, 0) + size
+            if dict.__contains__(self, key):
+                DictKvs.delete(self, key)
+
+    @classmethod
+    def _encode(cls, op, payload):
+        payload = _dumps(payload)
+        crc = zlib.crc32(payload) & 0xffffffff
+        return cls.HEADER.pack(op, len(payload), crc) + payload
+
+    def _append(self, records):
+        data = ''.join(records)
+        while data:
+            written = os.write(self._fd, data)
+            data = data[written:]
+        self._unsynced += len(records)
+        if self._unsynced >= self.fsync_batch_size:
+            self.sync()
+
+    def _write(self, op, payload):
+        record = self._encode(op, payload)
+        self._append([record])
+        self._apply(op, payload, len(record))
+        self._offset += len(record)
+        self._publish()
+        if (self._compactor is None and
+                self._offset >= self.MIN_COMPACT_SIZE and
+                self._garbage * 100 > self._offset * self.compact_ratio):
+            self._compactor = eventlet.spawn(self._compact_in_background)
+
+    def sync(self):
+        """Flush every write made so far to disk."""
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            LOG.exception(_('Failed to compact %s'), self.path)
+        finally:
+            self._compactor = None
+
+    def compact(self):
+        """Rewrite the log to contain only the live records."""
+        self._lock()
+        try:
+            self.refresh(repair=True)
+            self._compact()
+        finally:
+            self._unlock()
+
+    def _compact(self):
+        # the records are frozen, so they can be encoded and written out in
+        # another thread while this one keeps serving reads
+        items = dict.items(self)
+        path = self.path + '.compact'
+        sizes = tpool.execute(self._write_log, path, items)
+        os.rename(path, self.path)
+        self._unsynced = 0
+        self._open()
+        self._offset = sum(sizes)
+        self._sizes = dict((key, size) for (key, value), size
+                           in zip(items, sizes))
+        self._garbage = 0
+        self._publish(compacted=True)
+
+    @classmethod
+    def _write_log(cls, path, items):
+        """Write a log holding items to path, returning each record's size."""
+        records = [cls._encode(cls.SET, item) for item in items]
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        try:
+            data = ''.join(records)
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return [len(record) for record in records]
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.wait()
+        self.sync()
+        if self._state is not None:
+            self._state.close()
+        for fd in (self._fd, self._lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._lock_fd = self._state = self._pid = None
+
+    # every read first catches up with the log; code run while replaying it
+    # must use the dict methods directly instead
+
+    def __getitem__(self, key):
+        self.refresh()
+        return super(FileKvs, self).__getitem__(key)
+
+    def __contains__(self, key):
+        self.refresh()
+        return super(FileKvs, self).__contains__(key)
+
+    def __iter__(self):
+        self.refresh()
+        return super(FileKvs, self).__iter__()
+
+    def __len__(self):
+        self.refresh()
+        return super(FileKvs, self).__len__()
+
+    def keys(self):
+        self.refresh()
+        return super(FileKvs, self).keys()
+
+    def items(self):
+        self.refresh()
+        return super(FileKvs, self).items()
+
+    def iteritems(self):
+        self.refresh()
+        return super(FileKvs, self).iteritems()
+
+    def values(self):
+        self.refresh()
+        return super(FileKvs, self).values()
+
+    def itervalues(self):
+        self.refresh()
+        return super(FileKvs, self).itervalues()
+
+    def lookup(self, name, value):
+        self.refresh()
+        return super(FileKvs, self).lookup(name, value)
+
+    def set(self, key, value):
+        value = freeze(value)
+        self._lock()
+        try:
+            self.refresh(repair=True)
+            self._write(self.SET, (key, value))
+        finally:
+            self._unlock()
+
+    def delete(self, key):
+        self._lock()
+        try:
+            self.refresh(repair=True)
+            if not dict.__contains__(self, key):
+                raise exception.NotFound(target=key)
+            self._write(self.DELETE, key)
+        finally:
+            self._unlock()
+
+    def clear(self):
+        self._lock()
+        try:
+            self._reset()
+            self._compact()
+        finally:
+            self._unlock()
 
 
 INMEMDB = DictKvs()
+FILEDBS = {}
+
+
+def get_db():
+    """Return the store shared by drivers that were not given their own.
+
+    This is the log file configured by ``[kvs] path`` if there is one, and
+    otherwise a store kept in memory.
+
+    """
+    path = CONF.kvs.path
+    if not path:
+        return INMEMDB
+    if path not in FILEDBS:
+        FILEDBS[path] = FileKvs(path,
+                                fsync_batch_size=CONF.kvs.fsync_batch_size,
+                                compact_ratio=CONF.kvs.compact_ratio)
+    return FILEDBS[path]
 
 
 class Base(object):
     def __init__(self, db=None):
         if db is None:
-            db = INMEMDB
-        elif isinstance(db, dict):
+            db = get_db()
+        elif not isinstance(db, DictKvs):
             db = DictKvs(db)
         self.db = db
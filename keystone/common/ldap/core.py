@@ -14,14 +14,21 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
+import itertools
 import os.path
+import time
 
+import eventlet
+from eventlet import hubs
+from eventlet import semaphore
 import ldap
 from ldap import filter as ldap_filter
 
 from keystone.common.ldap import fakeldap
 from keystone.common import logging
 from keystone import exception
+from keystone.openstack.common import timeutils
 
 
 LOG = logging.getLogger(__name__)
@@ -39,6 +46,14 @@ LDAP_DEREF = {'always': ldap.DEREF_ALWAYS,
 LDAP_TLS_CERTS = {'never': ldap.OPT_X_TLS_NEVER,
                   'demand': ldap.OPT_X_TLS_DEMAND,
                   'allow': ldap.OPT_X_TLS_ALLOW}
+RESULT_POLL_INTERVAL = 0.05
+# a bind failing with one of these leaves the connection fit for reuse
+BIND_REFUSED = (ldap.INVALID_CREDENTIALS,
+                ldap.INAPPROPRIATE_AUTH,
+                ldap.NO_SUCH_OBJECT,
+                ldap.UNWILLING_TO_PERFORM)
+
+AUTH_POOLS = {}
 
 
 def py2ldap(val):
@@ -97,6 +112,78 @@ def ldap_scope(scope):
                          ', '.join(LDAP_SCOPES.keys()))
 
 
+def normalize_dn(dn):
+    """Return dn with its attribute types and values in lower case."""
+    try:
+        return ldap.dn.dn2str([[(attr.lower(), value.lower(), flags)
+                                for attr, value, flags in rdn]
+                               for rdn in ldap.dn.str2dn(dn)])
+    except ldap.DECODING_ERROR:
+        return dn.lower()
+
+
+class AuthPool(object):
+    """Connections kept for binding as users, and rebound for each.
+
+    Checking a password costs a bind on an open connection, instead of
+    setting up (and possibly negotiating TLS on) a new one. Connections are
+    closed once they are older than lifetime seconds. A bind failing on an
+    idle connection for any reason but refusal is retried on a new one.
+
+    """
+
+    def __init__(self, connect, size, lifetime):
+        self.connect = connect
+        self.lifetime = lifetime
+        self._idle = []
+        self._semaphore = semaphore.Semaphore(size)
+
+    def bind(self, dn, password):
+        with self._semaphore:
+            idle = self._get_idle()
+            if idle is not None:
+                created, conn = idle
+                try:
+                    return self._bind(created, conn, dn, password)
+                except BIND_REFUSED:
+                    raise
+                except Exception as e:
+                    # the server may have closed the connection while it
+                    # sat idle, so try again on a new one
+                    LOG.debug(_('LDAP bind on a pooled connection failed, '
+                                'retrying on a new one: %s'), e)
+            self._bind(time.time(), self.connect(), dn, password)
+
+    def _bind(self, created, conn, dn, password):
+        try:
+            conn.simple_bind_s(dn, password)
+        except BIND_REFUSED:
+            self._idle.append((created, conn))
+            raise
+        except Exception:
+            self._close(conn)
+            raise
+        self._idle.append((created, conn))
+
+    def _get_idle(self):
+        now = time.time()
+        while self._idle:
+            created, conn = self._idle.pop()
+            if now - created < self.lifetime:
+                return created, conn
+            self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.unbind_s()
+        except Exception:
+            pass
+
+    def close(self):
+        while self._idle:
+            self._close(self._idle.pop()[1])
+
+
 class BaseLdap(object):
     DEFAULT_SUFFIX = "dc=example,dc=com"
     DEFAULT_OU = None
@@ -121,6 +208,13 @@ class BaseLdap(object):
         self.LDAP_SCOPE = ldap_scope(conf.ldap.query_scope)
         self.alias_dereferencing = parse_deref(conf.ldap.alias_dereferencing)
         self.page_size = conf.ldap.page_size
+        self.search_chunk_size = conf.ldap.search_chunk_size
+        self.use_auth_pool = conf.ldap.use_auth_pool
+        self.auth_pool_size = conf.ldap.auth_pool_size
+        self.auth_pool_connection_lifetime = (
+            conf.ldap.auth_pool_connection_lifetime)
+        self.dn_cache_size = conf.ldap.dn_cache_size
+        self._dn_cache = {}
         self.use_tls = conf.ldap.use_tls
         self.tls_cacertfile = conf.ldap.tls_cacertfile
         self.tls_cacertdir = conf.ldap.tls_cacertdir
@@ -195,17 +289,19 @@ class BaseLdap(object):
             mapping[ldap_attr] = attr_map
         return mapping
 
-    def get_connection(self, user=None, password=None):
+    def _connect(self):
         if self.LDAP_URL.startswith('fake://'):
-            conn = fakeldap.FakeLdap(self.LDAP_URL)
-        else:
-            conn = LdapWrapper(self.LDAP_URL,
-                               self.page_size,
-                               alias_dereferencing=self.alias_dereferencing,
-                               use_tls=self.use_tls,
-                               tls_cacertfile=self.tls_cacertfile,
-                               tls_cacertdir=self.tls_cacertdir,
-                               tls_req_cert=self.tls_req_cert)
+            return fakeldap.FakeLdap(self.LDAP_URL)
+        return LdapWrapper(self.LDAP_URL,
+                           self.page_size,
+                           alias_dereferencing=self.alias_dereferencing,
+                           use_tls=self.use_tls,
+                           tls_cacertfile=self.tls_cacertfile,
+                           tls_cacertdir=self.tls_cacertdir,
+                           tls_req_cert=self.tls_req_cert)
+
+    def get_connection(self, user=None, password=None):
+        conn = self._connect()
 
         if user is None:
             user = self.LDAP_USER
@@ -220,6 +316,33 @@ class BaseLdap(object):
 
         return conn
 
+    def bind_as(self, dn, password):
+        """Check a password by binding as dn, raising on failure.
+
+        With [ldap] use_auth_pool, the bind is made on a pooled connection
+        kept for this purpose. Otherwise a new connection is used and closed
+        again.
+
+        """
+        if not self.use_auth_pool:
+            conn = self._connect()
+            try:
+                conn.simple_bind_s(dn, password)
+            finally:
+                conn.unbind_s()
+            return
+
+        # connections made with different options must not be shared
+        key = (self.LDAP_URL, self.page_size, self.alias_dereferencing,
+               self.use_tls, self.tls_cacertfile, self.tls_cacertdir,
+               self.tls_req_cert)
+        if key not in AUTH_POOLS:
+            AUTH_POOLS[key] = AuthPool(
+                self._connect,
+                self.auth_pool_size,
+                self.auth_pool_connection_lifetime)
+        AUTH_POOLS[key].bind(dn, password)
+
     def _id_to_dn_string(self, id):
         return '%s=%s,%s' % (self.id_attr,
                              ldap.dn.escape_dn_chars(str(id)),
@@ -228,15 +351,24 @@ class BaseLdap(object):
     def _id_to_dn(self, id):
         if self.LDAP_SCOPE == ldap.SCOPE_ONELEVEL:
             return self._id_to_dn_string(id)
+        try:
+            return self._dn_cache[id]
+        except KeyError:
+            pass
         conn = self.get_connection()
         search_result = conn.search_s(
             self.tree_dn, self.LDAP_SCOPE,
-            '(&(%(id_attr)s=%(id)s)(objectclass=%(objclass)s))' %
+            '(&(%(id_attr)s=%(id)s)(objectClass=%(objclass)s))' %
             {'id_attr': self.id_attr,
              'id': ldap.filter.escape_filter_chars(str(id)),
              'objclass': self.object_class})
         if search_result:
             dn, attrs = search_result[0]
+            # an object keeps its DN, so only DNs found are remembered
+            if self.dn_cache_size:
+                if len(self._dn_cache) >= self.dn_cache_size:
+                    self._dn_cache.popitem()
+                self._dn_cache[id] = dn
             return dn
         else:
             return self._id_to_dn_string(id)
@@ -310,8 +442,7 @@ class BaseLdap(object):
         conn.add_s(self._id_to_dn(values['id']), attrs)
         return values
 
-    def _ldap_get(self, id, filter=None):
-        conn = self.get_connection()
+    def _ldap_get_search(self, id, filter=None):
         query = ('(&(%(id_attr)s=%(id)s)'
                  '%(filter)s'
                  '(objectClass=%(object_class)s))'
@@ -319,10 +450,14 @@ class BaseLdap(object):
                     'id': ldap.filter.escape_filter_chars(str(id)),
                     'filter': (filter or self.filter or ''),
                     'object_class': self.object_class})
+        attrs = list(set((self.attribute_mapping.values() +
+                          self.extra_attr_mapping.keys())))
+        return (self.tree_dn, self.LDAP_SCOPE, query, attrs)
+
+    def _ldap_get(self, id, filter=None):
+        conn = self.get_connection()
         try:
-            attrs = list(set((self.attribute_mapping.values() +
-                              self.extra_attr_mapping.keys())))
-            res = conn.search_s(self.tree_dn, self.LDAP_SCOPE, query, attrs)
+            res = conn.search_s(*self._ldap_get_search(id, filter))
         except ldap.NO_SUCH_OBJECT:
             return None
         try:
@@ -335,12 +470,13 @@ class BaseLdap(object):
         query = '(&%s(objectClass=%s))' % (filter or self.filter or '',
                                            self.object_class)
         try:
-            return conn.search_s(self.tree_dn,
-                                 self.LDAP_SCOPE,
-                                 query,
-                                 self.attribute_mapping.values())
+            for res in conn.search_iter(self.tree_dn,
+                                        self.LDAP_SCOPE,
+                                        query,
+                                        self.attribute_mapping.values()):
+                yield res
         except ldap.NO_SUCH_OBJECT:
-            return []
+            return
 
     def get(self, id, filter=None):
         res = self._ldap_get(id, filter)
@@ -349,18 +485,72 @@ class BaseLdap(object):
         else:
             return self._ldap_res_to_model(res)
 
+    def get_searches(self, id, filter=None):
+        """Return the searches get() makes, to send along with others.
+
+        Pass their results, in the same order, to get_from_results().
+
+        """
+        return [self._ldap_get_search(id, filter)]
+
+    def get_from_results(self, id, results):
+        """Return what get() would, from the results of get_searches()."""
+        try:
+            res = results[0][0]
+        except IndexError:
+            raise self._not_found(id)
+        return self._ldap_res_to_model(res)
+
     def get_by_name(self, name, filter=None):
         query = ('(%s=%s)' % (self.attribute_mapping['name'],
                               ldap_filter.escape_filter_chars(name)))
-        res = self.get_all(query)
-        try:
-            return res[0]
-        except IndexError:
-            raise self._not_found(name)
+        for ref in self.iter_all(query):
+            return ref
+        raise self._not_found(name)
+
+    def iter_all(self, filter=None):
+        """Yield each object as it is read, rather than all of them at once.
+
+        With paging on, at most a page of entries is held in memory. Unlike
+        get_all, the result can be read only once, and the search stays open
+        until it has been read, so it must be consumed right away.
+
+        """
+        for res in self._ldap_get_all(filter):
+            yield self._ldap_res_to_model(res)
 
     def get_all(self, filter=None):
-        return [self._ldap_res_to_model(x)
-                for x in self._ldap_get_all(filter)]
+        return list(self.iter_all(filter))
+
+    def get_all_by_ids(self, ids):
+        """Return the objects with the given ids, searching for many at once.
+
+        Each search ORs together at most [ldap] search_chunk_size ids, to keep
+        filters within the server's limits. Ids that match no object are left
+        out.
+
+        """
+        ids = list(set(ids))
+        if not ids:
+            return []
+        chunk_size = self.search_chunk_size or len(ids)
+        objs = []
+        for i in range(0, len(ids), chunk_size):
+            query = '%s(|%s)' % (
+                self.filter or '',
+                ''.join('(%s=%s)' % (self.id_attr,
+                                     ldap_filter.escape_filter_chars(str(x)))
+                        for x in ids[i:i + chunk_size]))
+            objs.extend(self.get_all(query))
+        return objs
+
+    def get_all_by_domain(self, domain_id):
+        """Return the objects owned by a domain, in a single search."""
+        query = '%s(%s=%s)' % (
+            self.filter or '',
+            self.attribute_mapping['domain_id'],
+            ldap_filter.escape_filter_chars(str(domain_id)))
+        return self.get_all(query)
 
     def update(self, id, values, old_obj=None):
         if not self.allow_update:
@@ -403,6 +593,8 @@ class BaseLdap(object):
             conn.delete_s(self._id_to_dn(id))
         except ldap.NO_SUCH_OBJECT:
             raise self._not_found(id)
+        finally:
+            self._dn_cache.pop(id, None)
 
     def deleteTree(self, id):
         conn = self.get_connection()
@@ -414,6 +606,8 @@ class BaseLdap(object):
                               serverctrls=[tree_delete_control])
         except ldap.NO_SUCH_OBJECT:
             raise self._not_found(id)
+        finally:
+            self._dn_cache.pop(id, None)
 
 
 class LdapWrapper(object):
@@ -490,6 +684,10 @@ class LdapWrapper(object):
         LOG.debug(_("LDAP bind: dn=%s"), user)
         return self.conn.simple_bind_s(user, password)
 
+    def unbind_s(self):
+        LOG.debug(_("LDAP unbind"))
+        return self.conn.unbind_s()
+
     def add_s(self, dn, attrs):
         ldap_attrs = [(kind, [py2ldap(x) for x in safe_iter(values)])
                       for kind, values in attrs]
@@ -502,6 +700,15 @@ class LdapWrapper(object):
         return self.conn.add_s(dn, ldap_attrs)
 
     def search_s(self, dn, scope, query, attrlist=None):
+        return list(self.search_iter(dn, scope, query, attrlist))
+
+    def search_iter(self, dn, scope, query, attrlist=None):
+        """Yield the entries a search finds, converted one at a time.
+
+        With paging on, each page is requested once the previous one has
+        been consumed.
+
+        """
         if LOG.isEnabledFor(logging.DEBUG):
             LOG.debug(_('LDAP search: dn=%s, scope=%s, query=%s, attrs=%s'),
                       dn,
@@ -509,18 +716,16 @@ class LdapWrapper(object):
                       query,
                       attrlist)
         if self.page_size:
-            res = self.paged_search_s(dn, scope, query, attrlist)
+            res = self.paged_search(dn, scope, query, attrlist)
         else:
             res = self.conn.search_s(dn, scope, query, attrlist)
 
-        o = []
         for dn, attrs in res:
-            o.append((dn, dict((kind, [ldap2py(x) for x in values])
-                               for kind, values in attrs.iteritems())))
-        return o
+            yield (dn, dict((kind, [ldap2py(x) for x in values])
+                            for kind, values in attrs.iteritems()))
 
-    def paged_search_s(self, dn, scope, query, attrlist=None):
-        res = []
+    def paged_search(self, dn, scope, query, attrlist=None):
+        """Yield the unconverted entries of a search, page by page."""
         lc = ldap.controls.SimplePagedResultsControl(
             controlType=ldap.LDAP_CONTROL_PAGE_OID,
             criticality=True,
@@ -535,7 +740,8 @@ class LdapWrapper(object):
             # Request to the ldap server a page with 'page_size' entries
             rtype, rdata, rmsgid, serverctrls = self.conn.result3(msgid)
             # Receive the data
-            res.extend(rdata)
+            for entry in rdata:
+                yield entry
             pctrls = [c for c in serverctrls
                       if c.controlType == ldap.LDAP_CONTROL_PAGE_OID]
             if pctrls:
@@ -559,7 +765,58 @@ class LdapWrapper(object):
                               'avoid this message.'))
                 self._disable_paging()
                 break
-        return res
+
+    def search_many(self, searches):
+        """Run several searches at once, returning their results in order.
+
+        Each search is a (dn, scope, query, attrlist) tuple. All of them are
+        sent before any result is read, so the server works on them
+        concurrently, and the calling green thread yields to the hub while
+        it waits. A search of a missing dn returns no entries. Results are
+        not paged.
+
+        """
+        if LOG.isEnabledFor(logging.DEBUG):
+            for dn, scope, query, attrlist in searches:
+                LOG.debug(_('LDAP search: dn=%s, scope=%s, query=%s, '
+                            'attrs=%s'), dn, scope, query, attrlist)
+        pending = {}
+        for i, (dn, scope, query, attrlist) in enumerate(searches):
+            pending[self.conn.search_ext(dn, scope, query, attrlist)] = i
+
+        results = [None] * len(searches)
+        try:
+            while pending:
+                for msgid in pending.keys():
+                    try:
+                        rtype, rdata, rmsgid, serverctrls = (
+                            self.conn.result3(msgid, 1, 0))
+                    except ldap.NO_SUCH_OBJECT:
+                        rdata = []
+                    else:
+                        if rtype is None:
+                            continue
+                    results[pending.pop(msgid)] = rdata
+                if pending:
+                    self._wait_readable()
+        finally:
+            for msgid in pending:
+                self.conn.abandon(msgid)
+
+        return [[(dn, dict((kind, [ldap2py(x) for x in values])
+                           for kind, values in attrs.iteritems()))
+                 for dn, attrs in res]
+                for res in results]
+
+    def _wait_readable(self):
+        # TLS may have read a response off the socket already, so never wait
+        # longer than RESULT_POLL_INTERVAL before polling again
+        try:
+            hubs.trampoline(self.conn.get_option(ldap.OPT_DESC),
+                            read=True,
+                            timeout=RESULT_POLL_INTERVAL)
+        except eventlet.Timeout:
+            pass
 
     def modify_s(self, dn, modlist):
         ldap_modlist = [
@@ -599,6 +856,8 @@ class EnabledEmuMixIn(BaseLdap):
     * $name_enabled_emulation - boolean, on/off
     * $name_enabled_emulation_dn - DN of that groupOfNames, default is
       cn=enabled_$name,$tree_dn
+    * $name_enabled_emulation_cache_time - seconds to keep the members of
+      that groupOfNames in memory, default is 0 (read once per listing)
 
     Where $name is self.options_name ('user' or 'tenant'), $tree_dn is
     self.tree_dn.
@@ -615,44 +874,94 @@ class EnabledEmuMixIn(BaseLdap):
             self.enabled_emulation_dn = ('cn=enabled_%ss,%s' %
                                          (self.options_name, self.tree_dn))
 
-    def _get_enabled(self, object_id):
+        cache_time = '%s_enabled_emulation_cache_time' % self.options_name
+        self.enabled_emulation_cache_time = getattr(conf.ldap, cache_time)
+        self._enabled_members = None
+        self._enabled_members_expires = None
+
+    def _get_enabled_members(self):
+        """Return the normalized DNs of all members of the enabled group.
+
+        The group is read again once enabled_emulation_cache_time has
+        passed, or on every call if that is not set.
+
+        """
+        now = timeutils.utcnow()
+        if (self._enabled_members is not None and
+                now < self._enabled_members_expires):
+            return self._enabled_members
+
         conn = self.get_connection()
-        dn = self._id_to_dn(object_id)
-        query = '(member=%s)' % dn
         try:
-            enabled_value = conn.search_s(self.enabled_emulation_dn,
-                                          ldap.SCOPE_BASE,
-                                          query)
+            res = conn.search_s(self.enabled_emulation_dn,
+                                ldap.SCOPE_BASE,
+                                '(objectClass=*)',
+                                ['member'])
+        except ldap.NO_SUCH_OBJECT:
+            res = []
+        members = set()
+        for dn, attrs in res:
+            members.update(normalize_dn(x) for x in attrs.get('member', []))
+
+        if self.enabled_emulation_cache_time:
+            self._enabled_members = members
+            self._enabled_members_expires = now + datetime.timedelta(
+                seconds=self.enabled_emulation_cache_time)
+        return members
+
+    def _enabled_search(self, dn):
+        return (self.enabled_emulation_dn,
+                ldap.SCOPE_BASE,
+                '(member=%s)' % dn,
+                None)
+
+    def _search_enabled(self, dn):
+        conn = self.get_connection()
+        try:
+            enabled_value = conn.search_s(*self._enabled_search(dn))
         except ldap.NO_SUCH_OBJECT:
             return False
         else:
             return bool(enabled_value)
 
+    def _get_enabled(self, object_id):
+        dn = self._id_to_dn(object_id)
+        if self.enabled_emulation_cache_time:
+            return normalize_dn(dn) in self._get_enabled_members()
+        return self._search_enabled(dn)
+
     def _add_enabled(self, object_id):
-        if not self._get_enabled(object_id):
+        dn = self._id_to_dn(object_id)
+        # the cached members may be stale, so ask the server
+        if not self._search_enabled(dn):
             conn = self.get_connection()
             modlist = [(ldap.MOD_ADD,
                         'member',
-                        [self._id_to_dn(object_id)])]
+                        [dn])]
             try:
                 conn.modify_s(self.enabled_emulation_dn, modlist)
             except ldap.NO_SUCH_OBJECT:
                 attr_list = [('objectClass', ['groupOfNames']),
                              ('member',
-                             [self._id_to_dn(object_id)])]
+                             [dn])]
                 if self.use_dumb_member:
                     attr_list[1][1].append(self.dumb_member)
                 conn.add_s(self.enabled_emulation_dn, attr_list)
+        if self._enabled_members is not None:
+            self._enabled_members.add(normalize_dn(dn))
 
     def _remove_enabled(self, object_id):
+        dn = self._id_to_dn(object_id)
         conn = self.get_connection()
         modlist = [(ldap.MOD_DELETE,
                     'member',
-                    [self._id_to_dn(object_id)])]
+                    [dn])]
         try:
             conn.modify_s(self.enabled_emulation_dn, modlist)
         except (ldap.NO_SUCH_OBJECT, ldap.NO_SUCH_ATTRIBUTE):
             pass
+        if self._enabled_members is not None:
+            self._enabled_members.discard(normalize_dn(dn))
 
     def create(self, values):
         if self.enabled_emulation:
@@ -672,17 +981,45 @@ class EnabledEmuMixIn(BaseLdap):
             ref['enabled'] = self._get_enabled(object_id)
         return ref
 
-    def get_all(self, filter=None):
+    def get_searches(self, object_id, filter=None):
+        searches = super(EnabledEmuMixIn, self).get_searches(object_id,
+                                                             filter)
+        if ('enabled' not in self.attribute_ignore and self.enabled_emulation
+                and not self.enabled_emulation_cache_time):
+            searches.append(self._enabled_search(self._id_to_dn(object_id)))
+        return searches
+
+    def get_from_results(self, object_id, results):
+        ref = super(EnabledEmuMixIn, self).get_from_results(object_id,
+                                                            results)
         if 'enabled' not in self.attribute_ignore and self.enabled_emulation:
-            # had to copy BaseLdap.get_all here to filter by DN
-            tenant_list = [self._ldap_res_to_model(x)
-                           for x in self._ldap_get_all(filter)
-                           if x[0] != self.enabled_emulation_dn]
-            for tenant_ref in tenant_list:
-                tenant_ref['enabled'] = self._get_enabled(tenant_ref['id'])
-            return tenant_list
+            if self.enabled_emulation_cache_time:
+                ref['enabled'] = self._get_enabled(object_id)
+            else:
+                ref['enabled'] = bool(results[1])
+        return ref
+
+    def iter_all(self, filter=None):
+        if 'enabled' not in self.attribute_ignore and self.enabled_emulation:
+            # had to copy BaseLdap.iter_all here to filter by DN
+            res = (x for x in self._ldap_get_all(filter)
+                   if x[0] != self.enabled_emulation_dn)
+            # one search for a single object is cheaper than reading every
+            # member of the group
+            first = list(itertools.islice(res, 2))
+            members = None
+            if len(first) > 1 or self.enabled_emulation_cache_time:
+                members = self._get_enabled_members()
+            for x in itertools.chain(first, res):
+                obj_ref = self._ldap_res_to_model(x)
+                if members is None:
+                    obj_ref['enabled'] = self._search_enabled(x[0])
+                else:
+                    obj_ref['enabled'] = normalize_dn(x[0]) in members
+                yield obj_ref
         else:
-            return super(EnabledEmuMixIn, self).get_all(filter)
+            for obj_ref in super(EnabledEmuMixIn, self).iter_all(filter):
+                yield obj_ref
 
     def update(self, object_id, values, old_obj=None):
         if 'enabled' not in self.attribute_ignore and self.enabled_emulation:
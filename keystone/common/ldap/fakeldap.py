@@ -53,10 +53,14 @@ def _match_query(query, attrs):
     """
     # cut off the parentheses
     inner = query[1:-1]
-    if inner.startswith(('&', '|')):
-        # cut off the & or |
+    if inner.startswith('&'):
+        # cut off the &
         groups = _paren_groups(inner[1:])
         return all(_match_query(group, attrs) for group in groups)
+    if inner.startswith('|'):
+        # cut off the |
+        groups = _paren_groups(inner[1:])
+        return any(_match_query(group, attrs) for group in groups)
     if inner.startswith('!'):
         # cut off the ! and the nested parentheses
         return not _match_query(query[2:-1], attrs)
@@ -330,3 +334,17 @@ class FakeLdap(object):
 
         LOG.debug('FakeLdap search result: %s', objects)
         return objects
+
+    def search_iter(self, dn, scope, query=None, fields=None):
+        """Search like search_s, returning an iterator."""
+        return iter(self.search_s(dn, scope, query, fields))
+
+    def search_many(self, searches):
+        """Run each (dn, scope, query, fields) search in turn."""
+        results = []
+        for dn, scope, query, fields in searches:
+            try:
+                results.append(self.search_s(dn, scope, query, fields))
+            except ldap.NO_SUCH_OBJECT:
+                results.append([])
+        return results
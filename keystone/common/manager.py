@@ -15,10 +15,38 @@
 # under the License.
 
 import functools
+import time
 
+from keystone.common import instrumentation
 from keystone.openstack.common import importutils
 
 
+def _call(manager, name, f, *args, **kw):
+    """Call f, recording the call in the current request's accounting."""
+    accounting = instrumentation.current()
+    if accounting is None:
+        return f(*args, **kw)
+
+    start = time.time()
+    try:
+        return f(*args, **kw)
+    finally:
+        accounting.record_call(manager, name, time.time() - start)
+
+
+def instrumented(f):
+    """Record calls to a method a manager defines itself.
+
+    Calls forwarded to the driver are recorded by ``Manager.__getattr__``;
+    methods a manager overrides need this decorator to be recorded too.
+
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kw):
+        return _call(f.__module__, f.__name__, f, *args, **kw)
+    return wrapper
+
+
 class Manager(object):
     """Base class for intermediary request layer.
 
@@ -41,9 +69,10 @@ class Manager(object):
         #               that for now, in the future we'll probably do some
         #               logging and whatnot in this class
         f = getattr(self.driver, name)
+        manager = type(self).__module__
 
         @functools.wraps(f)
         def _wrapper(context, *args, **kw):
-            return f(*args, **kw)
+            return _call(manager, name, f, *args, **kw)
         setattr(self, name, _wrapper)
         return _wrapper
@@ -22,9 +22,15 @@ by convention, with a few hardcoded exceptions.
 
 """
 
-from lxml import etree
+import collections
+import functools
+import itertools
 import re
 
+from lxml import etree
+
+from keystone.openstack.common import jsonutils
+
 
 DOCTYPE = '<?xml version="1.0" encoding="UTF-8"?>'
 XMLNS = 'http://docs.openstack.org/identity/api/v2.0'
@@ -48,6 +54,18 @@ PARSER = etree.XMLParser(
 # public API, so we discover the type dynamically to be safe
 ENTITY_TYPE = type(etree.Entity('x'))
 
+# characters which are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile(
+    u'[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+# characters which need escaping or validation before being written out
+ESCAPED_CHARS = re.compile(u'[&<>"\x00-\x1f\ud800-\udfff\ufffe\uffff]')
+
+# value types which are handled without further conversion
+NATIVE_TYPES = frozenset([str, unicode, int, long, float, bool, dict, list,
+                          type(None)])
+TEXT_TYPES = frozenset([str, unicode, int, long, float, complex])
+
 
 def from_xml(xml):
     """Deserialize XML to a dictionary."""
@@ -67,6 +85,12 @@ def to_xml(d, xmlns=None):
     return serialize(d, xmlns)
 
 
+def to_xml_iter(d, xmlns=None):
+    """Serialize a dictionary to XML, as an iterator of chunks."""
+    serialize = XmlSerializer()
+    return serialize.iterserialize(d, xmlns)
+
+
 class XmlDeserializer(object):
     def __call__(self, xml_str):
         """Returns a dictionary populated by decoding the given xml string."""
@@ -168,10 +192,28 @@ class XmlDeserializer(object):
 
 
 class XmlSerializer(object):
+    """Incrementally writes XML from a dictionary.
+
+    The document is produced as a series of chunks by walking the given
+    value, without building an intermediate element tree. Lists may be
+    replaced by any iterator, which is consumed lazily; each member of a
+    collection at the root of the document is emitted as its own chunk.
+
+    """
+
     def __call__(self, d, xmlns=None):
-        """Returns an xml etree populated by the given dictionary.
+        """Returns an xml string populated by the given dictionary.
+
+        Optionally, namespace the document by specifying an ``xmlns``.
+
+        """
+        return ''.join(self.iterserialize(d, xmlns))
 
-        Optionally, namespace the etree by specifying an ``xmlns``.
+    def iterserialize(self, d, xmlns=None):
+        """Returns an iterator of utf-8 chunks of the serialized dictionary.
+
+        The dictionary is validated immediately, so errors in its shape are
+        raised before any output is produced.
 
         """
         links = None
@@ -198,58 +240,177 @@ class XmlSerializer(object):
             if prefix == ns.get('prefix', None):
                 xmlns = ns['value']
                 break
-        # only the root dom element gets an xlmns
-        root = etree.Element(root_name, xmlns=(xmlns or XMLNS))
 
-        self.populate_element(root, d[name])
+        # only the root dom element gets an xlmns
+        return self._write_document(root_name, d[name], xmlns or XMLNS, links)
 
+    def _write_document(self, root_name, value, xmlns, links):
         # FIXME(gyee): special-case links for now
+        extra = []
         if links:
-            self._populate_links(root, links)
+            extra.append(functools.partial(self._write_links, links))
+
+        attrs, text, children = self._populate(
+            root_name, value, [('xmlns', xmlns)], extra)
+        start = '%s\n%s' % (DOCTYPE, self._start_tag(root_name, attrs, 0))
+
+        if text is not None:
+            yield _encode('%s>%s</%s>\n' % (start, _escape_text(text),
+                                            root_name))
+            return
+
+        for child in children:
+            out = []
+            child(out, 1)
+            if out:
+                if start is not None:
+                    out.insert(0, '%s>\n' % start)
+                    start = None
+                yield _encode(''.join(out))
+
+        if start is None:
+            yield _encode('</%s>\n' % root_name)
+        else:
+            yield _encode('%s/>\n' % start)
+
+    def _start_tag(self, tag, attrs, depth):
+        return '%s<%s%s' % ('  ' * depth, tag, ''.join(
+            [' %s="%s"' % (k, _escape_attribute(v)) for k, v in attrs]))
+
+    def _write(self, out, tag, attrs, text, children, depth):
+        """Writes a single element, indented to match lxml's pretty_print.
+
+        ``children`` is an iterable of callables, each of which accepts the
+        output list and a depth, and appends one or more child elements.
+
+        """
+        start = self._start_tag(tag, attrs, depth)
+
+        if text is not None:
+            out.append('%s>%s</%s>\n' % (start, _escape_text(text), tag))
+            return
+
+        # reserve a slot for the start tag until we know if it's empty
+        mark = len(out)
+        out.append(None)
+        for child in children:
+            child(out, depth + 1)
+
+        if len(out) == mark + 1:
+            out[mark] = '%s/>\n' % start
+        else:
+            out[mark] = '%s>\n' % start
+            out.append('%s</%s>\n' % ('  ' * depth, tag))
+
+    def _write_element(self, tag, value, out, depth):
+        """Writes an element populated with the given value."""
+        attrs, text, children = self._populate(tag, value)
+        self._write(out, tag, attrs, text, children, depth)
 
-        # TODO(dolph): you can get a doctype from lxml, using ElementTrees
-        return '%s\n%s' % (DOCTYPE, etree.tostring(root, pretty_print=True))
+    def _populate(self, tag, value, attrs=None, extra=None):
+        """Splits a value into the attributes, text & children of an element.
 
-    def _populate_links(self, element, links_json):
-        links = etree.Element('links')
+        Children are returned lazily if the value is itself an iterator.
+
+        """
+        attrs = list(attrs or [])
+        children = []
+        text = None
+
+        if type(value) not in NATIVE_TYPES:
+            value = _primitive(value)
+
+        if type(value) is not dict and _is_sequence(value):
+            # xsd compliance: child elements are singular: <users> has <user>s
+            name = tag
+            if tag[-1] == 's':
+                name = tag[:-1]
+                if name == 'policie':
+                    name = 'policy'
+            children = (functools.partial(self._write_element, name, item)
+                        for item in value)
+        elif isinstance(value, dict):
+            for k, v in value.iteritems():
+                t = type(v)
+                if t not in NATIVE_TYPES:
+                    v = _primitive(v)
+                    t = type(v)
+
+                if t is bool:
+                    # booleans are 'true' and 'false'
+                    attrs.append((k, u'true' if v else u'false'))
+                elif t in TEXT_TYPES or isinstance(v, basestring):
+                    # numbers can be handled as strings
+                    if k == 'description':
+                        # always becomes an element
+                        children.append(functools.partial(
+                            self._write_text, k, unicode(v)))
+                    else:
+                        # add attributes to the current element
+                        attrs.append((k, unicode(v)))
+                elif isinstance(v, dict):
+                    children.append(functools.partial(self._write_dict, k,
+                                                      v))
+                elif _is_sequence(v):
+                    children.append(functools.partial(self._write_list, tag,
+                                                      k, v))
+        elif isinstance(value, basestring):
+            text = unicode(value)
+
+        if extra:
+            children = itertools.chain(children, extra)
+        return attrs, text, children
+
+    def _write_text(self, tag, text, out, depth):
+        self._write(out, tag, [], text, [], depth)
+
+    def _write_links(self, links_json, out, depth):
+        out.append('%s<links' % ('  ' * depth))
+        mark = len(out)
         for k, v in links_json.iteritems():
             if v:
-                link = etree.Element('link')
-                link.set('rel', unicode(k))
-                link.set('href', unicode(v))
-                links.append(link)
-        element.append(links)
-
-    def _populate_list(self, element, k, v):
-        """Populates an element with a key & list value."""
+                out.append('%s<link rel="%s" href="%s"/>\n' % (
+                    '  ' * (depth + 1),
+                    _escape_attribute(unicode(k)),
+                    _escape_attribute(unicode(v))))
+        if len(out) == mark:
+            out.append('/>\n')
+        else:
+            out.insert(mark, '>\n')
+            out.append('%s</links>\n' % ('  ' * depth))
+
+    def _write_dict(self, k, v, out, depth):
+        """Writes an element for a key & dictionary value."""
+        if k == 'links':
+            # links is a special dict
+            self._write_links(v, out, depth)
+        else:
+            self._write_element(k, v, out, depth)
+
+    def _write_list(self, parent, k, v, out, depth):
+        """Writes the elements for a key & list value."""
         # spec has a lot of inconsistency here!
-        container = element
+        container = None
 
         if k == 'media-types':
             # xsd compliance: <media-types> contains <media-type>s
-            # find an existing <media-types> element or make one
-            container = element.find('media-types')
-            if container is None:
-                container = etree.Element(k)
-                element.append(container)
+            container = k
             name = k[:-1]
         elif k == 'serviceCatalog' or k == 'catalog':
             # xsd compliance: <serviceCatalog> contains <service>s
-            container = etree.Element(k)
-            element.append(container)
+            container = k
             name = 'service'
-        elif k == 'roles' and element.tag == 'user':
+        elif k == 'roles' and parent == 'user':
             name = 'role'
-        elif k == 'endpoints' and element.tag == 'service':
+        elif k == 'endpoints' and parent == 'service':
             name = 'endpoint'
-        elif k == 'values' and element.tag[-1] == 's':
+        elif k == 'values' and parent[-1] == 's':
             # OS convention is to contain lists in a 'values' element,
             # so the list itself can have attributes, which is
             # unnecessary in XML
-            name = element.tag[:-1]
+            name = parent[:-1]
         elif k[-1] == 's':
-            container = etree.Element(k)
-            element.append(container)
+            container = k
             if k == 'policies':
                 # need to special-case policies since policie is not a word
                 name = 'policy'
@@ -258,75 +419,49 @@ class XmlSerializer(object):
         else:
             name = k
 
-        for item in v:
-            child = etree.Element(name)
-            self.populate_element(child, item)
-            container.append(child)
-
-    def _populate_dict(self, element, k, v):
-        """Populates an element with a key & dictionary value."""
-        if k == 'links':
-            # links is a special dict
-            self._populate_links(element, v)
+        if container is None:
+            for item in v:
+                self._write_element(name, item, out, depth)
         else:
-            child = etree.Element(k)
-            self.populate_element(child, v)
-            element.append(child)
-
-    def _populate_bool(self, element, k, v):
-        """Populates an element with a key & boolean value."""
-        # booleans are 'true' and 'false'
-        element.set(k, unicode(v).lower())
-
-    def _populate_str(self, element, k, v):
-        """Populates an element with a key & string value."""
-        if k in ['description']:
-            # always becomes an element
-            child = etree.Element(k)
-            child.text = unicode(v)
-            element.append(child)
-        else:
-            # add attributes to the current element
-            element.set(k, unicode(v))
-
-    def _populate_number(self, element, k, v):
-        """Populates an element with a key & numeric value."""
-        # numbers can be handled as strings
-        self._populate_str(element, k, v)
-
-    def populate_element(self, element, value):
-        """Populates an etree with the given value."""
-        if isinstance(value, list):
-            self._populate_sequence(element, value)
-        elif isinstance(value, dict):
-            self._populate_tree(element, value)
-        elif isinstance(value, basestring):
-            element.text = unicode(value)
-
-    def _populate_sequence(self, element, l):
-        """Populates an etree with a sequence of elements, given a list."""
-        # xsd compliance: child elements are singular: <users> has <user>s
-        name = element.tag
-        if element.tag[-1] == 's':
-            name = element.tag[:-1]
-            if name == 'policie':
-                name = 'policy'
+            items = [functools.partial(self._write_element, name, item)
+                     for item in v]
+            self._write(out, container, [], None, items, depth)
+
+
+def _is_sequence(value):
+    return type(value) is list or isinstance(value, (list,
+                                                     collections.Iterator))
+
+
+def _primitive(value):
+    """Reduces a value to the types understood by the serializer.
+
+    Anything other than the JSON-native types is converted exactly as it
+    would be when rendering JSON, so both content types agree.
+
+    """
+    if (value is None or _is_sequence(value) or
+            isinstance(value, (dict, basestring, bool, int, long, float))):
+        return value
+    return jsonutils.to_primitive(value)
+
+
+def _encode(s):
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+
+def _escape_text(s):
+    if ESCAPED_CHARS.search(s) is None:
+        return s
+    if INVALID_XML_CHARS.search(s):
+        raise ValueError('All strings must be XML compatible: %r' % s)
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
 
-        for item in l:
-            child = etree.Element(name)
-            self.populate_element(child, item)
-            element.append(child)
-
-    def _populate_tree(self, element, d):
-        """Populates an etree with attributes & elements, given a dict."""
-        for k, v in d.iteritems():
-            if isinstance(v, dict):
-                self._populate_dict(element, k, v)
-            elif isinstance(v, list):
-                self._populate_list(element, k, v)
-            elif isinstance(v, bool):
-                self._populate_bool(element, k, v)
-            elif isinstance(v, basestring):
-                self._populate_str(element, k, v)
-            elif type(v) in [int, float, long, complex]:
-                self._populate_number(element, k, v)
+def _escape_attribute(s):
+    if ESCAPED_CHARS.search(s) is None:
+        return s
+    return (_escape_text(s).replace('"', '&quot;').replace('\n', '&#10;')
+            .replace('\r', '&#13;').replace('\t', '&#9;'))
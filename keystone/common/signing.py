@@ -0,0 +1,277 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Signs documents in a pool of worker processes.
+
+With ``[signing] workers`` set, that many worker processes are started,
+by keystone-all before it serves requests or else by the first document a
+keystone process signs. Workers are new interpreters rather than forks, so
+they inherit neither the hub nor the listening sockets and database
+connections of the process that starts them. Each worker loads the signing
+certificate and key once, then signs the documents sent to it over a socket
+in process, instead of running ``openssl`` for each one. Documents queued
+while every worker is busy are sent to the next idle worker as a batch, so
+concurrent requests are signed in parallel. Batches and their results are
+written and read through green sockets, so however large they are, waiting
+green threads only yield to the hub.
+
+Signing in process needs the cryptography library. Without it, or with no
+workers configured, documents are signed by ``keystone.common.cms``.
+
+"""
+
+import base64
+import cPickle as pickle
+import os
+import struct
+import subprocess
+import sys
+import zlib
+
+import eventlet
+from eventlet import event
+from eventlet import greenio
+from eventlet.green import subprocess as green_subprocess
+from eventlet import patcher
+from eventlet import queue
+
+try:
+    from cryptography.hazmat import backends
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.serialization import pkcs7
+    from cryptography import x509
+except ImportError:
+    pkcs7 = None
+
+from keystone.common import cms
+from keystone.common import logging
+from keystone import config
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+POOLS = {}
+
+# batches and results are pickled, and prefixed with their length
+_FRAME = struct.Struct('!I')
+
+_socket = patcher.original('socket')
+
+
+class Signer(object):
+    """Signs CMS documents like ``keystone.common.cms.cms_sign_text``.
+
+    The documents use the same digest (``cms.DIGEST``) and leave out the same
+    certificates and attributes, so ``openssl cms -verify`` accepts either.
+    They may still differ byte for byte in how the digest algorithm is
+    encoded.
+
+    """
+
+    def __init__(self, signing_cert_file_name, signing_key_file_name):
+        backend = backends.default_backend()
+        with open(signing_cert_file_name) as f:
+            self.cert = x509.load_pem_x509_certificate(f.read(), backend)
+        with open(signing_key_file_name) as f:
+            self.key = serialization.load_pem_private_key(f.read(), None,
+                                                          backend)
+
+    def sign(self, text, outform='PEM'):
+        builder = pkcs7.PKCS7SignatureBuilder().set_data(text)
+        builder = builder.add_signer(self.cert, self.key,
+                                     getattr(hashes, cms.DIGEST.upper())())
+        der = builder.sign(serialization.Encoding.DER,
+                           [pkcs7.PKCS7Options.Binary,
+                            pkcs7.PKCS7Options.NoAttributes,
+                            pkcs7.PKCS7Options.NoCerts])
+        if outform == 'DER':
+            return der
+        encoded = base64.b64encode(der)
+        lines = [encoded[i:i + 64] for i in range(0, len(encoded), 64)]
+        return '-----BEGIN CMS-----\n%s\n-----END CMS-----\n' % (
+            '\n'.join(lines))
+
+
+def _send(sock, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_FRAME.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def _recv(sock):
+    size, = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def _work(conn, signing_cert_file_name, signing_key_file_name):
+    """Sign each batch of (text, outform) received on conn until None."""
+    signer = Signer(signing_cert_file_name, signing_key_file_name)
+    while True:
+        batch = _recv(conn)
+        if batch is None:
+            break
+        results = []
+        for text, outform in batch:
+            try:
+                results.append((True, signer.sign(text, outform)))
+            except Exception as e:
+                results.append((False, str(e)))
+        _send(conn, results)
+    conn.close()
+
+
+def _main(signing_cert_file_name, signing_key_file_name):
+    """Run a worker on the socket it was started with as stdin."""
+    conn = _socket.fromfd(0, _socket.AF_UNIX, _socket.SOCK_STREAM)
+    _work(conn, signing_cert_file_name, signing_key_file_name)
+
+
+class SigningPool(object):
+    """Worker processes signing with one certificate and key."""
+
+    def __init__(self, signing_cert_file_name, signing_key_file_name,
+                 workers, batch_size=16):
+        self.signing_cert_file_name = signing_cert_file_name
+        self.signing_key_file_name = signing_key_file_name
+        self.batch_size = batch_size
+        self._pending = queue.LightQueue()
+        self._idle = queue.LightQueue()
+        self._processes = {}
+        for i in range(workers):
+            self._start_worker()
+        self._dispatcher = eventlet.spawn(self._dispatch)
+
+    def _start_worker(self):
+        # the worker blocks on its end of the pair, while this process
+        # reads and writes its own end through the hub
+        conn, child_conn = _socket.socketpair()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = green_subprocess.Popen(
+            [sys.executable, '-m', __name__,
+             self.signing_cert_file_name, self.signing_key_file_name],
+            stdin=child_conn.fileno(), close_fds=True, env=env)
+        child_conn.close()
+        conn = greenio.GreenSocket(conn)
+        self._processes[conn] = process
+        self._idle.put(conn)
+
+    def _dispatch(self):
+        while True:
+            batch = [self._pending.get()]
+            conn = self._idle.get()
+            # everything queued while waiting for a worker goes with it
+            while len(batch) < self.batch_size and self._pending.qsize():
+                batch.append(self._pending.get())
+            eventlet.spawn_n(self._run, conn, batch)
+
+    def _run(self, conn, batch):
+        try:
+            _send(conn, [(text, outform) for text, outform, waiter in batch])
+            results = _recv(conn)
+        except (EOFError, IOError, OSError) as e:
+            LOG.error(_('Signing worker failed: %s'), e)
+            process = self._processes.pop(conn)
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+            conn.close()
+            self._start_worker()
+            results = [(False, str(e))] * len(batch)
+        else:
+            self._idle.put(conn)
+
+        for (ok, value), (text, outform, waiter) in zip(results, batch):
+            if ok:
+                waiter.send(value)
+            else:
+                LOG.error(_('Signing error: %s'), value)
+                waiter.send_exception(
+                    subprocess.CalledProcessError(1, 'signing worker'))
+
+    def sign(self, text, outform='PEM'):
+        """Sign text in a worker, like ``cms.cms_sign_text``."""
+        waiter = event.Event()
+        self._pending.put((text, outform, waiter))
+        return waiter.wait()
+
+    def close(self):
+        self._dispatcher.kill()
+        for conn, process in self._processes.items():
+            try:
+                _send(conn, None)
+            except (IOError, OSError):
+                pass
+            try:
+                process.wait(1)
+            except green_subprocess.TimeoutExpired:
+                process.terminate()
+                process.wait()
+            conn.close()
+        self._processes.clear()
+
+
+def get_pool(signing_cert_file_name, signing_key_file_name):
+    """Return the pool for a certificate and key, or None to sign inline."""
+    if not CONF.signing.workers:
+        return None
+    if pkcs7 is None:
+        LOG.warning(_('The cryptography library is required to sign in '
+                      'worker processes; signing with openssl instead.'))
+        return None
+    key = (signing_cert_file_name, signing_key_file_name)
+    if key not in POOLS:
+        POOLS[key] = SigningPool(signing_cert_file_name,
+                                 signing_key_file_name,
+                                 CONF.signing.workers,
+                                 CONF.signing.worker_batch_size)
+    return POOLS[key]
+
+
+def cms_sign_text(text, signing_cert_file_name, signing_key_file_name,
+                  outform='PEM'):
+    pool = get_pool(signing_cert_file_name, signing_key_file_name)
+    if pool is None:
+        return cms.cms_sign_text(text, signing_cert_file_name,
+                                 signing_key_file_name, outform=outform)
+    return pool.sign(text, outform)
+
+
+def cms_sign_token(text, signing_cert_file_name, signing_key_file_name):
+    output = cms_sign_text(text, signing_cert_file_name,
+                           signing_key_file_name)
+    return cms.cms_to_token(output)
+
+
+def pkiz_sign(text, signing_cert_file_name, signing_key_file_name):
+    output = cms_sign_text(zlib.compress(text, 9), signing_cert_file_name,
+                           signing_key_file_name, outform='DER')
+    return cms.PKIZ_PREFIX + base64.urlsafe_b64encode(output)
+
+
+if __name__ == '__main__':
+    _main(*sys.argv[1:])
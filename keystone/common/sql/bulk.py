@@ -0,0 +1,159 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Loads identity data into the SQL backend in bulk.
+
+Used by ``keystone-manage import_legacy`` and ``import_nova_auth``. Rows are
+inserted straight into their tables, ``batch_size`` at a time in a single
+statement, with one transaction per table instead of one per row. Users'
+passwords are hashed by a pool of worker processes, since each hash is
+deliberately expensive.
+
+The loader does not check each row against existing ones; it is meant for
+importing into a freshly synced database, so callers run ``check_empty``
+first rather than failing part way through a table.
+
+"""
+
+import multiprocessing
+
+from keystone import clean
+from keystone.common import logging
+from keystone.common import sql
+from keystone.common import utils
+from keystone.contrib.ec2.backends import sql as ec2_sql
+from keystone import exception
+from keystone.identity.backends import sql as identity_sql
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _batches(iterable, size):
+    batch = []
+    for x in iterable:
+        batch.append(x)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _row(model_ref):
+    return dict((c.name, getattr(model_ref, c.name))
+                for c in model_ref.__table__.columns)
+
+
+def _user_row(user):
+    """Return the user table row for a user dict, hashing its password."""
+    user = user.copy()
+    user['name'] = clean.user_name(user['name'])
+    if user.get('password') is not None:
+        user['password'] = utils.hash_password(user['password'])
+    return _row(identity_sql.User.from_dict(user))
+
+
+class BulkLoader(sql.Base):
+    def __init__(self, batch_size=1000, workers=None):
+        self.batch_size = batch_size
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+
+    def check_empty(self):
+        """Raise Conflict unless the tables to be loaded hold no rows.
+
+        The role table is left out, since ``db_sync`` creates the member
+        role and importers reuse roles that already exist.
+
+        """
+        session = self.get_session()
+        for model in (identity_sql.Project, identity_sql.User,
+                      identity_sql.UserProjectGrant, ec2_sql.Ec2Credential):
+            if session.query(model).first() is not None:
+                table = model.__table__.name
+                raise exception.Conflict(
+                    type=table,
+                    details=_('Cannot import into a database that already '
+                              'has rows in the %s table; import into a '
+                              'freshly synced database.') % table)
+
+    def _insert(self, model, rows, name):
+        """Insert each row dict into the table of model.
+
+        :returns: the number of rows inserted
+
+        """
+        session = self.get_session()
+        table = model.__table__
+        count = 0
+        with session.begin():
+            for batch in _batches(rows, self.batch_size):
+                session.execute(table.insert(), batch)
+                count += len(batch)
+                LOG.info(_('Imported %(count)s %(name)s'),
+                         {'count': count, 'name': name})
+        return count
+
+    def create_projects(self, projects):
+        def rows():
+            for project in projects:
+                project = project.copy()
+                project['name'] = clean.project_name(project['name'])
+                yield _row(identity_sql.Project.from_dict(project))
+
+        return self._insert(identity_sql.Project, rows(), 'projects')
+
+    def create_users(self, users):
+        """Insert users, as passed to ``create_user``, in bulk."""
+        if self.workers < 2:
+            return self._insert(identity_sql.User,
+                                (_user_row(x) for x in users),
+                                'users')
+
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            # hashing a batch at a time keeps the pending users in memory
+            # bounded, whatever the size of the source
+            rows = (row
+                    for batch in _batches(users, self.batch_size)
+                    for row in pool.map(_user_row, batch))
+            return self._insert(identity_sql.User, rows, 'users')
+        finally:
+            pool.close()
+            pool.join()
+
+    def create_roles(self, roles):
+        rows = (_row(identity_sql.Role.from_dict(x)) for x in roles)
+        return self._insert(identity_sql.Role, rows, 'roles')
+
+    def create_user_project_grants(self, grants):
+        """Insert role grants from (user_id, project_id, role_ids) tuples.
+
+        Each pair of user and project must appear only once.
+
+        """
+        rows = ({'user_id': user_id,
+                 'project_id': project_id,
+                 'data': {'roles': list(role_ids)}}
+                for user_id, project_id, role_ids in grants)
+        return self._insert(identity_sql.UserProjectGrant, rows, 'grants')
+
+    def create_ec2_credentials(self, credentials):
+        rows = (_row(ec2_sql.Ec2Credential.from_dict(x))
+                for x in credentials)
+        return self._insert(ec2_sql.Ec2Credential, rows, 'EC2 credentials')
@@ -16,7 +16,9 @@
 
 """SQL backends for the various services."""
 import functools
+import time
 
+from eventlet import corolocal
 import sqlalchemy as sql
 import sqlalchemy.engine.url
 from sqlalchemy.exc import DisconnectionError
@@ -26,9 +28,11 @@ import sqlalchemy.pool
 from sqlalchemy import types as sql_types
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
+from keystone.common import instrumentation
 from keystone.common import logging
 from keystone import config
 from keystone import exception
+from keystone.openstack.common import importutils
 from keystone.openstack.common import jsonutils
 
 
@@ -37,6 +41,10 @@ CONF = config.CONF
 # maintain a single engine reference for sqlite in-memory
 GLOBAL_ENGINE = None
 
+# connections shared by the backends serving the current request; kept per
+# green thread, as threads are not always monkey patched
+_request = corolocal.local()
+
 
 ModelBase = declarative.declarative_base()
 
@@ -44,13 +52,16 @@ ModelBase = declarative.declarative_base()
 # For exporting to other modules
 Column = sql.Column
 String = sql.String
+Integer = sql.Integer
 ForeignKey = sql.ForeignKey
 DateTime = sql.DateTime
 IntegrityError = sql.exc.IntegrityError
+TimeoutError = sql.exc.TimeoutError
 NotFound = sql.orm.exc.NoResultFound
 Boolean = sql.Boolean
 Text = sql.Text
 UniqueConstraint = sql.UniqueConstraint
+or_ = sql.or_
 
 
 def initialize_decorator(init):
@@ -77,9 +88,11 @@ def initialize_decorator(init):
                             v = str(v)
                         if column.type.length and \
                                 column.type.length < len(v):
-                            #if signing.token_format == 'PKI', the id will
-                            #store it's public key which is very long.
-                            if config.CONF.signing.token_format == 'PKI' and \
+                            #if signing.token_format == 'PKI' or 'PKIZ',
+                            #the id will store it's public key which is
+                            #very long.
+                            if config.CONF.signing.token_format in (
+                                    'PKI', 'PKIZ') and \
                                     self.__tablename__ == 'token' and \
                                     k == 'id':
                                 continue
@@ -102,6 +115,45 @@ def get_global_engine():
     return GLOBAL_ENGINE
 
 
+def start_request():
+    """Share a connection between the backends serving the current request.
+
+    Until the matching :func:`end_request`, sessions returned by
+    :meth:`Base.get_session` in this green thread are bound to one
+    connection per engine, checked out of the pool when first needed,
+    instead of checking out a connection for every statement or
+    transaction. Calls may be nested, in which case the connection is kept
+    until the outermost request ends.
+
+    """
+    depth = getattr(_request, 'depth', 0)
+    if not depth:
+        _request.connections = {}
+    _request.depth = depth + 1
+
+
+def end_request():
+    """Return the connections shared by the current request to the pool."""
+    depth = getattr(_request, 'depth', 0) - 1
+    _request.depth = max(depth, 0)
+    if depth > 0:
+        return
+    connections = getattr(_request, 'connections', {})
+    _request.connections = {}
+    for connection in connections.itervalues():
+        connection.close()
+
+
+def _request_connection(engine):
+    """Return the connection to engine for the current request, if any."""
+    if not getattr(_request, 'depth', 0):
+        return None
+    connection = _request.connections.get(engine)
+    if connection is None or connection.closed or connection.invalidated:
+        connection = _request.connections[engine] = engine.connect()
+    return connection
+
+
 # Special Fields
 class JsonBlob(sql_types.TypeDecorator):
 
@@ -185,6 +237,9 @@ class MySQLPingListener(object):
     Ensures that MySQL connections checked out of the
     pool are alive.
 
+    A connection is pinged at most once every ``[sql] ping_interval``
+    seconds; checkouts in between trust the last ping.
+
     Borrowed from:
     http://groups.google.com/group/sqlalchemy/msg/a4ce563d802c929f
 
@@ -199,8 +254,12 @@ class MySQLPingListener(object):
     """
 
     def checkout(self, dbapi_con, con_record, con_proxy):
+        now = time.time()
+        if now - con_record.info.get('pinged_at', 0) < CONF.sql.ping_interval:
+            return
         try:
             dbapi_con.cursor().execute('select 1')
+            con_record.info['pinged_at'] = now
         except dbapi_con.OperationalError as e:
             if e.args[0] in (2006, 2013, 2014, 2045, 2055):
                 logging.warn(_('Got mysql server has gone away: %s'), e)
@@ -209,16 +268,137 @@ class MySQLPingListener(object):
                 raise
 
 
+class PoolStats(object):
+    """Checkouts from a connection pool, and how long they waited."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record_checkout(self, seconds, timed_out=False):
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.checkouts += 1
+        self.wait_time += seconds
+        self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def to_dict(self):
+        return {'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time}
+
+
+class MeasuredPool(object):
+    """Mixin timing each checkout from a SQLAlchemy connection pool.
+
+    Defines no ``__init__``, so that ``create_engine`` still finds the
+    arguments of the pool class it is mixed into.
+
+    """
+
+    @property
+    def stats(self):
+        if '_stats' not in self.__dict__:
+            self._stats = PoolStats()
+        return self._stats
+
+    def recreate(self):
+        # the engine replaces its pool after a disconnect
+        pool = super(MeasuredPool, self).recreate()
+        pool._stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            connection = super(MeasuredPool, self)._do_get()
+        except TimeoutError:
+            self.stats.record_checkout(time.time() - start, timed_out=True)
+            raise
+        self.stats.record_checkout(time.time() - start)
+        return connection
+
+
+_MEASURED_POOL_CLASSES = {}
+
+
+def measured_pool_class(pool_class):
+    """Return a subclass of pool_class which records checkout statistics."""
+    if pool_class not in _MEASURED_POOL_CLASSES:
+        _MEASURED_POOL_CLASSES[pool_class] = type(
+            'Measured%s' % pool_class.__name__,
+            (MeasuredPool, pool_class),
+            {'pool_class_name': pool_class.__name__})
+    return _MEASURED_POOL_CLASSES[pool_class]
+
+
+def get_pool_class(connection_dict):
+    """Return the pool class configured by ``[sql] pool_class``.
+
+    The option names a class in ``sqlalchemy.pool`` or gives the full import
+    path of one. Unset, sqlite uses a StaticPool, shared by every backend,
+    and other databases use their dialect's default pool.
+
+    """
+    name = CONF.sql.pool_class
+    if name:
+        if '.' in name:
+            return importutils.import_class(name)
+        return getattr(sqlalchemy.pool, name)
+    if 'sqlite' in connection_dict.drivername:
+        return sqlalchemy.pool.StaticPool
+    return connection_dict.get_dialect().get_pool_class(connection_dict)
+
+
+def pool_stats(engine=None):
+    """Describe the connection pool of engine, or of the global engine.
+
+    Includes the number of connections checked out of and into the pool,
+    and the overflow in use, where the pool class keeps track of them.
+
+    """
+    engine = engine or get_global_engine()
+    if engine is None:
+        return {}
+    pool = engine.pool
+    stats = {'pool_class': getattr(pool, 'pool_class_name',
+                                   type(pool).__name__)}
+    for name, method in (('size', 'size'),
+                         ('checked_out', 'checkedout'),
+                         ('checked_in', 'checkedin'),
+                         ('overflow', 'overflow')):
+        if hasattr(pool, method):
+            stats[name] = getattr(pool, method)()
+    if isinstance(pool, MeasuredPool):
+        stats.update(pool.stats.to_dict())
+    return stats
+
+
 # Backends
 class Base(object):
     _engine = None
     _sessionmaker = None
 
     def get_session(self, autocommit=True, expire_on_commit=False):
-        """Return a SQLAlchemy session."""
+        """Return a SQLAlchemy session.
+
+        While a request is being served (see :func:`start_request`), the
+        session is bound to the connection shared by the request.
+
+        """
         self._engine = self._engine or self.get_engine()
         self._sessionmaker = self._sessionmaker or self.get_sessionmaker(
             self._engine)
+        connection = _request_connection(self._engine)
+        if connection is not None:
+            return self._sessionmaker(bind=connection)
         return self._sessionmaker()
 
     def get_engine(self, allow_global_engine=True):
@@ -232,18 +412,38 @@ class Base(object):
         def new_engine():
             connection_dict = sql.engine.url.make_url(CONF.sql.connection)
 
+            pool_class = get_pool_class(connection_dict)
             engine_config = {
                 'convert_unicode': True,
                 'echo': CONF.debug and CONF.verbose,
                 'pool_recycle': CONF.sql.idle_timeout,
+                'poolclass': measured_pool_class(pool_class),
             }
 
-            if 'sqlite' in connection_dict.drivername:
-                engine_config['poolclass'] = sqlalchemy.pool.StaticPool
-            elif 'mysql' in connection_dict.drivername:
+            # unset, these are left to the defaults of the pool class; only
+            # a QueuePool can be sized
+            for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+                value = getattr(CONF.sql, option)
+                if value is None:
+                    continue
+                if issubclass(pool_class, sqlalchemy.pool.QueuePool):
+                    engine_config[option] = value
+                else:
+                    logging.warn(
+                        _('Ignoring [sql] %(option)s, which does not apply '
+                          'to a %(pool_class)s'),
+                        {'option': option,
+                         'pool_class': pool_class.__name__})
+
+            if 'mysql' in connection_dict.drivername:
                 engine_config['listeners'] = [MySQLPingListener()]
 
-            return sql.create_engine(CONF.sql.connection, **engine_config)
+            engine = sql.create_engine(CONF.sql.connection, **engine_config)
+            if CONF.instrument_backends:
+                sql.event.listen(engine,
+                                 'before_cursor_execute',
+                                 instrumentation.count_statement)
+            return engine
 
         engine = get_global_engine() or new_engine()
 
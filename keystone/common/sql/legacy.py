@@ -14,13 +14,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import re
 
 import sqlalchemy
-from sqlalchemy import exc
 
 from keystone.common import logging
-from keystone.contrib.ec2.backends import sql as ec2_sql
+from keystone.common.sql import bulk
 from keystone.identity.backends import sql as identity_sql
 from keystone import config
 
@@ -30,24 +30,6 @@ CONF = config.CONF
 DEFAULT_DOMAIN_ID = CONF.identity.default_domain_id
 
 
-def export_db(db):
-    table_names = db.table_names()
-
-    migration_data = {}
-    for table_name in table_names:
-        query = db.execute("select * from %s" % table_name)
-        table_data = []
-        for row in query.fetchall():
-            entry = {}
-            for k in row.keys():
-                entry[k] = row[k]
-            table_data.append(entry)
-
-        migration_data[table_name] = table_data
-
-    return migration_data
-
-
 def _translate_replacements(s):
     if '%' not in str(s):
         return s
@@ -55,18 +37,19 @@ def _translate_replacements(s):
 
 
 class LegacyMigration(object):
-    def __init__(self, db_string):
+    def __init__(self, db_string, batch_size=1000, workers=None):
         self.db = sqlalchemy.create_engine(db_string)
         self.identity_driver = identity_sql.Identity()
         self.identity_driver.db_sync()
-        self.ec2_driver = ec2_sql.Ec2()
-        self._data = {}
+        self.loader = bulk.BulkLoader(batch_size, workers)
         self._user_map = {}
         self._project_map = {}
         self._role_map = {}
+        # roles of each (user_id, project_id), granted together at the end
+        self._grants = collections.defaultdict(set)
 
     def migrate_all(self):
-        self._export_legacy_db()
+        self.loader.check_empty()
         self._migrate_projects()
         self._migrate_users()
         self._migrate_roles()
@@ -76,13 +59,12 @@ class LegacyMigration(object):
 
     def dump_catalog(self):
         """Generate the contents of a catalog templates file."""
-        self._export_legacy_db()
-
-        services_by_id = dict((x['id'], x) for x in self._data['services'])
+        services_by_id = dict((x['id'], x)
+                              for x in self._iter_table('services'))
         template = 'catalog.%(region)s.%(service_type)s.%(key)s = %(value)s'
 
         o = []
-        for row in self._data['endpoint_templates']:
+        for row in self._iter_table('endpoint_templates'):
             service = services_by_id[row['service_id']]
             d = {'service_type': service['type'],
                  'region': row['region']}
@@ -98,56 +80,64 @@ class LegacyMigration(object):
 
         return o
 
-    def _export_legacy_db(self):
-        self._data = export_db(self.db)
+    def _iter_table(self, table_name):
+        """Yield the rows of a legacy table as dicts, without loading all."""
+        for row in self.db.execute('select * from %s' % table_name):
+            yield dict(row.items())
 
     def _migrate_projects(self):
-        for x in self._data['tenants']:
-            # map
-            new_dict = {'description': x.get('desc', ''),
-                        'id': x.get('uid', x.get('id')),
-                        'enabled': x.get('enabled', True),
-                        'domain_id': x.get('domain_id', DEFAULT_DOMAIN_ID)}
-            new_dict['name'] = x.get('name', new_dict.get('id'))
-            # track internal ids
-            self._project_map[x.get('id')] = new_dict['id']
-            # create
-            #print 'create_project(%s, %s)' % (new_dict['id'], new_dict)
-            self.identity_driver.create_project(new_dict['id'], new_dict)
+        def projects():
+            for x in self._iter_table('tenants'):
+                # map
+                new_dict = {'description': x.get('desc', ''),
+                            'id': x.get('uid', x.get('id')),
+                            'enabled': x.get('enabled', True),
+                            'domain_id': x.get('domain_id',
+                                               DEFAULT_DOMAIN_ID)}
+                new_dict['name'] = x.get('name', new_dict.get('id'))
+                # track internal ids
+                self._project_map[x.get('id')] = new_dict['id']
+                yield new_dict
+
+        self.loader.create_projects(projects())
 
     def _migrate_users(self):
-        for x in self._data['users']:
-            # map
-            new_dict = {'email': x.get('email', ''),
-                        'password': x.get('password', None),
-                        'id': x.get('uid', x.get('id')),
-                        'enabled': x.get('enabled', True),
-                        'domain_id': x.get('domain_id', DEFAULT_DOMAIN_ID)}
-            if x.get('tenant_id'):
-                new_dict['tenant_id'] = self._project_map.get(x['tenant_id'])
-            new_dict['name'] = x.get('name', new_dict.get('id'))
-            # track internal ids
-            self._user_map[x.get('id')] = new_dict['id']
-            # create
-            #print 'create_user(%s, %s)' % (new_dict['id'], new_dict)
-            self.identity_driver.create_user(new_dict['id'], new_dict)
-            if new_dict.get('tenant_id'):
-                self.identity_driver.add_user_to_project(
-                    new_dict['tenant_id'],
-                    new_dict['id'])
+        def users():
+            for x in self._iter_table('users'):
+                # map
+                new_dict = {'email': x.get('email', ''),
+                            'password': x.get('password', None),
+                            'id': x.get('uid', x.get('id')),
+                            'enabled': x.get('enabled', True),
+                            'domain_id': x.get('domain_id',
+                                               DEFAULT_DOMAIN_ID)}
+                if x.get('tenant_id'):
+                    new_dict['tenant_id'] = self._project_map.get(
+                        x['tenant_id'])
+                new_dict['name'] = x.get('name', new_dict.get('id'))
+                # track internal ids
+                self._user_map[x.get('id')] = new_dict['id']
+                if new_dict.get('tenant_id'):
+                    self._grants[new_dict['id'], new_dict['tenant_id']].add(
+                        CONF.member_role_id)
+                yield new_dict
+
+        self.loader.create_users(users())
 
     def _migrate_roles(self):
-        for x in self._data['roles']:
-            # map
-            new_dict = {'id': x['id'],
-                        'name': x.get('name', x['id'])}
-            # track internal ids
-            self._role_map[x.get('id')] = new_dict['id']
-            # create
-            self.identity_driver.create_role(new_dict['id'], new_dict)
+        def roles():
+            for x in self._iter_table('roles'):
+                # map
+                new_dict = {'id': x['id'],
+                            'name': x.get('name', x['id'])}
+                # track internal ids
+                self._role_map[x.get('id')] = new_dict['id']
+                yield new_dict
+
+        self.loader.create_roles(roles())
 
     def _migrate_user_roles(self):
-        for x in self._data['user_roles']:
+        for x in self._iter_table('user_roles'):
             # map
             if (not x.get('user_id')
                     or not x.get('tenant_id')
@@ -156,25 +146,27 @@ class LegacyMigration(object):
             user_id = self._user_map[x['user_id']]
             tenant_id = self._project_map[x['tenant_id']]
             role_id = self._role_map[x['role_id']]
+            self._grants[user_id, tenant_id].update(
+                [CONF.member_role_id, role_id])
 
-            try:
-                self.identity_driver.add_user_to_project(tenant_id, user_id)
-            except Exception:
-                pass
-
-            self.identity_driver.add_role_to_user_and_project(
-                user_id, tenant_id, role_id)
+        self.loader.create_user_project_grants(
+            (user_id, tenant_id, roles)
+            for (user_id, tenant_id), roles in self._grants.iteritems())
 
     def _migrate_tokens(self):
         pass
 
     def _migrate_ec2(self):
-        for x in self._data['credentials']:
-            new_dict = {'user_id': x['user_id'],
-                        'tenant_id': x['tenant_id'],
-                        'access': x['key'],
-                        'secret': x['secret']}
-            try:
-                self.ec2_driver.create_credential(None, new_dict)
-            except exc.IntegrityError:
-                LOG.exception(_('Cannot migrate EC2 credential: %s') % x)
+        def credentials():
+            seen = set()
+            for x in self._iter_table('credentials'):
+                if x['key'] in seen:
+                    LOG.error(_('Cannot migrate EC2 credential: %s') % x)
+                    continue
+                seen.add(x['key'])
+                yield {'user_id': x['user_id'],
+                       'tenant_id': x['tenant_id'],
+                       'access': x['key'],
+                       'secret': x['secret']}
+
+        self.loader.create_ec2_credentials(credentials())
@@ -0,0 +1,42 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    # a key over api, category and value would exceed the 767 bytes InnoDB
+    # allows, so counters are keyed by a hash of the three instead
+    stats_table = sql.Table(
+        'stats',
+        meta,
+        sql.Column('id', sql.String(64), primary_key=True),
+        sql.Column('api', sql.String(64), nullable=False, index=True),
+        sql.Column('category', sql.String(64), nullable=False),
+        sql.Column('value', sql.String(255), nullable=False),
+        sql.Column('count', sql.Integer, nullable=False))
+    stats_table.create(migrate_engine, checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    stats_table = sql.Table('stats', meta, autoload=True)
+    stats_table.drop()
@@ -16,11 +16,12 @@
 
 """Export data from Nova database and import through Identity Service."""
 
+import collections
 import uuid
 
 from keystone import config
 from keystone.common import logging
-from keystone.contrib.ec2.backends import sql as ec2_sql
+from keystone.common.sql import bulk
 from keystone.identity.backends import sql as identity_sql
 
 
@@ -29,68 +30,83 @@ CONF = config.CONF
 DEFAULT_DOMAIN_ID = CONF.identity.default_domain_id
 
 
-def import_auth(data):
+def import_auth(data, batch_size=1000, workers=None):
     identity_api = identity_sql.Identity()
-    tenant_map = _create_projects(identity_api, data['tenants'])
-    user_map = _create_users(identity_api, data['users'])
-    _create_memberships(identity_api, data['user_tenant_list'],
+    loader = bulk.BulkLoader(batch_size, workers)
+    loader.check_empty()
+    tenant_map = _create_projects(loader, data['tenants'])
+    user_map = _create_users(loader, data['users'])
+    # roles of each (user_id, tenant_id), granted together
+    grants = collections.defaultdict(set)
+    _create_memberships(grants, data['user_tenant_list'],
                         user_map, tenant_map)
-    role_map = _create_roles(identity_api, data['roles'])
-    _assign_roles(identity_api, data['role_user_tenant_list'],
+    role_map = _create_roles(loader, identity_api, data['roles'])
+    _assign_roles(grants, data['role_user_tenant_list'],
                   role_map, user_map, tenant_map)
+    loader.create_user_project_grants(
+        (user_id, tenant_id, roles)
+        for (user_id, tenant_id), roles in grants.iteritems())
 
-    ec2_api = ec2_sql.Ec2()
     ec2_creds = data['ec2_credentials']
-    _create_ec2_creds(ec2_api, identity_api, ec2_creds, user_map)
+    _create_ec2_creds(loader, ec2_creds, user_map, grants)
 
 
 def _generate_uuid():
     return uuid.uuid4().hex
 
 
-def _create_projects(api, tenants):
+def _create_projects(loader, tenants):
     tenant_map = {}
-    for tenant in tenants:
-        tenant_dict = {
-            'id': _generate_uuid(),
-            'name': tenant['id'],
-            'domain_id': tenant.get('domain_id', DEFAULT_DOMAIN_ID),
-            'description': tenant['description'],
-            'enabled': True,
-        }
-        tenant_map[tenant['id']] = tenant_dict['id']
-        LOG.debug(_('Create tenant %s') % tenant_dict)
-        api.create_project(tenant_dict['id'], tenant_dict)
+
+    def projects():
+        for tenant in tenants:
+            tenant_dict = {
+                'id': _generate_uuid(),
+                'name': tenant['id'],
+                'domain_id': tenant.get('domain_id', DEFAULT_DOMAIN_ID),
+                'description': tenant['description'],
+                'enabled': True,
+            }
+            tenant_map[tenant['id']] = tenant_dict['id']
+            LOG.debug(_('Create tenant %s') % tenant_dict)
+            yield tenant_dict
+
+    loader.create_projects(projects())
     return tenant_map
 
 
-def _create_users(api, users):
+def _create_users(loader, users):
     user_map = {}
-    for user in users:
-        user_dict = {
-            'id': _generate_uuid(),
-            'name': user['id'],
-            'domain_id': user.get('domain_id', DEFAULT_DOMAIN_ID),
-            'email': '',
-            'password': user['password'],
-            'enabled': True,
-        }
-        user_map[user['id']] = user_dict['id']
-        LOG.debug(_('Create user %s') % user_dict)
-        api.create_user(user_dict['id'], user_dict)
+
+    def user_dicts():
+        for user in users:
+            user_dict = {
+                'id': _generate_uuid(),
+                'name': user['id'],
+                'domain_id': user.get('domain_id', DEFAULT_DOMAIN_ID),
+                'email': '',
+                'password': user['password'],
+                'enabled': True,
+            }
+            user_map[user['id']] = user_dict['id']
+            LOG.debug(_('Create user %s') % dict(user_dict, password='***'))
+            yield user_dict
+
+    loader.create_users(user_dicts())
     return user_map
 
 
-def _create_memberships(api, memberships, user_map, tenant_map):
+def _create_memberships(grants, memberships, user_map, tenant_map):
     for membership in memberships:
         user_id = user_map[membership['user_id']]
         tenant_id = tenant_map[membership['tenant_id']]
         LOG.debug(_('Add user %s to tenant %s') % (user_id, tenant_id))
-        api.add_user_to_project(tenant_id, user_id)
+        grants[user_id, tenant_id].add(CONF.member_role_id)
 
 
-def _create_roles(api, roles):
+def _create_roles(loader, api, roles):
     role_map = dict((r['name'], r['id']) for r in api.list_roles())
+    new_roles = []
     for role in roles:
         if role in role_map:
             LOG.debug(_('Ignoring existing role %s') % role)
@@ -101,30 +117,38 @@ def _create_roles(api, roles):
         }
         role_map[role] = role_dict['id']
         LOG.debug(_('Create role %s') % role_dict)
-        api.create_role(role_dict['id'], role_dict)
+        new_roles.append(role_dict)
+    loader.create_roles(new_roles)
     return role_map
 
 
-def _assign_roles(api, assignments, role_map, user_map, tenant_map):
+def _assign_roles(grants, assignments, role_map, user_map, tenant_map):
     for assignment in assignments:
         role_id = role_map[assignment['role']]
         user_id = user_map[assignment['user_id']]
         tenant_id = tenant_map[assignment['tenant_id']]
         LOG.debug(_('Assign role %s to user %s on tenant %s') %
                   (role_id, user_id, tenant_id))
-        api.add_role_to_user_and_project(user_id, tenant_id, role_id)
-
-
-def _create_ec2_creds(ec2_api, identity_api, ec2_creds, user_map):
-    for ec2_cred in ec2_creds:
-        user_id = user_map[ec2_cred['user_id']]
-        for tenant_id in identity_api.get_projects_for_user(user_id):
-            cred_dict = {
-                'access': '%s:%s' % (tenant_id, ec2_cred['access_key']),
-                'secret': ec2_cred['secret_key'],
-                'user_id': user_id,
-                'tenant_id': tenant_id,
-            }
-            LOG.debug(_('Creating ec2 cred for user %s and tenant %s') %
-                      (user_id, tenant_id))
-            ec2_api.create_credential(None, cred_dict)
+        grants[user_id, tenant_id].add(role_id)
+
+
+def _create_ec2_creds(loader, ec2_creds, user_map, grants):
+    user_tenants = collections.defaultdict(list)
+    for user_id, tenant_id in grants:
+        user_tenants[user_id].append(tenant_id)
+
+    def credentials():
+        for ec2_cred in ec2_creds:
+            user_id = user_map[ec2_cred['user_id']]
+            for tenant_id in user_tenants[user_id]:
+                cred_dict = {
+                    'access': '%s:%s' % (tenant_id, ec2_cred['access_key']),
+                    'secret': ec2_cred['secret_key'],
+                    'user_id': user_id,
+                    'tenant_id': tenant_id,
+                }
+                LOG.debug(_('Creating ec2 cred for user %s and tenant %s') %
+                          (user_id, tenant_id))
+                yield cred_dict
+
+    loader.create_ec2_credentials(credentials())
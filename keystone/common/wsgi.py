@@ -20,6 +20,7 @@
 
 """Utility methods for working with WSGI servers."""
 
+import collections
 import socket
 import sys
 
@@ -31,6 +32,8 @@ import webob.exc
 
 from keystone.common import config
 from keystone.common import logging
+from keystone.common import serializer
+from keystone.common import sql
 from keystone.common import utils
 from keystone import exception
 from keystone.openstack.common import importutils
@@ -48,6 +51,18 @@ CONTEXT_ENV = 'openstack.context'
 PARAMS_ENV = 'openstack.params'
 
 
+# Environment variable used to request responses rendered as XML
+XML_RESPONSE_ENV = 'openstack.xml_response'
+
+
+# Environment variable used to report the controller action that was routed to
+ACTION_ENV = 'openstack.action'
+
+
+# Minimum size of each chunk written for a streamed response body
+STREAM_CHUNK_SIZE = 8192
+
+
 class WritableLogger(object):
     """A thin wrapper that responds to `write` and logs."""
 
@@ -213,6 +228,7 @@ class Application(BaseApplication):
         arg_dict = req.environ['wsgiorg.routing_args'][1]
         action = arg_dict.pop('action')
         del arg_dict['controller']
+        req.environ[ACTION_ENV] = action
         LOG.debug(_('arg_dict: %s'), arg_dict)
 
         # allow middleware up the stack to provide context & params
@@ -232,21 +248,29 @@ class Application(BaseApplication):
         # NOTE(vish): make sure we have no unicode keys for py2.6.
         params = self._normalize_dict(params)
 
+        # allow middleware up the stack to ask for the result as XML
+        xml = req.environ.get(XML_RESPONSE_ENV, False)
+
+        # the SQL backends share a connection while serving the request
+        sql.start_request()
         try:
             result = method(context, **params)
         except exception.Unauthorized as e:
             LOG.warning(_("Authorization failed. %s from %s")
                         % (e, req.environ['REMOTE_ADDR']))
-            return render_exception(e)
+            return render_exception(e, xml=xml)
         except exception.Error as e:
             LOG.warning(e)
-            return render_exception(e)
+            return render_exception(e, xml=xml)
         except TypeError as e:
             LOG.exception(e)
-            return render_exception(exception.ValidationError(e))
+            return render_exception(exception.ValidationError(e), xml=xml)
         except Exception as e:
             LOG.exception(e)
-            return render_exception(exception.UnexpectedError(exception=e))
+            return render_exception(exception.UnexpectedError(exception=e),
+                                    xml=xml)
+        finally:
+            sql.end_request()
 
         if result is None:
             return render_response(status=(204, 'No Content'))
@@ -258,7 +282,18 @@ class Application(BaseApplication):
             return result
 
         response_code = self._get_response_code(req)
-        return render_response(body=result, status=response_code)
+        # rendering consumes any streamed collection up to its first chunk,
+        # and may fail as the method itself could have
+        try:
+            return render_response(body=result, status=response_code,
+                                   xml=xml)
+        except exception.Error as e:
+            LOG.warning(e)
+            return render_exception(e, xml=xml)
+        except Exception as e:
+            LOG.exception(e)
+            return render_exception(exception.UnexpectedError(exception=e),
+                                    xml=xml)
 
     def _get_response_code(self, req):
         req_method = req.environ['REQUEST_METHOD']
@@ -552,8 +587,94 @@ class ExtensionRouter(Router):
         return _factory
 
 
-def render_response(body=None, status=None, headers=None):
-    """Forms a WSGI response."""
+def _is_streamable(body):
+    """Determine whether any top-level value of a body is an iterator."""
+    if not isinstance(body, dict):
+        return False
+    return any(isinstance(value, collections.Iterator)
+               for value in body.itervalues())
+
+
+def _iterencode(body):
+    """Serialize a response body to JSON one collection member at a time.
+
+    Top-level values which are iterators are consumed lazily, so large
+    collections are never held in memory as a single string. Everything
+    else is encoded exactly as ``jsonutils.dumps`` would.
+
+    """
+    encoder = utils.SmarterEncoder(default=jsonutils.to_primitive)
+    yield '{'
+    for index, (key, value) in enumerate(body.iteritems()):
+        if index:
+            yield ', '
+        yield '%s: ' % encoder.encode(key)
+        if isinstance(value, collections.Iterator):
+            yield '['
+            for item_index, item in enumerate(value):
+                if item_index:
+                    yield ', '
+                yield encoder.encode(item)
+            yield ']'
+        else:
+            yield encoder.encode(value)
+    yield '}'
+
+
+def _buffered(app_iter, size=STREAM_CHUNK_SIZE):
+    """Coalesces the small chunks of a streamed body into larger writes."""
+    buf = []
+    buffered = 0
+    for chunk in app_iter:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf = []
+            buffered = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def _primed(app_iter):
+    """Serializes the first chunk of a streamed body before it is returned.
+
+    Errors raised while the first chunk is produced, which covers the first
+    page of a paged backend search, are raised from here, and so can still
+    be rendered as an error response. Once the status and headers have been
+    sent, an error can no longer change them: it is logged and raised again,
+    which makes the server drop the connection without terminating the
+    chunked body, so clients see an incomplete response rather than a
+    complete one that is silently truncated.
+
+    """
+    chunks = _buffered(app_iter)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return []
+
+    def stream():
+        yield first
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception:
+            LOG.exception(_('Failed to serialize a streamed response'))
+            raise
+
+    return stream()
+
+
+def render_response(body=None, status=None, headers=None, xml=False):
+    """Forms a WSGI response.
+
+    The body is serialized as JSON, or directly as XML if `xml` is set. If
+    any top-level value of `body` is an iterator, the response is emitted as
+    a chunked `app_iter` and serialized incrementally; see :func:`_primed`
+    for what happens when that fails part way.
+
+    """
     headers = headers or []
     headers.append(('Vary', 'X-Auth-Token'))
 
@@ -561,16 +682,30 @@ def render_response(body=None, status=None, headers=None):
         body = ''
         status = status or (204, 'No Content')
     else:
-        body = jsonutils.dumps(body, cls=utils.SmarterEncoder)
-        headers.append(('Content-Type', 'application/json'))
         status = status or (200, 'OK')
+        streamable = _is_streamable(body)
+        if xml:
+            headers.append(('Content-Type', 'application/xml'))
+            app_iter = serializer.to_xml_iter(body)
+        elif streamable:
+            headers.append(('Content-Type', 'application/json'))
+            app_iter = _iterencode(body)
+        else:
+            headers.append(('Content-Type', 'application/json'))
+            app_iter = [jsonutils.dumps(body, cls=utils.SmarterEncoder)]
+
+        if streamable:
+            return webob.Response(app_iter=_primed(app_iter),
+                                  status='%s %s' % status,
+                                  headerlist=headers)
+        body = ''.join(app_iter)
 
     return webob.Response(body=body,
                           status='%s %s' % status,
                           headerlist=headers)
 
 
-def render_exception(error):
+def render_exception(error, xml=False):
     """Forms a WSGI response based on the current error."""
     body = {'error': {
         'code': error.code,
@@ -579,4 +714,11 @@ def render_exception(error):
     }}
     if isinstance(error, exception.AuthPluginException):
         body['error']['identity'] = error.authentication
+    if xml:
+        try:
+            return render_response(status=(error.code, error.title),
+                                   body=body, xml=True)
+        except Exception:
+            # such as a message quoting characters XML cannot represent
+            LOG.exception(_('Failed to render error as XML'))
     return render_response(status=(error.code, error.title), body=body)
@@ -17,6 +17,7 @@
 import webob
 import webob.dec
 
+from keystone.common import instrumentation
 from keystone.common import logging
 from keystone.common import wsgi
 from keystone import config
@@ -32,7 +33,17 @@ APACHE_LOG_FORMAT = (
 
 
 class AccessLogMiddleware(wsgi.Middleware):
-    """Writes an access log to INFO."""
+    """Writes an access log to INFO.
+
+    Streamed responses have no known length up front, so their bytes are
+    counted as they are written and the entry is logged once the body has
+    been fully consumed.
+
+    If ``CONF.instrument_backends`` is set, each entry also reports the
+    number of backend calls and SQL statements the request made, and their
+    breakdown by manager method is written to DEBUG.
+
+    """
 
     @webob.dec.wsgify
     def __call__(self, request):
@@ -45,17 +56,51 @@ class AccessLogMiddleware(wsgi.Middleware):
             'status': 500,
             'content_length': '-'}
 
+        if CONF.instrument_backends:
+            instrumentation.start_request()
+
+        streaming = False
         try:
             response = request.get_response(self.application)
             data['status'] = response.status_int
-            data['content_length'] = len(response.body) or '-'
+            if response.content_length is None:
+                response.app_iter = self._counting_iter(response.app_iter,
+                                                        data)
+                streaming = True
+            else:
+                data['content_length'] = response.content_length or '-'
+        finally:
+            if not streaming:
+                self._log(data)
+        return response
+
+    def _counting_iter(self, app_iter, data):
+        """Pass through an app_iter, logging its length once exhausted."""
+        length = 0
+        try:
+            for chunk in app_iter:
+                length += len(chunk)
+                yield chunk
         finally:
-            # must be calculated *after* the application has been called
-            now = timeutils.utcnow()
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            data['content_length'] = length or '-'
+            self._log(data)
 
-            # timeutils may not return UTC, so we can't hardcode +0000
-            data['datetime'] = '%s %s' % (now.strftime(APACHE_TIME_FORMAT),
-                                          now.strftime('%z') or '+0000')
+    def _log(self, data):
+        # must be calculated *after* the application has been called
+        now = timeutils.utcnow()
 
-            LOG.info(APACHE_LOG_FORMAT % data)
-        return response
+        # timeutils may not return UTC, so we can't hardcode +0000
+        data['datetime'] = '%s %s' % (now.strftime(APACHE_TIME_FORMAT),
+                                      now.strftime('%z') or '+0000')
+
+        message = APACHE_LOG_FORMAT % data
+
+        accounting = instrumentation.end_request()
+        if accounting is not None:
+            message = '%s %s' % (message, accounting.summary())
+            for line in accounting.breakdown():
+                LOG.debug(line)
+
+        LOG.info(message)
@@ -21,7 +21,7 @@ class Ec2Credential(sql.ModelBase, sql.DictBase):
     __tablename__ = 'ec2_credential'
     access = sql.Column(sql.String(64), primary_key=True)
     secret = sql.Column(sql.String(64))
-    user_id = sql.Column(sql.String(64))
+    user_id = sql.Column(sql.String(64), index=True)
     tenant_id = sql.Column(sql.String(64))
 
     @classmethod
@@ -34,6 +34,8 @@ glance to list images needed to perform the requested task.
 
 """
 
+import copy
+import datetime
 import uuid
 
 from keystoneclient.contrib.ec2 import utils as ec2_utils
@@ -45,11 +47,20 @@ from keystone.common import utils
 from keystone.common import wsgi
 from keystone import config
 from keystone import exception
+from keystone.openstack.common import timeutils
 from keystone import token
 
 
 CONF = config.CONF
 
+# (access, tenant_id) -> (token_id, expires, authenticate response) of the
+# tokens handed out for ec2 credentials, which are reused until near expiry
+TOKENS = {}
+
+# access -> (cached until, credential) of the credentials that signed recent
+# requests, so that signature checks do not read the backend every time
+CREDENTIALS = {}
+
 
 @dependency.provider('ec2_api')
 class Manager(manager.Manager):
@@ -100,20 +111,22 @@ class Ec2Extension(wsgi.ExtensionRouter):
 @dependency.requires('catalog_api', 'ec2_api')
 class Ec2Controller(controller.V2Controller):
     def check_signature(self, creds_ref, credentials):
-        signer = ec2_utils.Ec2Signer(creds_ref['secret'])
-        signature = signer.generate(credentials)
+        signature = ec2_utils.Ec2Signer(creds_ref['secret']).generate(
+            credentials)
         if utils.auth_str_equal(credentials['signature'], signature):
             return
         # NOTE(vish): Some libraries don't use the port when signing
         #             requests, so try again without port.
-        elif ':' in credentials['signature']:
+        elif ':' in credentials.get('host', ''):
             hostname, _port = credentials['host'].split(':')
             credentials['host'] = hostname
-            signature = signer.generate(credentials)
-            if not utils.auth_str_equal(credentials.signature, signature):
+            # the signer keeps its digest state, so a fresh one is needed
+            signature = ec2_utils.Ec2Signer(creds_ref['secret']).generate(
+                credentials)
+            if not utils.auth_str_equal(credentials['signature'], signature):
                 raise exception.Unauthorized(message='Invalid EC2 signature.')
         else:
-            raise exception.Unauthorized(message='EC2 signature not supplied.')
+            raise exception.Unauthorized(message='Invalid EC2 signature.')
 
     def authenticate(self, context, credentials=None, ec2Credentials=None):
         """Validate a signed EC2 request and provide a token.
@@ -145,27 +158,32 @@ class Ec2Controller(controller.V2Controller):
         if 'access' not in credentials:
             raise exception.Unauthorized(message='EC2 signature not supplied.')
 
-        creds_ref = self._get_credentials(context,
-                                          credentials['access'])
+        creds_ref = self._get_cached_credentials(context,
+                                                 credentials['access'])
         self.check_signature(creds_ref, credentials)
 
-        # TODO(termie): don't create new tokens every time
         # TODO(termie): this is copied from TokenController.authenticate
-        token_id = uuid.uuid4().hex
         tenant_ref = self.identity_api.get_project(
             context=context,
             tenant_id=creds_ref['tenant_id'])
         user_ref = self.identity_api.get_user(
             context=context,
             user_id=creds_ref['user_id'])
+
+        # Validate that the auth info is valid and nothing is disabled
+        token.validate_auth_info(self, context, user_ref, tenant_ref)
+
+        cache_key = (creds_ref['access'], tenant_ref['id'])
+        auth_response = self._get_reusable_token(context, cache_key)
+        if auth_response is not None:
+            return auth_response
+
+        token_id = uuid.uuid4().hex
         metadata_ref = self.identity_api.get_metadata(
             context=context,
             user_id=user_ref['id'],
             tenant_id=tenant_ref['id'])
 
-        # Validate that the auth info is valid and nothing is disabled
-        token.validate_auth_info(self, context, user_ref, tenant_ref)
-
         # TODO(termie): optimize this call at some point and put it into the
         #               the return for metadata
         # fill out the roles in the metadata
@@ -190,8 +208,59 @@ class Ec2Controller(controller.V2Controller):
         # TODO(termie): i don't think the ec2 middleware currently expects a
         #               full return, but it contains a note saying that it
         #               would be better to expect a full return
-        return token.controllers.Auth.format_authenticate(
+        auth_response = token.controllers.Auth.format_authenticate(
             token_ref, roles_ref, catalog_ref)
+        self._cache_token(cache_key, token_ref, auth_response)
+        return auth_response
+
+    def _get_reusable_token(self, context, cache_key):
+        """Return the response of a token issued earlier, if still usable.
+
+        A token is reused until it is within ``[ec2] token_reuse_margin``
+        seconds of expiring, or until it is revoked.
+
+        """
+        try:
+            token_id, expires, auth_response = TOKENS[cache_key]
+        except KeyError:
+            return None
+
+        margin = datetime.timedelta(seconds=CONF.ec2.token_reuse_margin)
+        if expires is None or expires - margin <= timeutils.utcnow():
+            TOKENS.pop(cache_key, None)
+            return None
+        try:
+            # tokens are deleted when their user or project is revoked
+            self.token_api.get_token(context=context, token_id=token_id)
+        except exception.TokenNotFound:
+            TOKENS.pop(cache_key, None)
+            return None
+        return copy.deepcopy(auth_response)
+
+    def _cache_token(self, cache_key, token_ref, auth_response):
+        if not CONF.ec2.token_cache_size:
+            return
+        if len(TOKENS) >= CONF.ec2.token_cache_size:
+            now = timeutils.utcnow()
+            for key, (token_id, expires, _resp) in TOKENS.items():
+                if expires is None or expires <= now:
+                    del TOKENS[key]
+            if len(TOKENS) >= CONF.ec2.token_cache_size:
+                TOKENS.popitem()
+        TOKENS[cache_key] = (token_ref['id'], token_ref.get('expires'),
+                             copy.deepcopy(auth_response))
+
+    def _delete_cached_tokens(self, context, access):
+        """Revoke the tokens handed out for an access key."""
+        for cache_key in TOKENS.keys():
+            if cache_key[0] != access:
+                continue
+            token_id = TOKENS.pop(cache_key)[0]
+            try:
+                self.token_api.delete_token(context=context,
+                                            token_id=token_id)
+            except exception.TokenNotFound:
+                pass
 
     def create_credential(self, context, user_id, tenant_id):
         """Create a secret/access pair for use with ec2 style auth.
@@ -261,7 +330,10 @@ class Ec2Controller(controller.V2Controller):
 
         self._assert_valid_user_id(context, user_id)
         self._get_credentials(context, credential_id)
-        return self.ec2_api.delete_credential(context, credential_id)
+        ret = self.ec2_api.delete_credential(context, credential_id)
+        CREDENTIALS.pop(credential_id, None)
+        self._delete_cached_tokens(context, credential_id)
+        return ret
 
     def _get_credentials(self, context, credential_id):
         """Return credentials from an ID.
@@ -277,6 +349,40 @@ class Ec2Controller(controller.V2Controller):
             raise exception.Unauthorized(message='EC2 access key not found.')
         return creds
 
+    def _get_cached_credentials(self, context, credential_id):
+        """Return credentials from an ID, remembering them for a while.
+
+        Credentials are remembered for ``[ec2] credential_cache_ttl``
+        seconds, so ones deleted through another keystone process may still
+        be used until then.
+
+        :param context: standard context
+        :param credential_id: id of credential
+        :raises exception.Unauthorized: when credential id is invalid
+        :returns: credential: dict of ec2 credential.
+
+        """
+        now = timeutils.utcnow()
+        try:
+            cached_until, creds = CREDENTIALS[credential_id]
+            if cached_until > now:
+                return creds
+        except KeyError:
+            pass
+
+        creds = self._get_credentials(context, credential_id)
+        ttl = CONF.ec2.credential_cache_ttl
+        if ttl > 0:
+            if len(CREDENTIALS) >= CONF.ec2.credential_cache_size:
+                for key, (cached_until, _creds) in CREDENTIALS.items():
+                    if cached_until <= now:
+                        del CREDENTIALS[key]
+                if len(CREDENTIALS) >= CONF.ec2.credential_cache_size:
+                    CREDENTIALS.popitem()
+            CREDENTIALS[credential_id] = (
+                now + datetime.timedelta(seconds=ttl), creds)
+        return creds
+
     def _assert_identity(self, context, user_id):
         """Check that the provided token belongs to the user.
 
@@ -0,0 +1,272 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""On-demand profiling of live requests.
+
+Profiling is switched on through the admin API for a number of seconds
+and/or a number of requests. While it is on, ``ProfilerMiddleware`` records
+the wall clock time spent in each call stack of the requests it profiles,
+and the admin API reports the result in the collapsed-stack format
+understood by flame graph tools, with each stack rooted at its route::
+
+    GET /v2.0/tokens/{token_id};keystone.common.wsgi.__call__;... 1234
+
+Profiled requests are processed one at a time; requests arriving while
+another one is being profiled pass through untouched. When profiling is off,
+the middleware costs a single attribute check per request.
+
+The profile hook (``sys.setprofile``) belongs to the OS thread, which every
+greenthread shares. It is installed only while the profiled greenthread
+runs, and removed whenever eventlet switches away from it, so concurrent
+requests are neither slowed by the hook nor recorded. While a request is
+being profiled, every greenthread switch in the process still runs one
+Python callback.
+
+"""
+
+import sys
+import time
+
+from eventlet import greenthread
+import greenlet
+import webob
+
+from keystone.common import logging
+from keystone.common import wsgi
+from keystone import exception
+from keystone import identity
+from keystone import policy
+from keystone import token
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """Process-wide profiling switch and the profile collected so far."""
+
+    def __init__(self):
+        self.active = False
+        self.busy = False
+        self.expires = None
+        self.remaining = None
+        # {(route, frame, frame, ...): seconds}
+        self.stacks = {}
+
+    def start(self, seconds=None, requests=None):
+        """Profile for the given number of seconds and/or requests."""
+        self.expires = time.time() + seconds if seconds else None
+        self.remaining = requests or None
+        self.stacks = {}
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        self.expires = None
+        self.remaining = None
+
+    def acquire(self):
+        """Claim the right to profile the next request, if possible."""
+        if self.expires is not None and time.time() >= self.expires:
+            self.stop()
+        if not self.active or self.busy:
+            return False
+        if self.remaining is not None:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.stop()
+        self.busy = True
+        return True
+
+    def release(self, route, stacks):
+        self.busy = False
+        for stack, elapsed in stacks.iteritems():
+            key = (route,) + stack
+            self.stacks[key] = self.stacks.get(key, 0.0) + elapsed
+
+    def collapsed(self):
+        """Render the profile as collapsed stacks, in microseconds."""
+        lines = []
+        for stack in sorted(self.stacks):
+            microseconds = int(self.stacks[stack] * 1000000)
+            if microseconds:
+                lines.append('%s %d' % (';'.join(stack), microseconds))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+PROFILER = Profiler()
+
+
+def _frame_label(frame):
+    return '%s.%s' % (frame.f_globals.get('__name__', '?'),
+                      frame.f_code.co_name)
+
+
+def _builtin_label(function):
+    module = getattr(function, '__module__', None) or '__builtin__'
+    return '%s.%s' % (module, getattr(function, '__name__', '?'))
+
+
+class RequestProfile(object):
+    """Attributes the time spent serving one request to its call stacks.
+
+    Only events from the greenthread serving the request are recorded; while
+    it is switched out, the elapsed time is charged to the frame that
+    yielded, which is how time spent waiting on I/O shows up.
+
+    """
+
+    def __init__(self):
+        self.greenthread = greenthread.getcurrent()
+        self.previous_trace = None
+        self.stack = []
+        self.stacks = {}
+        self.last = None
+
+    def __call__(self, frame, event, arg):
+        if greenthread.getcurrent() is not self.greenthread:
+            return
+        now = time.time()
+        if self.stack:
+            key = tuple(self.stack)
+            self.stacks[key] = self.stacks.get(key, 0.0) + now - self.last
+
+        if event == 'call':
+            self.stack.append(_frame_label(frame))
+        elif event == 'c_call':
+            self.stack.append(_builtin_label(arg))
+        elif self.stack:
+            # return, c_return or c_exception
+            self.stack.pop()
+        self.last = time.time()
+
+    def _switch(self, event, args):
+        """greenlet trace function, profiling only the request's greenthread.
+
+        Chains to any trace function installed before.
+
+        """
+        if event in ('switch', 'throw'):
+            origin, target = args
+            if target is self.greenthread:
+                sys.setprofile(self)
+            elif origin is self.greenthread:
+                sys.setprofile(None)
+        if self.previous_trace is not None:
+            self.previous_trace(event, args)
+
+    def run(self, function, *args):
+        self.previous_trace = greenlet.settrace(self._switch)
+        sys.setprofile(self)
+        try:
+            return function(*args)
+        finally:
+            sys.setprofile(None)
+            greenlet.settrace(self.previous_trace)
+
+
+class ProfilerMiddleware(wsgi.Middleware):
+    """Profiles requests while profiling is switched on."""
+
+    def __call__(self, environ, start_response):
+        if not PROFILER.active or not PROFILER.acquire():
+            return self.application(environ, start_response)
+
+        profile = RequestProfile()
+        try:
+            return profile.run(self._call_application, environ,
+                               start_response)
+        finally:
+            PROFILER.release(self._route(environ), profile.stacks)
+
+    def _call_application(self, environ, start_response):
+        # consume the body too, so that serialization is included
+        return list(self.application(environ, start_response))
+
+    def _route(self, environ):
+        route = environ.get('routes.route')
+        path = route.routepath if route is not None else '-'
+        return '%s %s%s' % (environ.get('REQUEST_METHOD'),
+                            environ.get('SCRIPT_NAME', ''),
+                            path)
+
+
+class ProfilerExtension(wsgi.ExtensionRouter):
+    """Switches profiling on and off and reports on collected profiles."""
+
+    def add_routes(self, mapper):
+        profiler_controller = ProfilerController()
+
+        mapper.connect(
+            '/OS-PROFILER/profile',
+            controller=profiler_controller,
+            action='start_profile',
+            conditions=dict(method=['POST']))
+        mapper.connect(
+            '/OS-PROFILER/profile',
+            controller=profiler_controller,
+            action='get_profile',
+            conditions=dict(method=['GET']))
+        mapper.connect(
+            '/OS-PROFILER/profile',
+            controller=profiler_controller,
+            action='delete_profile',
+            conditions=dict(method=['DELETE']))
+
+
+class ProfilerController(wsgi.Application):
+    def __init__(self):
+        self.identity_api = identity.Manager()
+        self.policy_api = policy.Manager()
+        self.token_api = token.Manager()
+        super(ProfilerController, self).__init__()
+
+    def start_profile(self, context, seconds=None, requests=None):
+        """Profile the next requests, discarding any previous profile.
+
+        Profiling stops after ``seconds`` have elapsed or ``requests`` have
+        been profiled, whichever comes first.
+
+        """
+        self.assert_admin(context)
+        try:
+            seconds = int(seconds or 0)
+            requests = int(requests or 0)
+        except (TypeError, ValueError):
+            seconds = requests = 0
+        if seconds < 0 or requests < 0 or not (seconds or requests):
+            raise exception.ValidationError(attribute='seconds or requests',
+                                            target='profile')
+
+        LOG.info(_('Profiling requests (seconds=%(seconds)s, '
+                   'requests=%(requests)s)') % {'seconds': seconds,
+                                                'requests': requests})
+        PROFILER.start(seconds=seconds, requests=requests)
+        return {'profile': {'seconds': seconds or None,
+                            'requests': requests or None}}
+
+    def get_profile(self, context):
+        """Report the collected profile as collapsed stacks."""
+        self.assert_admin(context)
+        return webob.Response(body=PROFILER.collapsed(),
+                              content_type='text/plain')
+
+    def delete_profile(self, context):
+        """Stop profiling and discard the collected profile."""
+        self.assert_admin(context)
+        PROFILER.stop()
+        PROFILER.stacks = {}
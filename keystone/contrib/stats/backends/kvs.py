@@ -32,3 +32,13 @@ class Stats(kvs.Base, stats.Driver):
         counter = stats[category].setdefault(value, 0)
         stats[category][value] = counter + 1
         self.set_stats(api, stats)
+
+    def increment_stats(self, api, stats_ref):
+        """Merge a batch of counters with a single read and write."""
+        current = self.get_stats(api)
+        for category, counters in stats_ref.iteritems():
+            merged = dict(current.get(category, {}))
+            for value, count in counters.iteritems():
+                merged[value] = merged.get(value, 0) + count
+            current[category] = stats.top_values(merged)
+        self.set_stats(api, current)
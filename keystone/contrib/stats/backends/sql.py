@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+
+from keystone.common import sql
+from keystone import config
+from keystone.contrib import stats
+
+
+CONF = config.CONF
+
+
+class StatsCounter(sql.ModelBase, sql.DictBase):
+    __tablename__ = 'stats'
+    id = sql.Column(sql.String(64), primary_key=True)
+    api = sql.Column(sql.String(64), nullable=False, index=True)
+    category = sql.Column(sql.String(64), nullable=False)
+    value = sql.Column(sql.String(255), nullable=False)
+    count = sql.Column(sql.Integer, nullable=False)
+
+
+def _value(value):
+    if not isinstance(value, basestring):
+        value = str(value)
+    return value[:255]
+
+
+def _counter_id(api, category, value):
+    key = u'\n'.join((api, category, value))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class Stats(sql.Base, stats.Driver):
+    def get_stats(self, api):
+        session = self.get_session()
+        query = session.query(StatsCounter).filter_by(api=api)
+        stats_ref = {}
+        for counter in query:
+            category = stats_ref.setdefault(counter.category, {})
+            category[counter.value] = counter.count
+        return stats_ref
+
+    def set_stats(self, api, stats_ref):
+        session = self.get_session()
+        with session.begin():
+            query = session.query(StatsCounter).filter_by(api=api)
+            query.delete(synchronize_session=False)
+            for category, counters in stats_ref.iteritems():
+                for value, count in counters.iteritems():
+                    value = _value(value)
+                    session.add(StatsCounter(
+                        id=_counter_id(api, category, value),
+                        api=api,
+                        category=category,
+                        value=value,
+                        count=count))
+            session.flush()
+
+    def increment_stat(self, api, category, value):
+        """Increment a statistic counter, or create it if it doesn't exist."""
+        self.increment_stats(api, {category: {value: 1}})
+
+    def increment_stats(self, api, stats_ref):
+        """Apply a batch of counters in a single transaction."""
+        session = self.get_session()
+        with session.begin():
+            for category, counters in stats_ref.iteritems():
+                query = session.query(StatsCounter)
+                query = query.filter_by(api=api, category=category)
+                merged = {}
+                for value, count in counters.iteritems():
+                    value = _value(value)
+                    merged[value] = merged.get(value, 0) + count
+                for value, count in merged.iteritems():
+                    counter_id = _counter_id(api, category, value)
+                    updated = session.query(StatsCounter).filter_by(
+                        id=counter_id).update(
+                            {'count': StatsCounter.count + count},
+                            synchronize_session=False)
+                    if not updated:
+                        session.add(StatsCounter(id=counter_id,
+                                                 api=api,
+                                                 category=category,
+                                                 value=value,
+                                                 count=count))
+                session.flush()
+
+                # keep only the most frequent values
+                query = query.order_by(StatsCounter.count.desc())
+                for counter in query.offset(CONF.stats.max_tracked_values):
+                    session.delete(counter)
+            session.flush()
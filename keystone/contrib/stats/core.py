@@ -14,8 +14,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import bisect
+import heapq
+import time
+
+import eventlet
+import webob
+
 from keystone.common import logging
 from keystone.common import manager
+from keystone.common import sql
 from keystone.common import wsgi
 from keystone import config
 from keystone import exception
@@ -27,6 +35,12 @@ from keystone import token
 CONF = config.CONF
 LOG = logging.getLogger(__name__)
 
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+_START_TIME_ENV = 'openstack.stats.start_time'
+
 
 class Manager(manager.Manager):
     """Default pivot point for the Stats backend.
@@ -55,6 +69,153 @@ class Driver(object):
         """Increment the counter for an individual statistic."""
         raise exception.NotImplemented()
 
+    def increment_stats(self, api, stats_ref):
+        """Add a batch of counters to the statistics for an interface.
+
+        :param stats_ref: nested dict of {category: {value: count}}
+
+        Implementations should keep no more than
+        ``CONF.stats.max_tracked_values`` of the most frequent values per
+        category.
+
+        """
+        raise exception.NotImplemented()
+
+
+def top_values(counters, limit=None):
+    """Return only the ``limit`` most frequent values of a category."""
+    if limit is None:
+        limit = CONF.stats.max_tracked_values
+    if len(counters) <= limit:
+        return counters
+    return dict(heapq.nlargest(limit,
+                               counters.iteritems(),
+                               key=lambda x: x[1]))
+
+
+class StatsAggregator(object):
+    """Accumulates counters in memory between flushes to the backend.
+
+    Each category tracks at most ``max_values`` distinct values (by default
+    ``CONF.stats.max_tracked_values``). Once a
+    category is full, its least frequent value is evicted and the newcomer
+    inherits that count plus one (the "space saving" algorithm), so the
+    busiest paths and addresses survive while memory stays bounded no matter
+    how many distinct values clients send.
+
+    Increments never yield to the eventlet hub, so no locking is required;
+    ``drain`` swaps in an empty set of counters and returns the old one.
+
+    """
+
+    def __init__(self, max_values=None):
+        self.max_values = max_values
+        self.counters = {}
+
+    def increment(self, api, category, value):
+        max_values = self.max_values
+        if max_values is None:
+            max_values = CONF.stats.max_tracked_values
+        counters = self.counters.setdefault(api, {}).setdefault(category, {})
+        if value in counters:
+            counters[value] += 1
+        elif len(counters) < max_values:
+            counters[value] = 1
+        else:
+            evicted = min(counters, key=counters.get)
+            counters[value] = counters.pop(evicted) + 1
+
+    def drain(self):
+        """Return the counters collected so far and start afresh."""
+        counters, self.counters = self.counters, {}
+        return counters
+
+
+class LatencyHistogram(object):
+    """Counts observed latencies into fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Yield (upper bound, observations at or below it) pairs."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class LatencyMetrics(object):
+    """Latency histograms of this process, rendered for scraping.
+
+    Each metric is a family of histograms keyed by a tuple of label
+    name/value pairs, such as the API and the controller action.
+
+    """
+
+    descriptions = {
+        'keystone_action_latency_seconds': (
+            'Request latency by API and controller action.'),
+        'keystone_status_latency_seconds': (
+            'Request latency by API and response status class.'),
+    }
+
+    def __init__(self):
+        self.histograms = {}
+
+    def observe(self, name, labels, seconds):
+        family = self.histograms.setdefault(name, {})
+        histogram = family.get(labels)
+        if histogram is None:
+            histogram = family[labels] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def reset(self):
+        self.histograms = {}
+
+    def render(self):
+        """Render every histogram in the Prometheus text format."""
+        lines = []
+        for name in sorted(self.histograms):
+            description = self.descriptions.get(name, '')
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s histogram' % name)
+            family = self.histograms[name]
+            for labels in sorted(family):
+                histogram = family[labels]
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('%s_bucket%s %d' % (
+                        name,
+                        _format_labels(labels + (('le', bound),)),
+                        count))
+                lines.append('%s_sum%s %r' % (
+                    name, _format_labels(labels), histogram.sum))
+                lines.append('%s_count%s %d' % (
+                    name, _format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return value.replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape_label(v))
+                             for k, v in labels)
+
+
+METRICS = LatencyMetrics()
+AGGREGATOR = StatsAggregator()
+
 
 class StatsExtension(wsgi.ExtensionRouter):
     """Reports on previously-collected request/response statistics."""
@@ -72,6 +233,11 @@ class StatsExtension(wsgi.ExtensionRouter):
             controller=stats_controller,
             action='reset_stats',
             conditions=dict(method=['DELETE']))
+        mapper.connect(
+            '/OS-STATS/metrics',
+            controller=stats_controller,
+            action='get_metrics',
+            conditions=dict(method=['GET']))
 
 
 class StatsController(wsgi.Application):
@@ -84,29 +250,56 @@ class StatsController(wsgi.Application):
 
     def get_stats(self, context):
         self.assert_admin(context)
-        return {
-            'OS-STATS:stats': [
-                {
-                    'type': 'identity',
-                    'api': 'admin',
-                    'extra': self.stats_api.get_stats(context, 'admin'),
-                },
-                {
-                    'type': 'identity',
-                    'api': 'public',
-                    'extra': self.stats_api.get_stats(context, 'public'),
-                },
-            ]
-        }
+        stats = [
+            {
+                'type': 'identity',
+                'api': 'admin',
+                'extra': self.stats_api.get_stats(context, 'admin'),
+            },
+            {
+                'type': 'identity',
+                'api': 'public',
+                'extra': self.stats_api.get_stats(context, 'public'),
+            },
+        ]
+
+        # the connection pool of this process, if it uses a SQL backend
+        pool_stats = sql.pool_stats()
+        if pool_stats:
+            stats.append({
+                'type': 'sql',
+                'api': 'pool',
+                'extra': pool_stats,
+            })
+        return {'OS-STATS:stats': stats}
 
     def reset_stats(self, context):
         self.assert_admin(context)
         self.stats_api.set_stats(context, 'public', dict())
         self.stats_api.set_stats(context, 'admin', dict())
+        # discard counters not yet flushed, or they would reappear later
+        AGGREGATOR.drain()
+        METRICS.reset()
+        engine = sql.get_global_engine()
+        if engine is not None and isinstance(engine.pool, sql.MeasuredPool):
+            engine.pool.stats.reset()
+
+    def get_metrics(self, context):
+        """Report this process' latency histograms as plain text."""
+        self.assert_admin(context)
+        return webob.Response(body=METRICS.render(),
+                              content_type='text/plain; version=0.0.4')
 
 
 class StatsMiddleware(wsgi.Middleware):
-    """Monitors various request/response attribute statistics."""
+    """Monitors various request/response attribute statistics.
+
+    Counters are aggregated in memory by ``AGGREGATOR`` and written to the
+    backend at most once every ``CONF.stats.flush_interval`` seconds, from a
+    greenthread of their own so that no request waits on the write. Request
+    latency is recorded in the per-process histograms of ``METRICS``.
+
+    """
 
     request_attributes = ['application_url',
                           'method',
@@ -118,6 +311,9 @@ class StatsMiddleware(wsgi.Middleware):
 
     def __init__(self, *args, **kwargs):
         self.stats_api = Manager()
+        self.aggregator = AGGREGATOR
+        self.last_flush = time.time()
+        self._flusher = None
         return super(StatsMiddleware, self).__init__(*args, **kwargs)
 
     def _resolve_api(self, host):
@@ -133,17 +329,53 @@ class StatsMiddleware(wsgi.Middleware):
 
     def capture_stats(self, host, obj, attributes):
         """Collect each attribute from the given object."""
+        api = self._resolve_api(host)
         for attribute in attributes:
-            self.stats_api.increment_stat(None,
-                                          self._resolve_api(host),
-                                          attribute,
-                                          getattr(obj, attribute))
+            self.aggregator.increment(api, attribute, getattr(obj, attribute))
+
+    def flush(self):
+        """Write the aggregated counters to the backend."""
+        self.last_flush = time.time()
+        for api, stats_ref in self.aggregator.drain().iteritems():
+            self.stats_api.increment_stats(None, api, stats_ref)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            LOG.exception(_('Failed to flush request statistics'))
+        finally:
+            self._flusher = None
 
     def process_request(self, request):
         """Monitor incoming request attributes."""
+        request.environ[_START_TIME_ENV] = time.time()
         self.capture_stats(request.host, request, self.request_attributes)
 
+    def capture_latency(self, host, request, response):
+        """Record how long the request took by action and status class."""
+        start = request.environ.get(_START_TIME_ENV)
+        if start is None:
+            return
+        elapsed = time.time() - start
+        api = self._resolve_api(host)
+
+        action = request.environ.get(wsgi.ACTION_ENV)
+        if action is not None:
+            METRICS.observe('keystone_action_latency_seconds',
+                            (('api', api), ('action', action)),
+                            elapsed)
+        METRICS.observe('keystone_status_latency_seconds',
+                        (('api', api),
+                         ('status', '%dxx' % (response.status_int // 100))),
+                        elapsed)
+
     def process_response(self, request, response):
         """Monitor outgoing response attributes."""
         self.capture_stats(request.host, response, self.response_attributes)
+        self.capture_latency(request.host, request, response)
+        if (self._flusher is None and
+                time.time() - self.last_flush >= CONF.stats.flush_interval):
+            self.last_flush = time.time()
+            self._flusher = eventlet.spawn(self._flush_in_background)
         return response
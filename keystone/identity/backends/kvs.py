@@ -22,6 +22,13 @@ from keystone import identity
 
 
 class Identity(kvs.Base, identity.Driver):
+    def __init__(self, db=None):
+        super(Identity, self).__init__(db)
+        self.db.add_index('user_tenant', 'user-',
+                          lambda ref: ref.get('tenants', []))
+        self.db.add_index('user_group', 'user-',
+                          lambda ref: ref.get('groups', []))
+
     # Public interface
     def authenticate(self, user_id=None, tenant_id=None, password=None):
         """Authenticate based on a user, tenant and password.
@@ -76,9 +83,8 @@ class Identity(kvs.Base, identity.Driver):
 
     def get_project_users(self, tenant_id):
         self.get_project(tenant_id)
-        user_keys = filter(lambda x: x.startswith("user-"), self.db.keys())
+        user_keys = self.db.lookup('user_tenant', tenant_id)
         user_refs = [self.db.get(key) for key in user_keys]
-        user_refs = filter(lambda x: tenant_id in x['tenants'], user_refs)
         return [identity.filter_user(user_ref) for user_ref in user_refs]
 
     def _get_user(self, user_id):
@@ -265,11 +271,9 @@ class Identity(kvs.Base, identity.Driver):
 
     def list_users_in_group(self, group_id):
         self.get_group(group_id)
-        user_keys = filter(lambda x: x.startswith("user-"), self.db.keys())
+        user_keys = self.db.lookup('user_group', group_id)
         user_refs = [self.db.get(key) for key in user_keys]
-        user_refs_for_group = filter(lambda x: group_id in x['groups'],
-                                     user_refs)
-        return [identity.filter_user(x) for x in user_refs_for_group]
+        return [identity.filter_user(x) for x in user_refs]
 
     def list_groups_for_user(self, user_id):
         user_ref = self._get_user(user_id)
@@ -582,6 +586,25 @@ class Identity(kvs.Base, identity.Driver):
         domain_list.remove(domain_id)
         self.db.set('domain_list', list(domain_list))
 
+    def delete_domain_contents(self, domain_id):
+        projects = [x for x in self.list_projects()
+                    if x['domain_id'] == domain_id]
+        groups = [x for x in self.list_groups()
+                  if x['domain_id'] == domain_id]
+        users = [x for x in self.list_users()
+                 if x['domain_id'] == domain_id]
+
+        user_ids = set(x['id'] for x in users)
+        for project in projects:
+            self.delete_project(project['id'])
+        for group in groups:
+            user_ids.update(x['id'] for x in
+                            self.list_users_in_group(group['id']))
+            self.delete_group(group['id'])
+        for user in users:
+            self.delete_user(user['id'])
+        return list(user_ids)
+
     # group crud
 
     def create_group(self, group_id, group):
@@ -645,14 +668,13 @@ class Identity(kvs.Base, identity.Driver):
             group = self.db.get('group-%s' % group_id)
         except exception.NotFound:
             raise exception.GroupNotFound(group_id=group_id)
-        # Delete any entries in the group lists of all users
-        user_keys = filter(lambda x: x.startswith("user-"), self.db.keys())
+        # Delete any entries in the group lists of its members
+        user_keys = self.db.lookup('user_group', group_id)
         user_refs = [self.db.get(key) for key in user_keys]
         for user_ref in user_refs:
             groups = set(user_ref.get('groups', []))
-            if group_id in groups:
-                groups.remove(group_id)
-                self.update_user(user_ref['id'], {'groups': list(groups)})
+            groups.remove(group_id)
+            self.update_user(user_ref['id'], {'groups': list(groups)})
 
         # Now delete the group itself
         self.db.delete('group-%s' % group_id)
@@ -660,3 +682,28 @@ class Identity(kvs.Base, identity.Driver):
         group_list = set(self.db.get('group_list', []))
         group_list.remove(group_id)
         self.db.set('group_list', list(group_list))
+
+    # batch operations
+
+    def create_users(self, users):
+        return self._apply_each(lambda x: self.create_user(x['id'], x),
+                                users)
+
+    def update_users(self, users):
+        return self._apply_each(lambda x: self.update_user(x['id'], x),
+                                users)
+
+    def create_projects(self, projects):
+        return self._apply_each(lambda x: self.create_project(x['id'], x),
+                                projects)
+
+    def update_projects(self, projects):
+        return self._apply_each(lambda x: self.update_project(x['id'], x),
+                                projects)
+
+    def create_grants(self, grants):
+        def create_grant(grant):
+            self.create_grant(**grant)
+            return grant
+
+        return self._apply_each(create_grant, grants)
@@ -66,33 +66,44 @@ class Identity(identity.Driver):
         tenant_ref = None
         metadata_ref = {}
 
+        # look up the user, project and roles at once
+        user_searches = self.user.get_searches(user_id)
+        searches = list(user_searches)
+        if tenant_id is not None:
+            searches += self.project.get_searches(tenant_id)
+            searches.append(self.role.project_roles_search(user_id,
+                                                           tenant_id))
+        results = self.user.get_connection().search_many(searches)
+        user_results = results[:len(user_searches)]
+        del results[:len(user_searches)]
+
         try:
-            user_ref = self._get_user(user_id)
+            user_ref = self.user.get_from_results(user_id, user_results)
         except exception.UserNotFound:
             raise AssertionError('Invalid user / password')
 
+        # an empty password would make an anonymous bind, which succeeds
+        if not password:
+            raise AssertionError('Invalid user / password')
         try:
-            conn = self.user.get_connection(self.user._id_to_dn(user_id),
-                                            password)
-            if not conn:
-                raise AssertionError('Invalid user / password')
+            self.user.bind_as(self.user._id_to_dn(user_id), password)
         except Exception:
             raise AssertionError('Invalid user / password')
 
         if tenant_id is not None:
-            if tenant_id not in self.get_projects_for_user(user_id):
+            role_results = results.pop()
+            # the user has access to the projects they have a role on
+            if not role_results:
                 raise AssertionError('Invalid tenant')
 
             try:
-                tenant_ref = self.get_project(tenant_id)
-                # TODO(termie): this should probably be made into a
-                #               get roles call
-                metadata_ref = self.get_metadata(user_id, tenant_id)
+                tenant_ref = self.project.get_from_results(tenant_id,
+                                                           results)
             except exception.ProjectNotFound:
                 tenant_ref = None
-                metadata_ref = {}
-            except exception.MetadataNotFound:
-                metadata_ref = {}
+            else:
+                metadata_ref = {'roles': [self.role._dn_to_id(dn)
+                                          for dn, attrs in role_results]}
 
         return (identity.filter_user(user_ref), tenant_ref, metadata_ref)
 
@@ -293,6 +304,49 @@ class Identity(identity.Driver):
     def list_domains(self):
         return self.domain.get_all()
 
+    def delete_domain_contents(self, domain_id):
+        # one search per type finds everything the domain owns; LDAP has no
+        # bulk delete, so each entry is still removed on its own
+        projects = self.project.get_all_by_domain(domain_id)
+        groups = self.group.get_all_by_domain(domain_id)
+        users = self.user.get_all_by_domain(domain_id)
+
+        user_ids = set(x['id'] for x in users)
+        for project in projects:
+            self.project.delete(project['id'])
+        for group in groups:
+            user_ids.update(x['id'] for x in
+                            self.group.list_group_users(group['id']))
+            self.group.delete(group['id'])
+        for user_id in user_ids.intersection(x['id'] for x in users):
+            self.user.delete(user_id)
+        return list(user_ids)
+
+    # batch operations
+
+    def create_users(self, users):
+        return self._apply_each(lambda x: self.create_user(x['id'], x),
+                                users)
+
+    def update_users(self, users):
+        return self._apply_each(lambda x: self.update_user(x['id'], x),
+                                users)
+
+    def create_projects(self, projects):
+        return self._apply_each(lambda x: self.create_project(x['id'], x),
+                                projects)
+
+    def update_projects(self, projects):
+        return self._apply_each(lambda x: self.update_project(x['id'], x),
+                                projects)
+
+    def create_grants(self, grants):
+        def create_grant(grant):
+            self.create_grant(**grant)
+            return grant
+
+        return self._apply_each(create_grant, grants)
+
 
 # TODO(termie): remove this and move cross-api calls into driver
 class ApiShim(object):
@@ -508,15 +562,7 @@ class ProjectApi(common_ldap.EnabledEmuMixIn, common_ldap.BaseLdap,
         """Returns list of tenants a user has access to
         """
         associations = self.role_api.list_project_roles_for_user(user_id)
-        project_ids = set()
-        for assoc in associations:
-            project_ids.add(assoc.project_id)
-        projects = []
-        for project_id in project_ids:
-            #slower to get them one at a time, but a huge list could blow out
-            #the connection.  This is the safer way
-            projects.append(self.get(project_id))
-        return projects
+        return self.get_all_by_ids(assoc.project_id for assoc in associations)
 
     def get_role_assignments(self, tenant_id):
         return self.role_api.get_role_assignments(tenant_id)
@@ -547,20 +593,20 @@ class ProjectApi(common_ldap.EnabledEmuMixIn, common_ldap.BaseLdap,
 
     def get_users(self, tenant_id, role_id=None):
         tenant = self._ldap_get(tenant_id)
-        res = set()
+        user_ids = set()
         if not role_id:
             # Get users who have default tenant mapping
             for user_dn in tenant[1].get(self.member_attribute, []):
                 if self.use_dumb_member and user_dn == self.dumb_member:
                     continue
-                res.add(self.user_api.get(self.user_api._dn_to_id(user_dn)))
+                user_ids.add(self.user_api._dn_to_id(user_dn))
 
         # Get users who are explicitly mapped via a tenant
         rolegrants = self.role_api.get_role_assignments(tenant_id)
         for rolegrant in rolegrants:
             if role_id is None or rolegrant.role_id == role_id:
-                res.add(self.user_api.get(rolegrant.user_id))
-        return list(res)
+                user_ids.add(rolegrant.user_id)
+        return self.user_api.get_all_by_ids(user_ids)
 
     def delete(self, id):
         if self.subtree_delete_enabled:
@@ -725,16 +771,26 @@ class RoleApi(common_ldap.BaseLdap, ApiShimMixin):
                 role_id=role.id,
                 user_id=user_id) for role in roles]
 
+    def _user_roles_query(self, user_id):
+        return '(&(objectClass=%s)(%s=%s))' % (
+            self.object_class,
+            self.member_attribute,
+            self.user_api._id_to_dn(user_id))
+
+    def project_roles_search(self, user_id, tenant_id):
+        """Return the search for a user's roles on a project."""
+        return (self.project_api._id_to_dn(tenant_id),
+                ldap.SCOPE_ONELEVEL,
+                self._user_roles_query(user_id),
+                None)
+
     def list_project_roles_for_user(self, user_id, tenant_id=None):
         conn = self.get_connection()
-        user_dn = self.user_api._id_to_dn(user_id)
-        query = '(&(objectClass=%s)(%s=%s))' % (self.object_class,
-                                                self.member_attribute,
-                                                user_dn)
+        query = self._user_roles_query(user_id)
         if tenant_id is not None:
-            tenant_dn = self.project_api._id_to_dn(tenant_id)
             try:
-                roles = conn.search_s(tenant_dn, ldap.SCOPE_ONELEVEL, query)
+                roles = conn.search_s(
+                    *self.project_roles_search(user_id, tenant_id))
             except ldap.NO_SUCH_OBJECT:
                 return []
 
@@ -916,15 +972,14 @@ class GroupApi(common_ldap.BaseLdap, ApiShimMixin):
                                   query, ['%s' % self.member_attribute])
         except ldap.NO_SUCH_OBJECT:
             return []
-        users = []
+        user_ids = []
         for dn, member in attrs:
             user_dns = member[self.member_attribute]
             for user_dn in user_dns:
                 if self.use_dumb_member and user_dn == self.dumb_member:
                     continue
-                user_id = self.user_api._dn_to_id(user_dn)
-                users.append(self.user_api.get(user_id))
-        return users
+                user_ids.append(self.user_api._dn_to_id(user_dn))
+        return self.user_api.get_all_by_ids(user_ids)
 
 
 class DomainApi(common_ldap.EnabledEmuMixIn, common_ldap.BaseLdap,
@@ -22,6 +22,10 @@ from keystone import exception
 from keystone import identity
 
 
+# ids in each IN clause, to keep within the database's limits
+QUERY_CHUNK_SIZE = 500
+
+
 class User(sql.ModelBase, sql.DictBase):
     __tablename__ = 'user'
     attributes = ['id', 'name', 'domain_id', 'password', 'enabled']
@@ -138,6 +142,12 @@ class GroupDomainGrant(sql.ModelBase, BaseGrant):
     data = sql.Column(sql.JsonBlob())
 
 
+GRANT_MODELS = {('user_id', 'project_id'): UserProjectGrant,
+                ('user_id', 'domain_id'): UserDomainGrant,
+                ('group_id', 'project_id'): GroupProjectGrant,
+                ('group_id', 'domain_id'): GroupDomainGrant}
+
+
 class UserGroupMembership(sql.ModelBase, sql.DictBase):
     """Group membership join table."""
     __tablename__ = 'user_group_membership'
@@ -149,6 +159,25 @@ class UserGroupMembership(sql.ModelBase, sql.DictBase):
                           primary_key=True)
 
 
+def _update_ref(ref, values):
+    """Apply a dict of new values to a user or project model ref."""
+    model = ref.__class__
+    old_dict = ref.to_dict()
+    for k in values:
+        old_dict[k] = values[k]
+    new_ref = model.from_dict(old_dict)
+    for attr in model.attributes:
+        if attr != 'id':
+            setattr(ref, attr, getattr(new_ref, attr))
+    ref.extra = new_ref.extra
+
+
+def _fill(results, values):
+    """Replace each None in results with the next of values."""
+    values = iter(values)
+    return [values.next() if x is None else x for x in results]
+
+
 class Identity(sql.Base, identity.Driver):
     # Internal interface to manage the database
     def db_sync(self):
@@ -462,14 +491,7 @@ class Identity(sql.Base, identity.Driver):
             raise exception.ProjectNotFound(project_id=tenant_id)
 
         with session.begin():
-            old_project_dict = tenant_ref.to_dict()
-            for k in tenant:
-                old_project_dict[k] = tenant[k]
-            new_project = Project.from_dict(old_project_dict)
-            for attr in Project.attributes:
-                if attr != 'id':
-                    setattr(tenant_ref, attr, getattr(new_project, attr))
-            tenant_ref.extra = new_project.extra
+            _update_ref(tenant_ref, tenant)
             session.flush()
         return tenant_ref.to_dict(include_extra_dict=True)
 
@@ -617,6 +639,53 @@ class Identity(sql.Base, identity.Driver):
             session.delete(ref)
             session.flush()
 
+    def delete_domain_contents(self, domain_id):
+        session = self.get_session()
+        users = session.query(User.id).filter_by(domain_id=domain_id)
+        groups = session.query(Group.id).filter_by(domain_id=domain_id)
+        groups = groups.subquery()
+        projects = session.query(Project.id).filter_by(domain_id=domain_id)
+        projects = projects.subquery()
+        members = session.query(UserGroupMembership.user_id)
+        members = members.filter(UserGroupMembership.group_id.in_(groups))
+        user_ids = [x[0] for x in users.union(members)]
+        users = users.subquery()
+
+        # each statement removes every matching row at once
+        with session.begin():
+            q = session.query(Credential)
+            q = q.filter(sql.or_(Credential.user_id.in_(users),
+                                 Credential.project_id.in_(projects)))
+            q.delete(synchronize_session=False)
+
+            q = session.query(UserProjectGrant)
+            q = q.filter(sql.or_(UserProjectGrant.user_id.in_(users),
+                                 UserProjectGrant.project_id.in_(projects)))
+            q.delete(synchronize_session=False)
+
+            q = session.query(GroupProjectGrant)
+            q = q.filter(sql.or_(GroupProjectGrant.group_id.in_(groups),
+                                 GroupProjectGrant.project_id.in_(projects)))
+            q.delete(synchronize_session=False)
+
+            q = session.query(UserDomainGrant)
+            q = q.filter(UserDomainGrant.user_id.in_(users))
+            q.delete(synchronize_session=False)
+
+            q = session.query(GroupDomainGrant)
+            q = q.filter(GroupDomainGrant.group_id.in_(groups))
+            q.delete(synchronize_session=False)
+
+            q = session.query(UserGroupMembership)
+            q = q.filter(sql.or_(UserGroupMembership.user_id.in_(users),
+                                 UserGroupMembership.group_id.in_(groups)))
+            q.delete(synchronize_session=False)
+
+            for model in (Project, Group, User):
+                q = session.query(model).filter_by(domain_id=domain_id)
+                q.delete(synchronize_session=False)
+        return user_ids
+
     def list_user_projects(self, user_id):
         session = self.get_session()
         user = self.get_user(user_id)
@@ -689,15 +758,7 @@ class Identity(sql.Base, identity.Driver):
             user_ref = session.query(User).filter_by(id=user_id).first()
             if user_ref is None:
                 raise exception.UserNotFound(user_id=user_id)
-            old_user_dict = user_ref.to_dict()
-            user = utils.hash_user_password(user)
-            for k in user:
-                old_user_dict[k] = user[k]
-            new_user = User.from_dict(old_user_dict)
-            for attr in User.attributes:
-                if attr != 'id':
-                    setattr(user_ref, attr, getattr(new_user, attr))
-            user_ref.extra = new_user.extra
+            _update_ref(user_ref, utils.hash_user_password(user))
             session.flush()
         return identity.filter_user(user_ref.to_dict(include_extra_dict=True))
 
@@ -990,3 +1051,169 @@ class Identity(sql.Base, identity.Driver):
 
             session.delete(ref)
             session.flush()
+
+    # batch operations
+
+    def _get_all_by_id(self, session, model, ids):
+        """Return a dict of the model refs with the given ids, by id."""
+        ids = list(set(ids))
+        refs = {}
+        for i in range(0, len(ids), QUERY_CHUNK_SIZE):
+            query = session.query(model)
+            query = query.filter(model.id.in_(ids[i:i + QUERY_CHUNK_SIZE]))
+            for ref in query:
+                refs[ref.id] = ref
+        return refs
+
+    def _create_all(self, model, refs, create):
+        """Add every ref in one transaction.
+
+        Should any of them conflict, each ref is created by create on its
+        own instead, to find out which. The batch is then best-effort, as
+        with the other backends: the refs that could be created are kept,
+        and each conflict is reported as that ref's result.
+
+        """
+        session = self.get_session()
+        try:
+            with session.begin():
+                model_refs = [model.from_dict(x) for x in refs]
+                session.add_all(model_refs)
+                session.flush()
+        except sql.IntegrityError:
+            return self._apply_each(create, refs)
+        return [x.to_dict() for x in model_refs]
+
+    def _update_all(self, model, refs, not_found, update):
+        """Update every ref in one transaction, like _create_all."""
+        session = self.get_session()
+        try:
+            with session.begin():
+                model_refs = self._get_all_by_id(session, model,
+                                                 [x['id'] for x in refs])
+                results = []
+                for ref in refs:
+                    model_ref = model_refs.get(ref['id'])
+                    if model_ref is None:
+                        results.append(not_found(ref['id']))
+                        continue
+                    _update_ref(model_ref, ref)
+                    results.append(model_ref.to_dict(include_extra_dict=True))
+                session.flush()
+        except sql.IntegrityError:
+            return self._apply_each(update, refs)
+        return results
+
+    def create_users(self, users):
+        results = []
+        valid = []
+        for user in users:
+            try:
+                user = dict(user, name=clean.user_name(user['name']))
+                valid.append(utils.hash_user_password(user))
+                results.append(None)
+            except exception.Error as e:
+                results.append(e)
+        created = self._create_all(User, valid,
+                                   lambda x: self.create_user(x['id'], x))
+        return [identity.filter_user(x) if isinstance(x, dict) else x
+                for x in _fill(results, created)]
+
+    def update_users(self, users):
+        results = []
+        valid = []
+        for user in users:
+            try:
+                user = user.copy()
+                if 'name' in user:
+                    user['name'] = clean.user_name(user['name'])
+                valid.append(utils.hash_user_password(user))
+                results.append(None)
+            except exception.Error as e:
+                results.append(e)
+        updated = self._update_all(
+            User, valid,
+            lambda x: exception.UserNotFound(user_id=x),
+            lambda x: self.update_user(x['id'], x))
+        return [identity.filter_user(x) if isinstance(x, dict) else x
+                for x in _fill(results, updated)]
+
+    def create_projects(self, projects):
+        results = []
+        valid = []
+        for project in projects:
+            try:
+                valid.append(dict(project,
+                                  name=clean.project_name(project['name'])))
+                results.append(None)
+            except exception.Error as e:
+                results.append(e)
+        created = self._create_all(
+            Project, valid, lambda x: self.create_project(x['id'], x))
+        return _fill(results, created)
+
+    def update_projects(self, projects):
+        results = []
+        valid = []
+        for project in projects:
+            try:
+                project = project.copy()
+                if 'name' in project:
+                    project['name'] = clean.project_name(project['name'])
+                valid.append(project)
+                results.append(None)
+            except exception.Error as e:
+                results.append(e)
+        updated = self._update_all(
+            Project, valid,
+            lambda x: exception.ProjectNotFound(project_id=x),
+            lambda x: self.update_project(x['id'], x))
+        return _fill(results, updated)
+
+    def create_grants(self, grants):
+        session = self.get_session()
+        # each grant names one of each pair, as for create_grant
+        references = [('role_id', Role, exception.RoleNotFound),
+                      ('user_id', User, exception.UserNotFound),
+                      ('group_id', Group, exception.GroupNotFound),
+                      ('domain_id', Domain, exception.DomainNotFound),
+                      ('project_id', Project, exception.ProjectNotFound)]
+        found = {}
+        for key, model, not_found in references:
+            found[key] = self._get_all_by_id(
+                session, model, [x[key] for x in grants if x.get(key)])
+
+        results = []
+        with session.begin():
+            metadata_refs = {}
+            for grant in grants:
+                missing = [not_found(**{key: grant[key]})
+                           for key, model, not_found in references
+                           if grant.get(key) and grant[key] not in found[key]]
+                if missing:
+                    results.append(missing[0])
+                    continue
+
+                actor = grant.get('user_id') and 'user_id' or 'group_id'
+                target = grant.get('domain_id') and 'domain_id' or 'project_id'
+                model = GRANT_MODELS[actor, target]
+                ids = {actor: grant[actor], target: grant[target]}
+                key = (model, grant[actor], grant[target])
+                if key not in metadata_refs:
+                    query = session.query(model).filter_by(**ids)
+                    metadata_ref = query.first()
+                    if metadata_ref is None:
+                        metadata_ref = model(data={}, **ids)
+                        session.add(metadata_ref)
+                    metadata_refs[key] = metadata_ref
+                metadata_ref = metadata_refs[key]
+
+                # assign a new dict, so that the change is saved
+                data = dict(metadata_ref.data or {})
+                roles = set(data.get('roles', []))
+                roles.add(grant['role_id'])
+                data['roles'] = list(roles)
+                metadata_ref.data = data
+                results.append(grant)
+            session.flush()
+        return results
@@ -122,9 +122,7 @@ class Tenant(controller.V2Controller):
     def get_project_users(self, context, tenant_id, **kw):
         self.assert_admin(context)
         user_refs = self.identity_api.get_project_users(context, tenant_id)
-        for user_ref in user_refs:
-            self._filter_domain_id(user_ref)
-        return {'users': user_refs}
+        return {'users': (self._filter_domain_id(x) for x in user_refs)}
 
     def _format_project_list(self, tenant_refs, **kwargs):
         marker = kwargs.get('marker')
@@ -151,12 +149,12 @@ class Tenant(controller.V2Controller):
                 raise exception.ValidationError(message=msg)
             last_index = first_index + limit
 
-        tenant_refs = tenant_refs[first_index:last_index]
+        def _default_enabled(refs):
+            for x in refs:
+                x.setdefault('enabled', True)
+                yield x
 
-        for x in tenant_refs:
-            if 'enabled' not in x:
-                x['enabled'] = True
-        o = {'tenants': tenant_refs,
+        o = {'tenants': _default_enabled(tenant_refs[first_index:last_index]),
              'tenants_links': []}
         return o
 
@@ -176,9 +174,7 @@ class User(controller.V2Controller):
 
         self.assert_admin(context)
         user_list = self.identity_api.list_users(context)
-        for x in user_list:
-            self._filter_domain_id(x)
-        return {'users': user_list}
+        return {'users': (self._filter_domain_id(x) for x in user_list)}
 
     def get_user_by_name(self, context, user_name):
         self.assert_admin(context)
@@ -448,19 +444,15 @@ class DomainV3(controller.V3Controller):
         """Delete the contents of a domain.
 
         Before we delete a domain, we need to remove all the entities
-        that are owned by it, i.e. Users, Groups & Projects. To do this we
-        call the respective delete functions for these entities, which are
-        themselves responsible for deleting any credentials and role grants
-        associated with them as well as revoking any relevant tokens.
+        that are owned by it, i.e. Users, Groups & Projects, along with any
+        credentials, role grants and group memberships associated with them.
+        The backend does this in as few operations as it can, rather than
+        entity by entity, so that large domains can be deleted quickly.
 
-        The order we delete entities is also important since some types
-        of backend may need to maintain referential integrity
-        throughout, and many of the entities have relationship with each
-        other. The following deletion order is therefore used:
-
-        Projects: Reference user and groups for grants
-        Groups: Reference users for membership and domains for grants
-        Users: Reference domains for grants
+        Every token belonging to the domain is revoked first, in a single
+        backend operation (see ``token.domain_ids``). Tokens are then revoked
+        for the members of the groups deleted, who may belong to other
+        domains, together with any tokens issued for trusts.
 
         """
         # Start by disabling all the users in this domain, to minimize the
@@ -469,39 +461,17 @@ class DomainV3(controller.V3Controller):
         # users of a disabled domain are prevented from authenticating.
         # However there are some existing bugs in this area (e.g. 1130236).
         # Consider removing this code once these have been fixed.
-        user_refs = self.identity_api.list_users(context)
-        user_refs = [r for r in user_refs if r['domain_id'] == domain_id]
-        for user in user_refs:
-            if user['enabled']:
-                user['enabled'] = False
-                self.identity_api.update_user(context, user['id'], user)
-                self._delete_tokens_for_user(context, user['id'])
-
-        # Now, for safety, reload list of users, as well as projects, that are
-        # owned by this domain.
-        user_refs = self.identity_api.list_users(context)
-        user_ids = [r['id'] for r in user_refs if r['domain_id'] == domain_id]
-
-        proj_refs = self.identity_api.list_projects(context)
-        proj_ids = [r['id'] for r in proj_refs if r['domain_id'] == domain_id]
-
-        # First delete the projects themselves
-        project_cntl = ProjectV3()
-        for project in proj_ids:
-            project_cntl._delete_project(context, project)
-
-        # Get the list of groups owned by this domain and delete them
-        group_refs = self.identity_api.list_groups(context)
-        group_ids = ([r['id'] for r in group_refs
-                     if r['domain_id'] == domain_id])
-        group_cntl = GroupV3()
-        for group in group_ids:
-            group_cntl._delete_group(context, group)
-
-        # And finally, delete the users themselves
-        user_cntl = UserV3()
-        for user in user_ids:
-            user_cntl._delete_user(context, user)
+        user_refs = [{'id': x['id'], 'enabled': False}
+                     for x in self.identity_api.list_users(context)
+                     if (x['domain_id'] == domain_id and
+                         x.get('enabled', True))]
+        if user_refs:
+            self.identity_api.update_users(context, user_refs)
+        self.token_api.delete_tokens_for_domain(context, domain_id)
+
+        user_ids = self.identity_api.delete_domain_contents(context,
+                                                            domain_id)
+        self._delete_tokens_for_users(context, user_ids)
 
     @controller.protected
     def delete_domain(self, context, domain_id):
@@ -569,6 +539,26 @@ class ProjectV3(controller.V3Controller):
         ref = self.identity_api.update_project(context, project_id, project)
         return ProjectV3.wrap_member(context, ref)
 
+    @controller.protected
+    def create_projects(self, context, projects):
+        def create(refs):
+            refs = [self._assign_unique_id(self._normalize_dict(x))
+                    for x in refs]
+            refs = self._normalize_domain_ids(context, refs)
+            return self.identity_api.create_projects(context, refs)
+
+        results = self._apply_batch(
+            self._require_batch('projects', projects), None, create)
+        return ProjectV3.wrap_batch(context, results)
+
+    @controller.protected
+    def update_projects(self, context, projects):
+        results = self._apply_batch(
+            self._require_batch('projects', projects),
+            lambda ref: self._require_attribute(ref, 'id'),
+            lambda refs: self.identity_api.update_projects(context, refs))
+        return ProjectV3.wrap_batch(context, results)
+
     def _delete_project(self, context, project_id):
         # Delete any credentials that reference this project
         for cred in self.identity_api.list_credentials(context):
@@ -621,6 +611,34 @@ class UserV3(controller.V3Controller):
 
         return UserV3.wrap_member(context, ref)
 
+    @controller.protected
+    def create_users(self, context, users):
+        def create(refs):
+            refs = [self._assign_unique_id(self._normalize_dict(x))
+                    for x in refs]
+            refs = self._normalize_domain_ids(context, refs)
+            return self.identity_api.create_users(context, refs)
+
+        results = self._apply_batch(
+            self._require_batch('users', users), None, create)
+        return UserV3.wrap_batch(context, results)
+
+    @controller.protected
+    def update_users(self, context, users):
+        results = self._apply_batch(
+            self._require_batch('users', users),
+            lambda ref: self._require_attribute(ref, 'id'),
+            lambda refs: self.identity_api.update_users(context, refs))
+
+        # revoke all tokens owned by users whose password was changed, or
+        # who were disabled
+        self._delete_tokens_for_users(
+            context,
+            [user['id'] for user, result in zip(users, results)
+             if not isinstance(result, exception.Error) and
+             (user.get('password') or not user.get('enabled', True))])
+        return UserV3.wrap_batch(context, results)
+
     @controller.protected
     def add_user_to_group(self, context, user_id, group_id):
         self.identity_api.add_user_to_group(
@@ -805,6 +823,52 @@ class RoleV3(controller.V3Controller):
         else:
             self._delete_tokens_for_group(context, group_id)
 
+    @controller.protected
+    def create_grants(self, context, grants):
+        """Grants many roles, each as by create_grant."""
+        keys = ['role_id', 'user_id', 'group_id', 'domain_id', 'project_id']
+
+        def check(grant):
+            self._require_attribute(grant, 'role_id')
+            self._require_domain_xor_project(grant.get('domain_id'),
+                                             grant.get('project_id'))
+            self._require_user_xor_group(grant.get('user_id'),
+                                         grant.get('group_id'))
+
+        def create(grants):
+            refs = [dict((k, x[k]) for k in keys if x.get(k))
+                    for x in grants]
+            return self.identity_api.create_grants(context, refs)
+
+        results = self._apply_batch(
+            self._require_batch('grants', grants), check, create)
+
+        # So that existing tokens don't stop the use of these grants, delete
+        # any tokens for the users granted roles, or who are members of the
+        # groups granted roles.
+        user_ids = set()
+        group_ids = set()
+        for result in results:
+            if isinstance(result, exception.Error):
+                continue
+            if result.get('user_id'):
+                user_ids.add(result['user_id'])
+            else:
+                group_ids.add(result['group_id'])
+        for group_id in group_ids:
+            user_ids.update(
+                x['id'] for x in
+                self.identity_api.list_users_in_group(context, group_id))
+        self._delete_tokens_for_users(context, user_ids)
+
+        items = []
+        for result in results:
+            if isinstance(result, exception.Error):
+                items.append(self._wrap_error(result))
+            else:
+                items.append({'grant': result})
+        return {'grants': items}
+
     @controller.protected
     def list_grants(self, context, user_id=None, group_id=None,
                     domain_id=None, project_id=None):
@@ -68,6 +68,15 @@ class Manager(manager.Manager):
             user['enabled'] = True
         return self.driver.create_user(user_id, user)
 
+    def create_users(self, context, user_refs):
+        users = []
+        for user_ref in user_refs:
+            user = user_ref.copy()
+            if 'enabled' not in user:
+                user['enabled'] = True
+            users.append(user)
+        return self.driver.create_users(users)
+
     def create_group(self, context, group_id, group_ref):
         group = group_ref.copy()
         if 'description' not in group:
@@ -82,6 +91,17 @@ class Manager(manager.Manager):
             tenant['description'] = ''
         return self.driver.create_project(tenant_id, tenant)
 
+    def create_projects(self, context, tenant_refs):
+        tenants = []
+        for tenant_ref in tenant_refs:
+            tenant = tenant_ref.copy()
+            if 'enabled' not in tenant:
+                tenant['enabled'] = True
+            if 'description' not in tenant:
+                tenant['description'] = ''
+            tenants.append(tenant)
+        return self.driver.create_projects(tenants)
+
 
 class Driver(object):
     """Interface description for an Identity driver."""
@@ -303,6 +323,18 @@ class Driver(object):
         """
         raise exception.NotImplemented()
 
+    def delete_domain_contents(self, domain_id):
+        """Deletes the users, groups and projects owned by a domain.
+
+        Their credentials, role grants and group memberships are deleted
+        with them. Tokens are left to the caller.
+
+        :returns: the ids of the users deleted, and of the members of the
+                  groups deleted, whose tokens should be revoked.
+
+        """
+        raise exception.NotImplemented()
+
     # project crud
     def create_project(self, project_id, project):
         """Creates a new project.
@@ -571,3 +603,76 @@ class Driver(object):
 
         """
         raise exception.NotImplemented()
+
+    # batch operations
+
+    def _apply_each(self, fn, refs):
+        """Applies fn to each ref, collecting its result or error."""
+        results = []
+        for ref in refs:
+            try:
+                results.append(fn(ref))
+            except exception.Error as e:
+                results.append(e)
+        return results
+
+    def create_users(self, users):
+        """Creates many users, each as by create_user.
+
+        Batches are applied on a best-effort basis, not atomically: a user
+        that cannot be created is reported in the results, and the others
+        are created regardless. A backend may write a batch in a single
+        transaction, but if that fails it applies each item on its own.
+
+        :param users: list of user refs, each including its id
+        :returns: a list holding, for each user in turn, either its new
+                  user_ref or the keystone.exception.Error raised for it.
+
+        """
+        raise exception.NotImplemented()
+
+    def update_users(self, users):
+        """Updates many users, each as by update_user.
+
+        Applied on a best-effort basis, as described for create_users.
+
+        :param users: list of user refs, each including its id
+        :returns: as for create_users.
+
+        """
+        raise exception.NotImplemented()
+
+    def create_projects(self, projects):
+        """Creates many projects, each as by create_project.
+
+        Applied on a best-effort basis, as described for create_users.
+
+        :param projects: list of project refs, each including its id
+        :returns: as for create_users.
+
+        """
+        raise exception.NotImplemented()
+
+    def update_projects(self, projects):
+        """Updates many projects, each as by update_project.
+
+        Applied on a best-effort basis, as described for create_users.
+
+        :param projects: list of project refs, each including its id
+        :returns: as for create_users.
+
+        """
+        raise exception.NotImplemented()
+
+    def create_grants(self, grants):
+        """Grants many roles, each as by create_grant.
+
+        Applied on a best-effort basis, as described for create_users.
+
+        :param grants: list of dicts of the role_id, user_id or group_id,
+                       and domain_id or project_id of each grant
+        :returns: a list holding, for each grant in turn, either the grant
+                  or the keystone.exception.Error raised for it.
+
+        """
+        raise exception.NotImplemented()
@@ -73,6 +73,14 @@ def append_v3_routers(mapper, routers):
                    controller=project_controller,
                    action='list_user_projects',
                    conditions=dict(method=['GET']))
+    mapper.connect('/batch/projects',
+                   controller=project_controller,
+                   action='create_projects',
+                   conditions=dict(method=['POST']))
+    mapper.connect('/batch/projects',
+                   controller=project_controller,
+                   action='update_projects',
+                   conditions=dict(method=['PATCH']))
 
     user_controller = controllers.UserV3()
     routers.append(
@@ -98,6 +106,15 @@ def append_v3_routers(mapper, routers):
                    action='remove_user_from_group',
                    conditions=dict(method=['DELETE']))
 
+    mapper.connect('/batch/users',
+                   controller=user_controller,
+                   action='create_users',
+                   conditions=dict(method=['POST']))
+    mapper.connect('/batch/users',
+                   controller=user_controller,
+                   action='update_users',
+                   conditions=dict(method=['PATCH']))
+
     group_controller = controllers.GroupV3()
     routers.append(
         router.Router(group_controller,
@@ -113,6 +130,10 @@ def append_v3_routers(mapper, routers):
 
     role_controller = controllers.RoleV3()
     routers.append(router.Router(role_controller, 'roles', 'role'))
+    mapper.connect('/batch/grants',
+                   controller=role_controller,
+                   action='create_grants',
+                   conditions=dict(method=['PUT']))
     mapper.connect('/projects/{project_id}/users/{user_id}/roles/{role_id}',
                    controller=role_controller,
                    action='create_grant',
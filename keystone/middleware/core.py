@@ -45,6 +45,22 @@ CONTEXT_ENV = wsgi.CONTEXT_ENV
 PARAMS_ENV = wsgi.PARAMS_ENV
 
 
+# Environment variable used to request responses rendered as XML
+XML_RESPONSE_ENV = wsgi.XML_RESPONSE_ENV
+
+
+def _filter_params(params_parsed):
+    """Filters out `self`, `context` and anything beginning with `_`."""
+    params = {}
+    for k, v in params_parsed.iteritems():
+        if k in ('self', 'context'):
+            continue
+        if k.startswith('_'):
+            continue
+        params[k] = v
+    return params
+
+
 class TokenAuthMiddleware(wsgi.Middleware):
     def process_request(self, request):
         token = request.headers.get(AUTH_TOKEN_HEADER)
@@ -80,16 +96,7 @@ class PostParamsMiddleware(wsgi.Middleware):
     """
 
     def process_request(self, request):
-        params_parsed = request.params
-        params = {}
-        for k, v in params_parsed.iteritems():
-            if k in ('self', 'context'):
-                continue
-            if k.startswith('_'):
-                continue
-            params[k] = v
-
-        request.environ[PARAMS_ENV] = params
+        request.environ[PARAMS_ENV] = _filter_params(request.params)
 
 
 class JsonBodyMiddleware(wsgi.Middleware):
@@ -112,6 +119,11 @@ class JsonBodyMiddleware(wsgi.Middleware):
         if not params_json:
             return
 
+        # XML bodies have already been deserialized by XmlBodyMiddleware
+        if ('application/xml' in str(request.content_type) and
+                PARAMS_ENV in request.environ):
+            return
+
         # Reject unrecognized content types. Empty string indicates
         # the client did not explicitly set the header
         if request.content_type not in ('application/json', ''):
@@ -130,38 +142,44 @@ class JsonBodyMiddleware(wsgi.Middleware):
             if not params_parsed:
                 params_parsed = {}
 
-        params = {}
-        for k, v in params_parsed.iteritems():
-            if k in ('self', 'context'):
-                continue
-            if k.startswith('_'):
-                continue
-            params[k] = v
-
-        request.environ[PARAMS_ENV] = params
+        request.environ[PARAMS_ENV] = _filter_params(params_parsed)
 
 
 class XmlBodyMiddleware(wsgi.Middleware):
-    """De/serializes XML to/from JSON."""
+    """De/serializes XML directly to/from method arguments and results.
+
+    Incoming XML is deserialized straight into the request params, and
+    applications are asked to render their results as XML. Any other JSON
+    response is converted on the way out.
+
+    """
 
     def process_request(self, request):
-        """Transform the request from XML to JSON."""
+        """Deserialize an XML request into params."""
+        if 'application/xml' in str(request.accept):
+            request.environ[XML_RESPONSE_ENV] = True
+
         incoming_xml = 'application/xml' in str(request.content_type)
         if incoming_xml and request.body:
-            request.content_type = 'application/json'
+            params_parsed = {}
             try:
-                request.body = jsonutils.dumps(
-                    serializer.from_xml(request.body))
+                params_parsed = serializer.from_xml(request.body)
             except Exception:
                 LOG.exception('Serializer failed')
                 e = exception.ValidationError(attribute='valid XML',
                                               target='request body')
                 return wsgi.render_exception(e)
+            finally:
+                if not params_parsed:
+                    params_parsed = {}
+
+            request.environ[PARAMS_ENV] = _filter_params(params_parsed)
 
     def process_response(self, request, response):
-        """Transform the response from JSON to XML."""
+        """Transform any remaining JSON response to XML."""
         outgoing_xml = 'application/xml' in str(request.accept)
-        if outgoing_xml and response.body:
+        if (outgoing_xml and response.content_type != 'application/xml' and
+                response.body):
             response.content_type = 'application/xml'
             try:
                 body_obj = jsonutils.loads(response.body)
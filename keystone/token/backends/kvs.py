@@ -14,15 +14,40 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import copy
-
 from keystone.common import kvs
 from keystone import exception
 from keystone.openstack.common import timeutils
 from keystone import token
 
 
+def _token_user_ids(ref):
+    if ref.get('user') and ref['user'].get('id'):
+        return [ref['user']['id']]
+    return []
+
+
+def _token_domain_ids(ref):
+    return list(token.domain_ids(ref))
+
+
+def _token_trust_ids(ref):
+    if ref.get('trust_id'):
+        return [ref['trust_id']]
+    return []
+
+
+def _token_revoked(ref):
+    # every revoked token is listed, whatever its expiry
+    return [True]
+
+
 class Token(kvs.Base, token.Driver):
+    def __init__(self, db=None):
+        super(Token, self).__init__(db)
+        self.db.add_index('token_user', 'token-', _token_user_ids)
+        self.db.add_index('token_trust', 'token-', _token_trust_ids)
+        self.db.add_index('token_domain', 'token-', _token_domain_ids)
+        self.db.add_index('revoked_token', 'revoked-token-', _token_revoked)
 
     # Public interface
     def get_token(self, token_id):
@@ -36,19 +61,20 @@ class Token(kvs.Base, token.Driver):
         if expiry is None:
             raise exception.TokenNotFound(token_id=token_id)
         if expiry > now:
-            return copy.deepcopy(ref)
+            return ref
         else:
             raise exception.TokenNotFound(token_id=token_id)
 
     def create_token(self, token_id, data):
         token_id = token.unique_id(token_id)
-        data_copy = copy.deepcopy(data)
+        # set() stores a frozen copy, so only the top level is copied here
+        data_copy = dict(data)
         if not data_copy.get('expires'):
             data_copy['expires'] = token.default_expire_time()
         if not data_copy.get('user_id'):
             data_copy['user_id'] = data_copy['user']['id']
         self.db.set('token-%s' % token_id, data_copy)
-        return copy.deepcopy(data_copy)
+        return self.db.get('token-%s' % token_id)
 
     def delete_token(self, token_id):
         token_id = token.unique_id(token_id)
@@ -71,10 +97,10 @@ class Token(kvs.Base, token.Driver):
     def _list_tokens_for_trust(self, trust_id):
         tokens = []
         now = timeutils.utcnow()
-        for token, ref in self.db.items():
-            if not token.startswith('token-') or self.is_expired(now, ref):
+        for token in self.db.lookup('token_trust', trust_id):
+            ref = self.db[token]
+            if self.is_expired(now, ref):
                 continue
-            ref_trust_id = ref.get('trust_id')
             if self.trust_matches(trust_id, ref):
                 tokens.append(token.split('-', 1)[1])
         return tokens
@@ -90,8 +116,9 @@ class Token(kvs.Base, token.Driver):
 
         tokens = []
         now = timeutils.utcnow()
-        for token, ref in self.db.items():
-            if not token.startswith('token-') or self.is_expired(now, ref):
+        for token in self.db.lookup('token_user', user_id):
+            ref = self.db[token]
+            if self.is_expired(now, ref):
                 continue
             else:
                 if (user_matches(user_id, ref) and
@@ -105,13 +132,38 @@ class Token(kvs.Base, token.Driver):
         else:
             return self._list_tokens_for_user(user_id, tenant_id)
 
+    def delete_tokens_for_users(self, user_ids):
+        for user_id in user_ids:
+            for token_id in self.list_tokens(user_id):
+                try:
+                    self.delete_token(token_id)
+                except exception.NotFound:
+                    pass
+
+    def delete_tokens_for_domain(self, domain_id):
+        for key in self.db.lookup('token_domain', domain_id):
+            try:
+                self.delete_token(key.split('-', 1)[1])
+            except exception.NotFound:
+                pass
+
     def list_revoked_tokens(self):
         tokens = []
-        for token, token_ref in self.db.items():
-            if not token.startswith('revoked-token-'):
-                continue
+        for token in self.db.lookup('revoked_token', True):
+            token_ref = self.db[token]
             record = {}
             record['id'] = token_ref['id']
             record['expires'] = token_ref['expires']
             tokens.append(record)
         return tokens
+
+    def create_revocation_event(self, event_ref):
+        events = self.list_revocation_events()
+        events.append(event_ref.copy())
+        self.db.set('revocation-events', events)
+
+    def list_revocation_events(self):
+        now = timeutils.utcnow()
+        return [event_ref for event_ref
+                in self.db.get('revocation-events', [])
+                if event_ref['expires'] > now]
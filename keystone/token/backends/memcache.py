@@ -23,6 +23,7 @@ from keystone.common import utils
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import jsonutils
+from keystone.openstack.common import timeutils
 from keystone import token
 
 
@@ -32,6 +33,7 @@ config.register_str('servers', group='memcache', default='localhost:11211')
 
 class Token(token.Driver):
     revocation_key = 'revocation-list'
+    revocation_events_key = 'revocation-events'
 
     def __init__(self, client=None):
         self._memcache_client = client
@@ -51,6 +53,9 @@ class Token(token.Driver):
     def _prefix_user_id(self, user_id):
         return 'usertokens-%s' % user_id.encode('utf-8')
 
+    def _prefix_domain_id(self, domain_id):
+        return 'domaintokens-%s' % domain_id.encode('utf-8')
+
     def get_token(self, token_id):
         if token_id is None:
             raise exception.TokenNotFound(token_id='')
@@ -82,17 +87,22 @@ class Token(token.Driver):
                     if not self.client.append(user_key, ',%s' % token_data):
                         msg = _('Unable to add token user list.')
                         raise exception.UnexpectedError(msg)
+        for domain_id in token.domain_ids(data_copy):
+            self._append(self._prefix_domain_id(domain_id), token_id,
+                         _('Unable to add token domain list.'))
         return copy.deepcopy(data_copy)
 
-    def _add_to_revocation_list(self, data):
+    def _append(self, key, data, msg):
         data_json = jsonutils.dumps(data)
-        if not self.client.append(self.revocation_key, ',%s' % data_json):
-            if not self.client.add(self.revocation_key, data_json):
-                if not self.client.append(self.revocation_key,
-                                          ',%s' % data_json):
-                    msg = _('Unable to add token to revocation list.')
+        if not self.client.append(key, ',%s' % data_json):
+            if not self.client.add(key, data_json):
+                if not self.client.append(key, ',%s' % data_json):
                     raise exception.UnexpectedError(msg)
 
+    def _add_to_revocation_list(self, data):
+        self._append(self.revocation_key, data,
+                     _('Unable to add token to revocation list.'))
+
     def delete_token(self, token_id):
         # Test for existence
         data = self.get_token(token.unique_id(token_id))
@@ -126,8 +136,48 @@ class Token(token.Driver):
                 tokens.append(token_id)
         return tokens
 
+    def delete_tokens_for_users(self, user_ids):
+        for user_id in user_ids:
+            for token_id in self.list_tokens(user_id):
+                try:
+                    self.delete_token(token_id)
+                except exception.NotFound:
+                    pass
+
+    def delete_tokens_for_domain(self, domain_id):
+        domain_key = self._prefix_domain_id(domain_id)
+        domain_record = self.client.get(domain_key) or ''
+        for token_id in jsonutils.loads('[%s]' % domain_record):
+            try:
+                self.delete_token(token_id)
+            except exception.NotFound:
+                pass
+        self.client.delete(domain_key)
+
     def list_revoked_tokens(self):
         list_json = self.client.get(self.revocation_key)
         if list_json:
             return jsonutils.loads('[%s]' % list_json)
         return []
+
+    def create_revocation_event(self, event_ref):
+        event_ref = event_ref.copy()
+        for attr in ('issued_before', 'expires'):
+            event_ref[attr] = timeutils.isotime(event_ref[attr],
+                                                subsecond=True)
+        self._append(self.revocation_events_key, event_ref,
+                     _('Unable to add revocation event.'))
+
+    def list_revocation_events(self):
+        list_json = self.client.get(self.revocation_events_key)
+        if not list_json:
+            return []
+        events = []
+        now = timeutils.utcnow()
+        for event_ref in jsonutils.loads('[%s]' % list_json):
+            for attr in ('issued_before', 'expires'):
+                event_ref[attr] = timeutils.normalize_time(
+                    timeutils.parse_isotime(event_ref[attr]))
+            if event_ref['expires'] > now:
+                events.append(event_ref)
+        return events
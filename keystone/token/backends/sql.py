@@ -24,6 +24,9 @@ from keystone.openstack.common import timeutils
 from keystone import token
 
 
+DELETE_CHUNK_SIZE = 500
+
+
 class TokenModel(sql.ModelBase, sql.DictBase):
     __tablename__ = 'token'
     attributes = ['id', 'expires', 'user_id', 'trust_id']
@@ -35,6 +38,22 @@ class TokenModel(sql.ModelBase, sql.DictBase):
     trust_id = sql.Column(sql.String(64), nullable=True)
 
 
+class RevocationEvent(sql.ModelBase, sql.DictBase):
+    __tablename__ = 'revocation_event'
+    attributes = ['token_id', 'user_id', 'project_id', 'trust_id',
+                  'issued_before', 'expires']
+    id = sql.Column(sql.Integer, primary_key=True, autoincrement=True)
+    token_id = sql.Column(sql.String(64), nullable=True)
+    user_id = sql.Column(sql.String(64), nullable=True)
+    project_id = sql.Column(sql.String(64), nullable=True)
+    trust_id = sql.Column(sql.String(64), nullable=True)
+    issued_before = sql.Column(sql.DateTime(), nullable=False)
+    expires = sql.Column(sql.DateTime(), nullable=False, index=True)
+
+    def to_dict(self):
+        return dict((attr, getattr(self, attr)) for attr in self.attributes)
+
+
 class Token(sql.Base, token.Driver):
     # Public interface
     def get_token(self, token_id):
@@ -80,6 +99,36 @@ class Token(sql.Base, token.Driver):
             token_ref.valid = False
             session.flush()
 
+    def delete_tokens_for_users(self, user_ids):
+        session = self.get_session()
+        user_ids = list(user_ids)
+        now = timeutils.utcnow()
+        with session.begin():
+            # chunked to keep each IN clause within the database's limits
+            for i in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+                query = session.query(TokenModel)
+                query = query.filter(TokenModel.expires > now)
+                query = query.filter(TokenModel.user_id.in_(
+                    user_ids[i:i + DELETE_CHUNK_SIZE]))
+                query = query.filter_by(valid=True)
+                query.update({'valid': False}, synchronize_session=False)
+
+    def delete_tokens_for_domain(self, domain_id):
+        session = self.get_session()
+        now = timeutils.utcnow()
+        with session.begin():
+            # the domains of a token are only known from its extra data
+            query = session.query(TokenModel)
+            query = query.filter(TokenModel.expires > now)
+            query = query.filter_by(valid=True)
+            token_ids = [x.id for x in query
+                         if domain_id in token.domain_ids(x.to_dict())]
+            for i in range(0, len(token_ids), DELETE_CHUNK_SIZE):
+                query = session.query(TokenModel)
+                query = query.filter(TokenModel.id.in_(
+                    token_ids[i:i + DELETE_CHUNK_SIZE]))
+                query.update({'valid': False}, synchronize_session=False)
+
     def _list_tokens_for_trust(self, trust_id):
         session = self.get_session()
         tokens = []
@@ -134,3 +183,20 @@ class Token(sql.Base, token.Driver):
             }
             tokens.append(record)
         return tokens
+
+    def create_revocation_event(self, event_ref):
+        session = self.get_session()
+        with session.begin():
+            query = session.query(RevocationEvent)
+            query = query.filter(RevocationEvent.expires <= timeutils.utcnow())
+            query.delete(synchronize_session=False)
+            session.add(RevocationEvent(
+                **dict((attr, event_ref.get(attr))
+                       for attr in RevocationEvent.attributes)))
+            session.flush()
+
+    def list_revocation_events(self):
+        session = self.get_session()
+        query = session.query(RevocationEvent)
+        query = query.filter(RevocationEvent.expires > timeutils.utcnow())
+        return [event_ref.to_dict() for event_ref in query]
@@ -2,10 +2,10 @@ import json
 import subprocess
 import uuid
 
-from keystone.common import cms
 from keystone.common import controller
 from keystone.common import dependency
 from keystone.common import logging
+from keystone.common import signing
 from keystone.common import utils
 from keystone import config
 from keystone import exception
@@ -110,30 +110,39 @@ class Auth(controller.V2Controller):
         service_catalog = Auth.format_catalog(catalog_ref)
         token_data['access']['serviceCatalog'] = service_catalog
 
+        token_ref = dict(expires=auth_token_data['expires'],
+                         user=user_ref,
+                         tenant=tenant_ref,
+                         metadata=metadata_ref,
+                         trust_id=trust_id)
         if CONF.signing.token_format == 'UUID':
             token_id = uuid.uuid4().hex
         elif CONF.signing.token_format == 'PKI':
             try:
-                token_id = cms.cms_sign_token(json.dumps(token_data),
-                                              CONF.signing.certfile,
-                                              CONF.signing.keyfile)
+                token_id = signing.cms_sign_token(json.dumps(token_data),
+                                                  CONF.signing.certfile,
+                                                  CONF.signing.keyfile)
             except subprocess.CalledProcessError:
                 raise exception.UnexpectedError(_(
                     'Unable to sign token.'))
+        elif CONF.signing.token_format == 'PKIZ':
+            try:
+                token_id = signing.pkiz_sign(json.dumps(token_data),
+                                             CONF.signing.certfile,
+                                             CONF.signing.keyfile)
+            except subprocess.CalledProcessError:
+                raise exception.UnexpectedError(_(
+                    'Unable to sign token.'))
+        elif CONF.signing.token_format == 'ENCRYPTED':
+            token_id = self.token_api.encrypt_token(context, token_ref)
         else:
             raise exception.UnexpectedError(_(
                 'Invalid value for token_format: %s.'
-                '  Allowed values are PKI or UUID.') %
+                '  Allowed values are PKI, PKIZ, UUID or ENCRYPTED.') %
                 CONF.signing.token_format)
+        token_ref.update(key=token_id, id=token_id)
         try:
-            self.token_api.create_token(
-                context, token_id, dict(key=token_id,
-                                        id=token_id,
-                                        expires=auth_token_data['expires'],
-                                        user=user_ref,
-                                        tenant=tenant_ref,
-                                        metadata=metadata_ref,
-                                        trust_id=trust_id))
+            self.token_api.create_token(context, token_id, token_ref)
         except Exception as e:
             # an identical token may have been created already.
             # if so, return the token_data as it is also identical
@@ -571,9 +580,9 @@ class Auth(controller.V2Controller):
                     t['expires'] = timeutils.isotime(expires)
         data = {'revoked': tokens}
         json_data = json.dumps(data)
-        signed_text = cms.cms_sign_text(json_data,
-                                        CONF.signing.certfile,
-                                        CONF.signing.keyfile)
+        signed_text = signing.cms_sign_text(json_data,
+                                            CONF.signing.certfile,
+                                            CONF.signing.keyfile)
 
         return {'signed': signed_text}
 
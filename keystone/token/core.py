@@ -17,6 +17,7 @@
 """Main entry point into the Token service."""
 
 import datetime
+import hashlib
 
 from keystone.common import cms
 from keystone.common import dependency
@@ -25,6 +26,7 @@ from keystone.common import manager
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import timeutils
+from keystone.token import encrypted
 
 
 CONF = config.CONF
@@ -38,10 +40,12 @@ def unique_id(token_id):
     The returned value is useful as the primary key of a database table,
     memcache store, or other lookup table.
 
-    :returns: Given a PKI token, returns it's hashed value. Otherwise, returns
-              the passed-in value (such as a UUID token ID or an existing
-              hash).
+    :returns: Given a PKI or encrypted token, returns it's hashed value.
+              Otherwise, returns the passed-in value (such as a UUID token
+              ID or an existing hash).
     """
+    if encrypted.is_encrypted_token(token_id):
+        return hashlib.md5(token_id).hexdigest()
     return cms.cms_hash_token(token_id)
 
 
@@ -57,6 +61,24 @@ def default_expire_time():
     return timeutils.utcnow() + expire_delta
 
 
+def domain_ids(token_ref):
+    """Return the ids of the domains a token reference belongs to.
+
+    Those are the domains owning its user and its project, and the domain
+    a v3 token is scoped to.
+
+    """
+    ids = set()
+    for ref in (token_ref.get('user'), token_ref.get('tenant')):
+        if ref:
+            ids.add(ref.get('domain_id'))
+            ids.add((ref.get('domain') or {}).get('id'))
+    token_data = (token_ref.get('token_data') or {}).get('token') or {}
+    ids.add((token_data.get('domain') or {}).get('id'))
+    ids.discard(None)
+    return ids
+
+
 def validate_auth_info(self, context, user_ref, tenant_ref):
     """Validate user and tenant auth info.
 
@@ -116,6 +138,106 @@ class Manager(manager.Manager):
 
     def __init__(self):
         super(Manager, self).__init__(CONF.token.driver)
+        self._formatter = None
+
+    @property
+    def formatter(self):
+        if self._formatter is None:
+            self._formatter = encrypted.TokenFormatter()
+        return self._formatter
+
+    def _is_encrypted(self, token_id):
+        return (CONF.signing.token_format == 'ENCRYPTED' and
+                encrypted.is_encrypted_token(token_id))
+
+    @manager.instrumented
+    def encrypt_token(self, context, data):
+        """Return an encrypted token ID carrying a token reference.
+
+        :param data: the token reference, as passed to ``create_token``
+
+        """
+        return self.formatter.pack(data)
+
+    @manager.instrumented
+    def get_token(self, context, token_id):
+        if not self._is_encrypted(token_id):
+            return self.driver.get_token(token_id)
+        payload = self.formatter.unpack(token_id)
+        if payload['expires'] <= timeutils.utcnow():
+            raise exception.TokenNotFound(token_id=token_id)
+        if encrypted.is_revoked(payload, unique_id(token_id),
+                                self.driver.list_revocation_events()):
+            raise exception.TokenNotFound(token_id=token_id)
+        return self.formatter.rebuild(context, token_id, payload)
+
+    @manager.instrumented
+    def create_token(self, context, token_id, data):
+        if not self._is_encrypted(token_id):
+            return self.driver.create_token(token_id, data)
+        # the token ID itself carries everything needed to validate it
+        return data
+
+    @manager.instrumented
+    def delete_token(self, context, token_id):
+        if not self._is_encrypted(token_id):
+            return self.driver.delete_token(token_id)
+        token_ref = self.get_token(context, token_id)
+        self.driver.create_revocation_event(
+            {'token_id': unique_id(token_id),
+             'issued_before': timeutils.utcnow(),
+             'expires': token_ref['expires']})
+
+    @manager.instrumented
+    def delete_tokens(self, context, user_id, tenant_id=None, trust_id=None):
+        """Invalidate the tokens of a user, or those issued for a trust.
+
+        Arguments are as for ``list_tokens``.
+
+        """
+        for token_id in self.driver.list_tokens(user_id, tenant_id,
+                                                trust_id):
+            try:
+                self.driver.delete_token(token_id)
+            except exception.NotFound:
+                pass
+
+        if CONF.signing.token_format == 'ENCRYPTED':
+            # no token issued from now on can outlive this event
+            event_ref = {'issued_before': timeutils.utcnow(),
+                         'expires': default_expire_time()}
+            if trust_id:
+                event_ref['trust_id'] = trust_id
+            else:
+                event_ref['user_id'] = user_id
+                event_ref['project_id'] = tenant_id
+            self.driver.create_revocation_event(event_ref)
+
+    @manager.instrumented
+    def delete_tokens_for_domain(self, context, domain_id):
+        """Invalidate every token belonging to a domain (see domain_ids).
+
+        Encrypted tokens need no revocation event: validating one reads its
+        user, project and domains, which fails once they have been deleted
+        or disabled.
+
+        """
+        self.driver.delete_tokens_for_domain(domain_id)
+
+    @manager.instrumented
+    def delete_tokens_for_users(self, context, user_ids):
+        """Invalidate every token of many users at once."""
+        user_ids = list(user_ids)
+        self.driver.delete_tokens_for_users(user_ids)
+
+        if CONF.signing.token_format == 'ENCRYPTED':
+            issued_before = timeutils.utcnow()
+            expires = default_expire_time()
+            for user_id in user_ids:
+                self.driver.create_revocation_event(
+                    {'issued_before': issued_before,
+                     'expires': expires,
+                     'user_id': user_id})
 
 
 class Driver(object):
@@ -180,6 +302,29 @@ class Driver(object):
         """
         raise exception.NotImplemented()
 
+    def delete_tokens_for_users(self, user_ids):
+        """Invalidates every current token of the given users.
+
+        :param user_ids: identities of the users
+        :type user_ids: list
+        :returns: None.
+
+        """
+        raise exception.NotImplemented()
+
+    def delete_tokens_for_domain(self, domain_id):
+        """Invalidates every current token belonging to a domain.
+
+        A token belongs to the domains of its user and project, and to the
+        domain it is scoped to (see ``domain_ids``).
+
+        :param domain_id: identity of the domain
+        :type domain_id: string
+        :returns: None.
+
+        """
+        raise exception.NotImplemented()
+
     def list_revoked_tokens(self):
         """Returns a list of all revoked tokens
 
@@ -187,3 +332,28 @@ class Driver(object):
 
         """
         raise exception.NotImplemented()
+
+    def create_revocation_event(self, event_ref):
+        """Revoke the tokens issued before a time that match an event.
+
+        Used for tokens that are not persisted, such as encrypted tokens.
+
+        :param event_ref: dictionary of ``issued_before`` and ``expires``
+                          datetimes, and any of ``token_id`` (as returned
+                          by ``unique_id``), ``user_id``, ``project_id``
+                          and ``trust_id`` that matching tokens must have.
+                          Once ``expires`` has passed, no token the event
+                          applies to can still be valid.
+        :type event_ref: dict
+        :returns: None.
+
+        """
+        raise exception.NotImplemented()
+
+    def list_revocation_events(self):
+        """Returns the revocation events that have not expired.
+
+        :returns: list of event_ref's
+
+        """
+        raise exception.NotImplemented()
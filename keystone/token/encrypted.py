@@ -0,0 +1,321 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Encrypted tokens, which are never written to the token backend.
+
+An encrypted token ID is an authenticated, encrypted payload naming the
+user, scope, roles, expiry, authentication methods and trust of the token.
+Validating one only takes decrypting it and reading the current user,
+project and role names from the identity backend. Encrypted tokens are
+revoked by recording revocation events in the token backend (see
+``keystone.token.core.Manager``) rather than by deleting them.
+
+"""
+
+import calendar
+import datetime
+import os
+
+try:
+    from cryptography import fernet
+except ImportError:
+    fernet = None
+
+from keystone.common import logging
+from keystone import config
+from keystone import exception
+from keystone import identity
+from keystone.openstack.common import jsonutils
+from keystone.openstack.common import timeutils
+from keystone import trust
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+# the base64 encoding of the version byte and the high bytes of the
+# timestamp that start every token
+PREFIX = 'gAAAAA'
+
+REPOSITORIES = {}
+
+
+def is_encrypted_token(token_id):
+    return bool(token_id) and token_id.startswith(PREFIX)
+
+
+def _to_timestamp(dt):
+    return calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1000000.0
+
+
+def _from_timestamp(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+class KeyRepository(object):
+    """The keys that encrypt tokens, stored one per file in a directory.
+
+    Files are named by increasing integers. The key in the highest numbered
+    file is the primary key, which encrypts new tokens; the others are only
+    used to decrypt tokens issued before the last rotations.
+
+    """
+
+    def __init__(self, path, max_active_keys=3):
+        if fernet is None:
+            raise exception.UnexpectedError(
+                _('The cryptography library is required for encrypted '
+                  'tokens.'))
+        self.path = path
+        self.max_active_keys = max_active_keys
+        self._names = None
+        self._crypto = None
+
+    def _key_ids(self):
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _read(self, key_id):
+        with open(os.path.join(self.path, str(key_id))) as f:
+            return f.read().strip()
+
+    @property
+    def crypto(self):
+        """A MultiFernet over the active keys, reloaded after a rotation."""
+        key_ids = self._key_ids()
+        if key_ids != self._names:
+            if not key_ids:
+                raise exception.UnexpectedError(
+                    _('No token encryption keys found in %s; run '
+                      'keystone-manage token_key_rotate') % self.path)
+            self._crypto = fernet.MultiFernet(
+                [fernet.Fernet(self._read(key_id))
+                 for key_id in reversed(key_ids)])
+            self._names = key_ids
+        return self._crypto
+
+    def rotate(self, user_id=None, group_id=None):
+        """Add a new primary key, removing the oldest keys past the limit."""
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, 0700)
+            if user_id is not None or group_id is not None:
+                os.chown(self.path, user_id or -1, group_id or -1)
+        key_ids = self._key_ids()
+        key_id = key_ids[-1] + 1 if key_ids else 0
+        key_path = os.path.join(self.path, str(key_id))
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+        try:
+            os.write(fd, fernet.Fernet.generate_key())
+        finally:
+            os.close(fd)
+        if user_id is not None or group_id is not None:
+            os.chown(key_path, user_id or -1, group_id or -1)
+        LOG.info(_('Created token encryption key %s'), key_path)
+
+        key_ids.append(key_id)
+        for key_id in key_ids[:-self.max_active_keys]:
+            os.remove(os.path.join(self.path, str(key_id)))
+            LOG.info(_('Removed token encryption key %s'), key_id)
+
+
+def get_key_repository():
+    path = CONF.signing.key_repository
+    if path not in REPOSITORIES:
+        REPOSITORIES[path] = KeyRepository(path)
+    repository = REPOSITORIES[path]
+    repository.max_active_keys = CONF.signing.max_active_keys
+    return repository
+
+
+def is_revoked(payload, token_hash, events):
+    """Return True if any revocation event applies to a token.
+
+    An event applies to the tokens issued before it that match each of the
+    token_id, user_id, project_id and trust_id it specifies.
+
+    """
+    for event in events:
+        if payload['issued_at'] > event['issued_before']:
+            continue
+        if event.get('token_id') not in (None, token_hash):
+            continue
+        if event.get('user_id') not in (None, payload['user_id']):
+            continue
+        if event.get('project_id') not in (None, payload['project_id']):
+            continue
+        if event.get('trust_id') not in (None, payload['trust_id']):
+            continue
+        return True
+    return False
+
+
+class TokenFormatter(object):
+    """Encrypts token references into token IDs, and rebuilds them."""
+
+    def __init__(self):
+        self.identity_api = identity.Manager()
+        self.trust_api = trust.Manager()
+
+    def pack(self, token_ref):
+        """Return the encrypted token ID for a token reference.
+
+        The reference is what the token controllers would otherwise pass to
+        ``token_api.create_token``.
+
+        """
+        payload = {'u': token_ref['user']['id'],
+                   'e': _to_timestamp(token_ref['expires']),
+                   'i': _to_timestamp(timeutils.utcnow())}
+        if token_ref.get('trust_id'):
+            payload['t'] = token_ref['trust_id']
+        if token_ref.get('token_data'):
+            token_data = token_ref['token_data']['token']
+            payload['v'] = 3
+            payload['m'] = token_data['methods']
+            if token_data.get('extras'):
+                payload['x'] = token_data['extras']
+            if 'project' in token_data:
+                payload['p'] = token_data['project']['id']
+            if 'domain' in token_data:
+                payload['d'] = token_data['domain']['id']
+            role_ids = [role['id'] for role in token_data.get('roles', [])]
+        else:
+            if token_ref.get('tenant'):
+                payload['p'] = token_ref['tenant']['id']
+            role_ids = token_ref['metadata'].get('roles', [])
+        if role_ids:
+            payload['r'] = role_ids
+        crypto = get_key_repository().crypto
+        return crypto.encrypt(jsonutils.dumps(payload))
+
+    def unpack(self, token_id):
+        """Decrypt a token ID, without checking whether it is still valid.
+
+        :raises: keystone.exception.TokenNotFound
+
+        """
+        crypto = get_key_repository().crypto
+        try:
+            payload = jsonutils.loads(crypto.decrypt(str(token_id)))
+        except (fernet.InvalidToken, ValueError):
+            raise exception.TokenNotFound(token_id=token_id)
+        return {'version': payload.get('v', 2),
+                'user_id': payload['u'],
+                'project_id': payload.get('p'),
+                'domain_id': payload.get('d'),
+                'role_ids': payload.get('r', []),
+                'methods': payload.get('m', []),
+                'extras': payload.get('x', {}),
+                'trust_id': payload.get('t'),
+                'expires': _from_timestamp(payload['e']),
+                'issued_at': _from_timestamp(payload['i'])}
+
+    def rebuild(self, context, token_id, payload):
+        """Return the token reference a persisted token would have stored.
+
+        :raises: keystone.exception.TokenNotFound if the user, project,
+                 any of their domains, the domain the token is scoped to,
+                 or the trust of the token no longer exists or is disabled
+
+        """
+        try:
+            user_ref = self.identity_api.get_user(context, payload['user_id'])
+            domain_ids = set([user_ref.get('domain_id'),
+                              payload['domain_id']])
+            tenant_ref = None
+            if payload['project_id']:
+                tenant_ref = self.identity_api.get_project(
+                    context, payload['project_id'])
+                domain_ids.add(tenant_ref.get('domain_id'))
+            domain_ids.discard(None)
+            domain_refs = dict((x, self.identity_api.get_domain(context, x))
+                               for x in domain_ids)
+        except exception.NotFound:
+            raise exception.TokenNotFound(token_id=token_id)
+        for ref in [user_ref, tenant_ref] + domain_refs.values():
+            if ref is not None and not ref.get('enabled', True):
+                raise exception.TokenNotFound(token_id=token_id)
+
+        metadata_ref = {'roles': payload['role_ids']}
+        trust_ref = None
+        if payload['trust_id']:
+            trust_ref = self.trust_api.get_trust(context, payload['trust_id'])
+            if trust_ref is None:
+                raise exception.TokenNotFound(token_id=token_id)
+            metadata_ref['trust_id'] = trust_ref['id']
+            metadata_ref['trustee_user_id'] = trust_ref['trustee_user_id']
+
+        token_ref = {'id': token_id,
+                     'key': token_id,
+                     'expires': payload['expires'],
+                     'user_id': user_ref['id'],
+                     'user': user_ref,
+                     'tenant': tenant_ref,
+                     'metadata': metadata_ref,
+                     'trust_id': payload['trust_id']}
+        if payload['version'] == 3:
+            token_ref['token_data'] = self._rebuild_token_data(
+                context, payload, user_ref, tenant_ref, domain_refs,
+                trust_ref)
+        else:
+            # v2 tokens do not reveal domains
+            user_ref.pop('domain_id', None)
+            if tenant_ref:
+                tenant_ref.pop('domain_id', None)
+        return token_ref
+
+    def _rebuild_token_data(self, context, payload, user_ref, tenant_ref,
+                            domain_refs, trust_ref):
+        def domain(domain_id):
+            domain_ref = domain_refs[domain_id]
+            return {'id': domain_ref['id'], 'name': domain_ref['name']}
+
+        token_data = {
+            'methods': payload['methods'],
+            'extras': payload['extras'],
+            'expires_at': timeutils.isotime(payload['expires'],
+                                            subsecond=True),
+            'issued_at': timeutils.isotime(payload['issued_at'],
+                                           subsecond=True),
+            'user': {'id': user_ref['id'],
+                     'name': user_ref['name'],
+                     'domain': domain(user_ref['domain_id'])}}
+        if tenant_ref:
+            token_data['project'] = {
+                'id': tenant_ref['id'],
+                'name': tenant_ref['name'],
+                'domain': domain(tenant_ref['domain_id'])}
+        if payload['domain_id']:
+            token_data['domain'] = domain(payload['domain_id'])
+        if tenant_ref or payload['domain_id']:
+            token_data['roles'] = []
+            for role_id in payload['role_ids']:
+                try:
+                    role_ref = self.identity_api.get_role(context, role_id)
+                except exception.RoleNotFound:
+                    continue
+                token_data['roles'].append({'id': role_ref['id'],
+                                            'name': role_ref['name']})
+        if trust_ref:
+            token_data['OS-TRUST:trust'] = {
+                'id': trust_ref['id'],
+                'trustor_user': {'id': trust_ref['trustor_user_id']},
+                'trustee_user': {'id': trust_ref['trustee_user_id']},
+                'impersonation': trust_ref['impersonation']}
+        return {'token': token_data}
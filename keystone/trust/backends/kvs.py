@@ -36,6 +36,11 @@ def _filter_trust(ref):
 
 
 class Trust(kvs.Base, trust.Driver):
+    def __init__(self, db=None):
+        super(Trust, self).__init__(db)
+        self.db.add_index('trust_deleted', 'trust-',
+                          lambda ref: [ref['deleted']])
+
     def create_trust(self, trust_id, trust, roles):
         trust_ref = trust
         trust_ref['id'] = trust_id
@@ -73,11 +78,8 @@ class Trust(kvs.Base, trust.Driver):
         self.db.set('trust-%s' % trust_id, ref)
 
     def list_trusts(self):
-        trusts = []
-        for key, value in self.db.items():
-            if key.startswith("trust-") and not value['deleted']:
-                trusts.append(value)
-        return trusts
+        return [self.db.get(key)
+                for key in self.db.lookup('trust_deleted', False)]
 
     def list_trusts_for_trustee(self, trustee_user_id):
         trusts = []
@@ -0,0 +1,133 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compares the cost of each content type path through the API.
+
+Not collected by default; run explicitly with::
+
+    nosetests -s _content_types_benchmark.py
+
+"""
+
+import sys
+import time
+import uuid
+
+from keystone.common import serializer
+from keystone.common import wsgi
+from keystone import middleware
+from keystone.openstack.common import jsonutils
+
+import default_fixtures
+import test_content_types
+
+
+def legacy_process_request(self, request):
+    """XmlBodyMiddleware.process_request before direct XML rendering."""
+    incoming_xml = 'application/xml' in str(request.content_type)
+    if incoming_xml and request.body:
+        request.content_type = 'application/json'
+        request.body = jsonutils.dumps(serializer.from_xml(request.body))
+
+
+class ContentTypeBenchmark(test_content_types.RestfulTestCase):
+    iterations = 50
+    users = 200
+
+    def setUp(self):
+        super(ContentTypeBenchmark, self).setUp()
+        for i in range(self.users):
+            user_id = uuid.uuid4().hex
+            self.identity_api.create_user(user_id, {
+                'id': user_id,
+                'name': uuid.uuid4().hex,
+                'domain_id': default_fixtures.DEFAULT_DOMAIN_ID,
+                'password': uuid.uuid4().hex,
+                'enabled': True})
+        self.token_id = self.get_scoped_token()
+
+    def _get_token_id(self, r):
+        return r.body['access']['token']['id']
+
+    def _timed(self, fn):
+        start = time.time()
+        for i in range(self.iterations):
+            fn()
+        return (time.time() - start) / self.iterations
+
+    def _authenticate(self, content_type):
+        return self.public_request(
+            method='POST',
+            path='/v2.0/tokens',
+            content_type=content_type,
+            body={
+                'auth': {
+                    'passwordCredentials': {
+                        'username': self.user_foo['name'],
+                        'password': self.user_foo['password'],
+                    },
+                    'tenantId': self.tenant_bar['id'],
+                },
+            })
+
+    def _list_users(self, content_type):
+        return self.admin_request(
+            path='/v2.0/users',
+            token=self.token_id,
+            content_type=content_type)
+
+    def _benchmark(self, name, fn):
+        results = {
+            'json': self._timed(lambda: fn('json')),
+            'xml': self._timed(lambda: fn('xml')),
+        }
+
+        process_request = middleware.XmlBodyMiddleware.process_request
+        middleware.XmlBodyMiddleware.process_request = legacy_process_request
+        try:
+            results['xml_round_trip'] = self._timed(lambda: fn('xml'))
+        finally:
+            middleware.XmlBodyMiddleware.process_request = process_request
+
+        sys.stderr.write('\n%s (ms/request): %s\n' % (
+            name,
+            ', '.join('%s=%.2f' % (k, v * 1000)
+                      for k, v in sorted(results.iteritems()))))
+        return results
+
+    def test_authenticate(self):
+        self._benchmark('authenticate', self._authenticate)
+
+    def test_list_users(self):
+        self._benchmark('list_users', self._list_users)
+
+    def test_render(self):
+        """Compare direct XML rendering against the JSON round trip."""
+        body = {'users': [{'id': uuid.uuid4().hex,
+                           'name': uuid.uuid4().hex,
+                           'enabled': True} for i in range(self.users)]}
+
+        def direct():
+            wsgi.render_response(body=dict(body), xml=True).body
+
+        def round_trip():
+            json_body = wsgi.render_response(body=dict(body)).body
+            serializer.to_xml(jsonutils.loads(json_body))
+
+        sys.stderr.write('\nrender (ms/response): direct=%.2f, '
+                         'round_trip=%.2f\n' % (
+                             self._timed(direct) * 1000,
+                             self._timed(round_trip) * 1000))
@@ -0,0 +1,128 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Counts the LDAP searches made to expand the members of a group.
+
+Users are created in fakeldap and added to one group of
+``BENCHMARK_MEMBERS`` members (2000). The group is then listed both one user
+at a time, as list_group_users used to, and in chunks of
+``[ldap] search_chunk_size`` users.
+
+Not collected by default; run explicitly with::
+
+    nosetests -s _ldap_member_expansion_benchmark.py
+
+"""
+
+import os
+import sys
+import time
+import uuid
+
+import ldap
+
+from keystone.common.ldap import fakeldap
+from keystone import config
+from keystone import identity
+from keystone import test
+
+import default_fixtures
+
+
+CONF = config.CONF
+
+
+def legacy_list_group_users(group_api, group_id):
+    """GroupApi.list_group_users before member expansion was chunked."""
+    conn = group_api.get_connection()
+    attrs = conn.search_s(group_api._id_to_dn(group_id),
+                          ldap.SCOPE_BASE,
+                          '(objectClass=%s)' % group_api.object_class,
+                          [group_api.member_attribute])
+    users = []
+    for dn, member in attrs:
+        for user_dn in member[group_api.member_attribute]:
+            if group_api.use_dumb_member and user_dn == group_api.dumb_member:
+                continue
+            user_id = group_api.user_api._dn_to_id(user_dn)
+            users.append(group_api.user_api.get(user_id))
+    return users
+
+
+class MemberExpansionBenchmark(test.TestCase):
+    members = int(os.environ.get('BENCHMARK_MEMBERS', 2000))
+
+    def setUp(self):
+        super(MemberExpansionBenchmark, self).setUp()
+        self.config([test.etcdir('keystone.conf.sample'),
+                     test.testsdir('test_overrides.conf'),
+                     test.testsdir('backend_ldap.conf')])
+        fakeldap.FakeShelve().get_instance().clear()
+        self.identity_api = identity.Manager().driver
+
+        self.group_id = uuid.uuid4().hex
+        self.identity_api.create_group(self.group_id, {
+            'id': self.group_id,
+            'name': uuid.uuid4().hex,
+            'domain_id': default_fixtures.DEFAULT_DOMAIN_ID})
+        for i in range(self.members):
+            user_id = uuid.uuid4().hex
+            self.identity_api.create_user(user_id, {
+                'id': user_id,
+                'name': uuid.uuid4().hex,
+                'domain_id': default_fixtures.DEFAULT_DOMAIN_ID,
+                'password': uuid.uuid4().hex,
+                'enabled': True})
+            self.identity_api.group.add_user(user_id, self.group_id)
+
+        self.searches = 0
+        search_s = fakeldap.FakeLdap.search_s
+
+        def counted_search_s(conn, *args, **kwargs):
+            self.searches += 1
+            return search_s(conn, *args, **kwargs)
+
+        self.stubs.Set(fakeldap.FakeLdap, 'search_s', counted_search_s)
+
+    def tearDown(self):
+        fakeldap.FakeShelve().get_instance().clear()
+        super(MemberExpansionBenchmark, self).tearDown()
+
+    def _measure(self, fn):
+        self.searches = 0
+        start = time.time()
+        users = fn()
+        return users, self.searches, time.time() - start
+
+    def test_list_group_users(self):
+        group_api = self.identity_api.group
+        results = {
+            'per_member': self._measure(
+                lambda: legacy_list_group_users(group_api, self.group_id)),
+            'chunked': self._measure(
+                lambda: group_api.list_group_users(self.group_id)),
+        }
+
+        sys.stderr.write('\n%s members, search_chunk_size=%s\n' % (
+            self.members, CONF.ldap.search_chunk_size))
+        for name, (users, searches, elapsed) in sorted(results.iteritems()):
+            self.assertEqual(len(users), self.members)
+            sys.stderr.write('%s: %s searches, %.2fs\n' % (
+                name, searches, elapsed))
+        self.assertEqual(
+            sorted(x['id'] for x in results['chunked'][0]),
+            sorted(x['id'] for x in results['per_member'][0]))
+        self.assertTrue(results['chunked'][1] < results['per_member'][1])
@@ -0,0 +1,281 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""Measures the throughput of the main API calls through the paste pipelines.
+
+The public and admin pipelines of ``etc/keystone.conf.sample`` are loaded
+in-process and driven directly over WSGI, against each of:
+
+* ``SqlBenchmark``: every backend in sqlite
+* ``LdapBenchmark``: identity in fakeldap
+* ``MemcacheBenchmark``: tokens in a fake memcache
+
+Not collected by default; run explicitly with::
+
+    nosetests -s _throughput_benchmark.py
+
+The following environment variables tune each run:
+
+* ``BENCHMARK_ITERATIONS``: requests made for each operation (200)
+* ``BENCHMARK_CONCURRENCY``: requests in flight at once (1)
+* ``BENCHMARK_DATASET_SIZE``: users, projects and endpoints to create (100)
+* ``BENCHMARK_OUTPUT``: a file to append the JSON results to, one line per
+  backend, so that results can be compared across commits
+
+Each operation reports requests per second, the median and 99th percentile
+latency, and the number of backend calls and SQL statements per request.
+
+"""
+
+import os
+import sys
+import time
+import uuid
+
+import eventlet
+import memcache
+import webob
+
+from keystone.common import instrumentation
+from keystone.common import sql
+from keystone.openstack.common import jsonutils
+from keystone import test
+
+import default_fixtures
+import test_backend_memcache
+
+
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', 200))
+CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', 1))
+DATASET_SIZE = int(os.environ.get('BENCHMARK_DATASET_SIZE', 100))
+OUTPUT = os.environ.get('BENCHMARK_OUTPUT')
+
+ADMIN_TOKEN = 'ADMIN'
+DEFAULT_DOMAIN_ID = default_fixtures.DEFAULT_DOMAIN_ID
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+class ThroughputBenchmark(object):
+    backend = 'sql'
+    backend_config = 'backend_sql.conf'
+
+    def setUp(self):
+        super(ThroughputBenchmark, self).setUp()
+        self.configure()
+        self.opt(admin_token=ADMIN_TOKEN, instrument_backends=True)
+        self.opt_in_group('signing', token_format='UUID')
+        self.opt_in_group('catalog',
+                          driver='keystone.catalog.backends.sql.Catalog')
+
+        self.load_backends()
+        self.load_fixtures(default_fixtures)
+        self.create_dataset()
+
+        self.public_app = self.loadapp('keystone', name='main')
+        self.admin_app = self.loadapp('keystone', name='admin')
+
+    def tearDown(self):
+        sql.set_global_engine(None)
+        super(ThroughputBenchmark, self).tearDown()
+
+    def configure(self):
+        """Select the backends to benchmark."""
+        self.config([test.etcdir('keystone.conf.sample'),
+                     test.testsdir('test_overrides.conf'),
+                     test.testsdir(self.backend_config)])
+
+    def create_dataset(self):
+        for i in range(DATASET_SIZE):
+            user_id = uuid.uuid4().hex
+            self.identity_api.create_user(user_id, {
+                'id': user_id,
+                'name': uuid.uuid4().hex,
+                'domain_id': DEFAULT_DOMAIN_ID,
+                'password': uuid.uuid4().hex,
+                'enabled': True})
+            project_id = uuid.uuid4().hex
+            self.identity_api.create_project(project_id, {
+                'id': project_id,
+                'name': uuid.uuid4().hex,
+                'domain_id': DEFAULT_DOMAIN_ID,
+                'enabled': True})
+            self.identity_api.add_user_to_project(project_id, user_id)
+
+        for i in range(max(DATASET_SIZE / 10, 1)):
+            service_id = uuid.uuid4().hex
+            self.catalog_api.create_service(service_id, {
+                'id': service_id,
+                'type': uuid.uuid4().hex,
+                'name': uuid.uuid4().hex})
+            for interface in ('public', 'internal', 'admin'):
+                endpoint_id = uuid.uuid4().hex
+                self.catalog_api.create_endpoint(endpoint_id, {
+                    'id': endpoint_id,
+                    'service_id': service_id,
+                    'interface': interface,
+                    'region': 'RegionOne',
+                    'url': 'http://localhost/%s' % uuid.uuid4().hex})
+
+    def request(self, app, method, path, body=None, headers=None,
+                token=ADMIN_TOKEN):
+        headers = dict(headers or {})
+        if token:
+            headers['X-Auth-Token'] = token
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = jsonutils.dumps(body)
+        request = webob.Request.blank(path,
+                                      environ={'REMOTE_ADDR': '127.0.0.1'},
+                                      method=method,
+                                      headers=headers,
+                                      body=body)
+        response = request.get_response(app)
+        self.assertTrue(200 <= response.status_int < 300,
+                        '%s %s: %s' % (method, path, response.body))
+        return response
+
+    def v2_authenticate(self):
+        return self.request(self.public_app, 'POST', '/v2.0/tokens', body={
+            'auth': {
+                'passwordCredentials': {
+                    'username': self.user_foo['name'],
+                    'password': self.user_foo['password']},
+                'tenantId': self.tenant_bar['id']}}, token=None)
+
+    def v3_authenticate(self):
+        return self.request(self.public_app, 'POST', '/v3/auth/tokens', body={
+            'auth': {
+                'identity': {
+                    'methods': ['password'],
+                    'password': {
+                        'user': {
+                            'id': self.user_foo['id'],
+                            'password': self.user_foo['password']}}},
+                'scope': {'project': {'id': self.tenant_bar['id']}}}},
+            token=None)
+
+    def operations(self):
+        v2_token = jsonutils.loads(
+            self.v2_authenticate().body)['access']['token']['id']
+        v3_token = self.v3_authenticate().headers['X-Subject-Token']
+        admin = self.admin_app
+
+        return [
+            ('v2_authenticate', self.v2_authenticate),
+            ('v2_validate_token', lambda: self.request(
+                admin, 'GET', '/v2.0/tokens/%s' % v2_token)),
+            ('v3_authenticate', self.v3_authenticate),
+            ('v3_validate_token', lambda: self.request(
+                admin, 'GET', '/v3/auth/tokens',
+                headers={'X-Subject-Token': v3_token})),
+            ('v3_list_endpoints', lambda: self.request(
+                admin, 'GET', '/v3/endpoints')),
+            ('v2_list_users', lambda: self.request(
+                admin, 'GET', '/v2.0/users')),
+            ('v2_list_tenants', lambda: self.request(
+                admin, 'GET', '/v2.0/tenants')),
+            ('v3_list_users', lambda: self.request(
+                admin, 'GET', '/v3/users')),
+            ('v3_list_projects', lambda: self.request(
+                admin, 'GET', '/v3/projects')),
+        ]
+
+    def measure(self, operation):
+        """Run an operation ITERATIONS times, CONCURRENCY at a time.
+
+        Backend calls and SQL statements are counted per greenthread, so
+        requests in flight at the same time are each counted on their own.
+
+        """
+        def timed(i):
+            accounting = instrumentation.start_request()
+            start = time.time()
+            try:
+                operation()
+                return (time.time() - start,
+                        accounting.call_count,
+                        accounting.sql_statements)
+            finally:
+                instrumentation.end_request()
+
+        pool = eventlet.GreenPool(CONCURRENCY)
+        start = time.time()
+        samples = list(pool.imap(timed, range(ITERATIONS)))
+        elapsed = time.time() - start
+
+        latencies = sorted(x[0] for x in samples)
+        return {
+            'ops_per_second': round(ITERATIONS / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'backend_calls_per_request': (
+                float(sum(x[1] for x in samples)) / ITERATIONS),
+            'queries_per_request': (
+                float(sum(x[2] for x in samples)) / ITERATIONS),
+        }
+
+    def test_throughput(self):
+        results = dict((name, self.measure(operation))
+                       for name, operation in self.operations())
+        report = jsonutils.dumps({
+            'backend': self.backend,
+            'iterations': ITERATIONS,
+            'concurrency': CONCURRENCY,
+            'dataset_size': DATASET_SIZE,
+            'results': results,
+        }, sort_keys=True)
+
+        sys.stdout.write('\n%s\n' % report)
+        if OUTPUT:
+            with open(OUTPUT, 'a') as f:
+                f.write('%s\n' % report)
+
+
+class SqlBenchmark(ThroughputBenchmark, test.TestCase):
+    pass
+
+
+class LdapBenchmark(ThroughputBenchmark, test.TestCase):
+    backend = 'ldap'
+    backend_config = 'backend_ldap.conf'
+
+    def configure(self):
+        super(LdapBenchmark, self).configure()
+        self.opt_in_group('sql', connection='sqlite://')
+
+        # imported here so that the other backends can be benchmarked
+        # without python-ldap installed
+        from keystone.common.ldap import fakeldap
+        fakeldap.FakeShelve().get_instance().clear()
+
+
+class MemcacheBenchmark(ThroughputBenchmark, test.TestCase):
+    backend = 'memcache'
+
+    def configure(self):
+        super(MemcacheBenchmark, self).configure()
+        self.opt_in_group('token',
+                          driver='keystone.token.backends.memcache.Token')
+
+        # every token driver must see the same memcached
+        client = test_backend_memcache.MemcacheClient()
+        self.stubs.Set(memcache, 'Client', lambda *args, **kwargs: client)
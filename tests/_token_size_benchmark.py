@@ -0,0 +1,105 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compares the size and signing cost of PKI and PKIZ tokens.
+
+Tokens are signed with the example certificates, for a v2 token carrying a
+service catalog of ``BENCHMARK_REGIONS`` regions (20), each with an
+endpoint for every service.
+
+Not collected by default; run explicitly with::
+
+    nosetests -s _token_size_benchmark.py
+
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+
+from keystone.common import cms
+from keystone import test
+
+
+SERVICES = ['compute', 'identity', 'image', 'network', 'object-store',
+            'orchestration', 'volume', 'ec2']
+
+
+def build_token_data(regions):
+    catalog = []
+    for service_type in SERVICES:
+        endpoints = []
+        for i in range(regions):
+            url = 'https://%s.region%s.example.com:8774/v2/%s' % (
+                service_type, i, uuid.uuid4().hex)
+            endpoints.append({'region': 'region%s' % i,
+                              'publicURL': url,
+                              'internalURL': url,
+                              'adminURL': url})
+        catalog.append({'type': service_type,
+                        'name': service_type,
+                        'endpoints': endpoints,
+                        'endpoints_links': []})
+    return {'access': {
+        'token': {'id': 'placeholder',
+                  'expires': '2013-05-01T00:00:00Z',
+                  'tenant': {'id': uuid.uuid4().hex,
+                             'name': uuid.uuid4().hex}},
+        'user': {'id': uuid.uuid4().hex,
+                 'name': uuid.uuid4().hex,
+                 'roles': [{'name': 'Member'}, {'name': 'admin'}],
+                 'roles_links': []},
+        'serviceCatalog': catalog,
+        'metadata': {'is_admin': 0, 'roles': [uuid.uuid4().hex]}}}
+
+
+class TokenSizeBenchmark(test.TestCase):
+    iterations = int(os.environ.get('BENCHMARK_ITERATIONS', 20))
+    regions = int(os.environ.get('BENCHMARK_REGIONS', 20))
+
+    def setUp(self):
+        super(TokenSizeBenchmark, self).setUp()
+        self.certfile = test.rootdir('examples/pki/certs/signing_cert.pem')
+        self.keyfile = test.rootdir('examples/pki/private/signing_key.pem')
+        self.ca_certs = test.rootdir('examples/pki/certs/cacert.pem')
+        self.text = json.dumps(build_token_data(self.regions))
+
+    def _timed(self, fn):
+        start = time.time()
+        for i in range(self.iterations):
+            rv = fn()
+        return rv, (time.time() - start) / self.iterations
+
+    def test_token_size(self):
+        results = {}
+        for name, sign in (('PKI', cms.cms_sign_token),
+                           ('PKIZ', cms.pkiz_sign)):
+            token_id, sign_time = self._timed(
+                lambda: sign(self.text, self.certfile, self.keyfile))
+            verified, verify_time = self._timed(
+                lambda: cms.verify_token(token_id, self.certfile,
+                                         self.ca_certs))
+            self.assertEqual(verified, self.text)
+            results[name] = (len(token_id), sign_time, verify_time)
+
+        sys.stderr.write('\ndocument: %s bytes\n' % len(self.text))
+        for name, (size, sign_time, verify_time) in sorted(
+                results.iteritems()):
+            sys.stderr.write('%s: %s bytes, sign=%.2fms, verify=%.2fms\n' % (
+                name, size, sign_time * 1000, verify_time * 1000))
+        self.assertTrue(results['PKIZ'][0] < results['PKI'][0])
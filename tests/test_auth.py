@@ -14,14 +14,19 @@
 
 import copy
 import datetime
+import shutil
+import tempfile
 import uuid
 
+import nose.exc
+
 from keystone import auth
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import timeutils
 from keystone import test
 from keystone import token
+from keystone.token import encrypted
 from keystone import trust
 
 import default_fixtures
@@ -791,6 +796,167 @@ class TokenExpirationTest(AuthTest):
         self._maintain_token_expiration()
 
 
+class EncryptedTokens(object):
+    """Issues encrypted tokens, from a new key repository for each test."""
+
+    def setUp(self, *args, **kwargs):
+        super(EncryptedTokens, self).setUp(*args, **kwargs)
+        if encrypted.fernet is None:
+            raise nose.exc.SkipTest('cryptography is not installed')
+        self.key_repository = tempfile.mkdtemp()
+        self.opt_in_group('signing', token_format='ENCRYPTED',
+                          key_repository=self.key_repository)
+        encrypted.get_key_repository().rotate()
+
+    def tearDown(self):
+        shutil.rmtree(self.key_repository, ignore_errors=True)
+        super(EncryptedTokens, self).tearDown()
+
+
+class EncryptedAuthWithToken(EncryptedTokens, AuthWithToken):
+    pass
+
+
+class EncryptedAuthWithTrust(EncryptedTokens, AuthWithTrust):
+    def assert_trust_token_revoked(self, token_id):
+        self.assertRaises(exception.TokenNotFound,
+                          self.controller.token_api.get_token, {}, token_id)
+
+    def test_delete_tokens_for_user_invalidates_tokens_from_trust(self):
+        auth_response = self.fetch_v2_token_from_trust()
+        trust_token_id = auth_response['access']['token']['id']
+        self.assertTrue(encrypted.is_encrypted_token(trust_token_id))
+        self.controller.token_api.get_token({}, trust_token_id)
+        self.trust_controller._delete_tokens_for_user(
+            {},
+            self.trustee['id'])
+        self.assert_trust_token_revoked(trust_token_id)
+
+    def test_delete_trust_revokes_token(self):
+        context = {'token_id': self.unscoped_token['access']['token']['id']}
+        auth_response = self.fetch_v2_token_from_trust()
+        trust_id = self.new_trust['id']
+        trust_token_id = auth_response['access']['token']['id']
+        self.controller.token_api.get_token({}, trust_token_id)
+        self.trust_controller.delete_trust(context, trust_id=trust_id)
+        self.assert_trust_token_revoked(trust_token_id)
+
+
+class EncryptedTokenExpirationTest(EncryptedTokens, TokenExpirationTest):
+    def test_maintain_encrypted_token_expiration(self):
+        self._maintain_token_expiration()
+
+
+class EncryptedTokenTest(EncryptedTokens, AuthTest):
+    def authenticate(self, user_ref, tenant_id=None):
+        body_dict = _build_user_auth(username=user_ref['name'],
+                                     password=user_ref['password'],
+                                     tenant_id=tenant_id)
+        token_ref = self.controller.authenticate({}, body_dict)
+        return token_ref['access']['token']['id']
+
+    def assertTokenValid(self, token_id):
+        return self.controller.validate_token(
+            dict(is_admin=True, query_string={}), token_id=token_id)
+
+    def assertTokenRevoked(self, token_id):
+        self.assertRaises(exception.TokenNotFound,
+                          self.controller.validate_token,
+                          dict(is_admin=True, query_string={}),
+                          token_id=token_id)
+
+    def test_token_is_not_persisted(self):
+        token_id = self.authenticate(self.user_foo, self.tenant_bar['id'])
+        self.assertTrue(encrypted.is_encrypted_token(token_id))
+        self.assertRaises(exception.TokenNotFound,
+                          self.controller.token_api.driver.get_token,
+                          token.unique_id(token_id))
+
+        token_ref = self.controller.token_api.get_token({}, token_id)
+        self.assertEqual(token_ref['user']['id'], self.user_foo['id'])
+        self.assertEqual(token_ref['tenant']['id'], self.tenant_bar['id'])
+        r = self.assertTokenValid(token_id)
+        self.assertEqual(r['access']['user']['id'], self.user_foo['id'])
+        self.assertEqual(r['access']['token']['tenant']['id'],
+                         self.tenant_bar['id'])
+
+    def test_delete_token(self):
+        token_id = self.authenticate(self.user_foo)
+        other_token_id = self.authenticate(self.user_foo)
+        self.controller.token_api.delete_token({}, token_id)
+        self.assertTokenRevoked(token_id)
+        self.assertTokenValid(other_token_id)
+        self.assertRaises(exception.TokenNotFound,
+                          self.controller.token_api.delete_token, {}, token_id)
+
+    def test_delete_tokens_for_user(self):
+        token_id = self.authenticate(self.user_foo)
+        other_token_id = self.authenticate(self.user_two)
+        self.controller.token_api.delete_tokens({}, self.user_foo['id'])
+        self.assertTokenRevoked(token_id)
+        self.assertTokenValid(other_token_id)
+
+        timeutils.set_time_override(
+            timeutils.utcnow() + datetime.timedelta(seconds=1))
+        try:
+            self.assertTokenValid(self.authenticate(self.user_foo))
+        finally:
+            timeutils.clear_time_override()
+
+    def test_delete_tokens_for_project(self):
+        self.identity_api.add_user_to_project(self.tenant_baz['id'],
+                                              self.user_foo['id'])
+        token_id = self.authenticate(self.user_foo, self.tenant_bar['id'])
+        other_token_id = self.authenticate(self.user_foo,
+                                           self.tenant_baz['id'])
+        self.controller.token_api.delete_tokens(
+            {}, self.user_foo['id'], tenant_id=self.tenant_bar['id'])
+        self.assertTokenRevoked(token_id)
+        self.assertTokenValid(other_token_id)
+
+    def test_key_rotation(self):
+        repository = encrypted.get_key_repository()
+        token_id = self.authenticate(self.user_foo)
+        for i in range(CONF.signing.max_active_keys - 1):
+            repository.rotate()
+            self.assertTokenValid(token_id)
+        new_token_id = self.authenticate(self.user_foo)
+        repository.rotate()
+        self.assertTokenRevoked(token_id)
+        self.assertTokenValid(new_token_id)
+
+    def test_invalid_token(self):
+        self.assertTokenRevoked(encrypted.PREFIX + uuid.uuid4().hex)
+
+    def test_disabled_user(self):
+        token_id = self.authenticate(self.user_foo)
+        self.identity_api.update_user(self.user_foo['id'], {'enabled': False})
+        self.assertTokenRevoked(token_id)
+
+    def test_disabled_project(self):
+        token_id = self.authenticate(self.user_foo, self.tenant_bar['id'])
+        self.identity_api.update_project(self.tenant_bar['id'],
+                                         {'enabled': False})
+        self.assertTokenRevoked(token_id)
+
+    def test_disabled_domain(self):
+        token_id = self.authenticate(self.user_foo)
+        domain_ref = self.identity_api.get_domain(
+            default_fixtures.DEFAULT_DOMAIN_ID)
+        domain_ref['enabled'] = False
+        self.identity_api.update_domain(domain_ref['id'], domain_ref)
+        self.assertTokenRevoked(token_id)
+
+    def test_expired_token(self):
+        timeutils.set_time_override()
+        try:
+            token_id = self.authenticate(self.user_foo)
+            timeutils.advance_time_seconds(CONF.token.expiration + 1)
+            self.assertTokenRevoked(token_id)
+        finally:
+            timeutils.clear_time_override()
+
+
 class NonDefaultAuthTest(test.TestCase):
 
     def test_add_non_default_auth_method(self):
@@ -1301,6 +1301,97 @@ class IdentityTests(object):
         #TODO(chungg):add test case once expected behaviour defined
         pass
 
+    def test_delete_domain_contents(self):
+        role1 = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex}
+        self.identity_api.create_role(role1['id'], role1)
+        domain1 = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex}
+        self.identity_api.create_domain(domain1['id'], domain1)
+        project1 = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex,
+                    'domain_id': domain1['id']}
+        self.identity_man.create_project({}, project1['id'], project1)
+        user1 = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex,
+                 'domain_id': domain1['id'], 'password': uuid.uuid4().hex,
+                 'enabled': True}
+        self.identity_man.create_user({}, user1['id'], user1)
+        group1 = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex,
+                  'domain_id': domain1['id'], 'enabled': True}
+        self.identity_man.create_group({}, group1['id'], group1)
+        self.identity_api.create_grant(user_id=user1['id'],
+                                       project_id=project1['id'],
+                                       role_id=role1['id'])
+        self.identity_api.create_grant(group_id=group1['id'],
+                                       domain_id=domain1['id'],
+                                       role_id=role1['id'])
+        self.identity_api.add_user_to_group(user_id=user1['id'],
+                                            group_id=group1['id'])
+        self.identity_api.add_user_to_group(user_id=self.user_foo['id'],
+                                            group_id=group1['id'])
+
+        user_ids = self.identity_api.delete_domain_contents(domain1['id'])
+        self.assertEqual(sorted(user_ids),
+                         sorted([user1['id'], self.user_foo['id']]))
+        self.assertRaises(exception.ProjectNotFound,
+                          self.identity_api.get_project,
+                          project1['id'])
+        self.assertRaises(exception.UserNotFound,
+                          self.identity_api.get_user,
+                          user1['id'])
+        self.assertRaises(exception.GroupNotFound,
+                          self.identity_api.get_group,
+                          group1['id'])
+        self.assertEqual(
+            self.identity_api.list_groups_for_user(self.user_foo['id']), [])
+        self.identity_api.get_domain(domain1['id'])
+
+    def test_batch_create_and_update_users(self):
+        users = [{'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex,
+                  'domain_id': DEFAULT_DOMAIN_ID,
+                  'password': uuid.uuid4().hex, 'enabled': True}
+                 for i in range(3)]
+        duplicate = {'id': uuid.uuid4().hex, 'name': users[0]['name'],
+                     'domain_id': DEFAULT_DOMAIN_ID, 'enabled': True}
+        results = self.identity_api.create_users(users + [duplicate])
+        self.assertEqual([x['id'] for x in results[:3]],
+                         [x['id'] for x in users])
+        self.assertIsInstance(results[3], exception.Conflict)
+        for user in users:
+            user_ref = self.identity_api.get_user(user['id'])
+            self.assertEqual(user_ref['name'], user['name'])
+        self.assertRaises(exception.UserNotFound,
+                          self.identity_api.get_user,
+                          duplicate['id'])
+
+        results = self.identity_api.update_users([
+            {'id': users[0]['id'], 'enabled': False},
+            {'id': uuid.uuid4().hex, 'enabled': False}])
+        self.assertFalse(results[0]['enabled'])
+        self.assertIsInstance(results[1], exception.UserNotFound)
+        self.assertFalse(self.identity_api.get_user(users[0]['id'])['enabled'])
+        self.assertTrue(self.identity_api.get_user(users[1]['id'])['enabled'])
+
+    def test_batch_create_grants(self):
+        grants = [{'user_id': self.user_foo['id'],
+                   'project_id': self.tenant_bar['id'],
+                   'role_id': 'admin'},
+                  {'user_id': self.user_foo['id'],
+                   'project_id': self.tenant_bar['id'],
+                   'role_id': uuid.uuid4().hex},
+                  {'user_id': self.user_foo['id'],
+                   'domain_id': DEFAULT_DOMAIN_ID,
+                   'role_id': 'admin'}]
+        results = self.identity_api.create_grants(grants)
+        self.assertEqual(results[0], grants[0])
+        self.assertIsInstance(results[1], exception.RoleNotFound)
+        self.assertEqual(results[2], grants[2])
+        roles_ref = self.identity_api.list_grants(
+            user_id=self.user_foo['id'],
+            project_id=self.tenant_bar['id'])
+        self.assertIn('admin', [x['id'] for x in roles_ref])
+        roles_ref = self.identity_api.list_grants(
+            user_id=self.user_foo['id'],
+            domain_id=DEFAULT_DOMAIN_ID)
+        self.assertEqual([x['id'] for x in roles_ref], ['admin'])
+
     def test_role_crud(self):
         role = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex}
         self.identity_api.create_role(role['id'], role)
@@ -2100,6 +2191,49 @@ class TokenTests(object):
             data_ref['id'])
         return token_id
 
+    def test_delete_tokens_for_users(self):
+        token_id1 = self.create_token_sample_data()
+        token_id2 = self.create_token_sample_data(tenant_id=uuid.uuid4().hex)
+        other_id = self._create_token_id()
+        self.token_api.create_token(other_id,
+                                    {'id': other_id,
+                                     'user': {'id': uuid.uuid4().hex}})
+
+        self.token_api.delete_tokens_for_users(['testuserid',
+                                                uuid.uuid4().hex])
+        self.assertEqual(self.token_api.list_tokens('testuserid'), [])
+        for token_id in (token_id1, token_id2):
+            self.assertRaises(exception.TokenNotFound,
+                              self.token_api.get_token, token_id)
+        self.token_api.get_token(other_id)
+
+    def test_delete_tokens_for_domain(self):
+        domain_id = uuid.uuid4().hex
+        refs = {
+            'user': {'user': {'id': uuid.uuid4().hex,
+                              'domain_id': domain_id}},
+            'project': {'user': {'id': uuid.uuid4().hex,
+                                 'domain_id': uuid.uuid4().hex},
+                        'tenant': {'id': uuid.uuid4().hex,
+                                   'domain_id': domain_id}},
+            'scope': {'user': {'id': uuid.uuid4().hex,
+                               'domain': {'id': uuid.uuid4().hex}},
+                      'token_data': {'token': {'domain': {'id': domain_id}}}},
+            'other': {'user': {'id': uuid.uuid4().hex,
+                               'domain_id': uuid.uuid4().hex}},
+        }
+        token_ids = {}
+        for name, data in refs.iteritems():
+            token_id = self._create_token_id()
+            self.token_api.create_token(token_id, dict(data, id=token_id))
+            token_ids[name] = token_id
+
+        self.token_api.delete_tokens_for_domain(domain_id)
+        for name in ('user', 'project', 'scope'):
+            self.assertRaises(exception.TokenNotFound,
+                              self.token_api.get_token, token_ids[name])
+        self.token_api.get_token(token_ids['other'])
+
     def test_list_revoked_tokens_returns_empty_list(self):
         revoked_ids = [x['id'] for x in self.token_api.list_revoked_tokens()]
         self.assertEqual(revoked_ids, [])
@@ -2111,6 +2245,31 @@ class TokenTests(object):
         self.check_list_revoked_tokens([self.delete_token()
                                         for x in xrange(2)])
 
+    def test_revocation_events(self):
+        self.assertEqual(self.token_api.list_revocation_events(), [])
+
+        now = timeutils.utcnow()
+        user_event = {'user_id': uuid.uuid4().hex,
+                      'project_id': None,
+                      'issued_before': now,
+                      'expires': now + datetime.timedelta(minutes=1)}
+        token_event = {'token_id': uuid.uuid4().hex,
+                       'issued_before': now,
+                       'expires': now + datetime.timedelta(minutes=2)}
+        expired_event = {'trust_id': uuid.uuid4().hex,
+                         'issued_before': now,
+                         'expires': now - datetime.timedelta(minutes=1)}
+        for event_ref in (user_event, token_event, expired_event):
+            self.token_api.create_revocation_event(event_ref)
+
+        events = sorted(self.token_api.list_revocation_events(),
+                        key=lambda event_ref: event_ref['expires'])
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0]['user_id'], user_event['user_id'])
+        self.assertEqual(events[0]['issued_before'], now)
+        self.assertEqual(events[1]['token_id'], token_event['token_id'])
+        self.assertEqual(events[1].get('user_id'), None)
+
 
 class TrustTests(object):
     def create_sample_trust(self, new_id):
@@ -14,10 +14,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import uuid
+import copy
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
 import nose.exc
 
 from keystone import catalog
 from keystone.catalog.backends import kvs as catalog_kvs
+from keystone.common import kvs
 from keystone import exception
 from keystone import identity
 from keystone import test
@@ -28,6 +36,318 @@ import default_fixtures
 import test_backend
 
 
+class KvsIndexes(test.TestCase):
+    def setUp(self):
+        super(KvsIndexes, self).setUp()
+        self.db = kvs.DictKvs()
+        self.db.set('user-a', {'tenants': ['x', 'y']})
+        self.db.add_index('user_tenant', 'user-',
+                          lambda ref: ref.get('tenants', []))
+
+    def test_existing_records_are_indexed(self):
+        self.assertEqual(self.db.lookup('user_tenant', 'x'), ['user-a'])
+
+    def test_set_and_delete(self):
+        self.db.set('user-b', {'tenants': ['y']})
+        self.db.set('tenant-y', {'tenants': ['y']})
+        self.assertEqual(sorted(self.db.lookup('user_tenant', 'y')),
+                         ['user-a', 'user-b'])
+
+        self.db.set('user-a', {'tenants': ['z']})
+        self.assertEqual(self.db.lookup('user_tenant', 'x'), [])
+        self.assertEqual(self.db.lookup('user_tenant', 'y'), ['user-b'])
+        self.assertEqual(self.db.lookup('user_tenant', 'z'), ['user-a'])
+
+        self.db.delete('user-b')
+        self.assertEqual(self.db.lookup('user_tenant', 'y'), [])
+
+    def test_record_modified_in_place(self):
+        self.assertRaises(TypeError,
+                          self.db['user-a']['tenants'].append, 'z')
+        self.db.get('user-a')['tenants'].append('z')
+        self.assertEqual(self.db.lookup('user_tenant', 'z'), [])
+        self.db.set('user-a', {'tenants': []})
+        self.assertEqual(self.db.indexes['user_tenant'].entries, {})
+
+    def test_clear(self):
+        self.db.clear()
+        self.assertEqual(self.db.lookup('user_tenant', 'x'), [])
+
+    def test_ordered_index(self):
+        now = datetime.datetime.utcnow()
+        self.db.add_index('expiry', 'token-',
+                          lambda ref: ref.get('expires'),
+                          ordered=True)
+        for i in range(-2, 3):
+            expires = now + datetime.timedelta(minutes=i)
+            self.db.set('token-%s' % i, {'expires': expires})
+        self.db.set('token-none', {'expires': None})
+        self.assertEqual(self.db.lookup('expiry', now),
+                         ['token-1', 'token-2'])
+
+        self.db.delete('token-1')
+        self.db.set('token-2', {'expires': now - datetime.timedelta(1)})
+        self.assertEqual(self.db.lookup('expiry', now), [])
+
+
+class KvsCopyOnWrite(test.TestCase):
+    def setUp(self):
+        super(KvsCopyOnWrite, self).setUp()
+        self.db = kvs.DictKvs()
+        self.db.set('token-a', {'user': {'id': 'a', 'roles': ['x']},
+                                'metadata': {'roles': [{'id': 'x'}]}})
+
+    def test_nested_mutation_is_private(self):
+        ref = self.db.get('token-a')
+        ref['user']['id'] = 'b'
+        ref['user']['roles'].append('y')
+        ref['metadata']['roles'][0]['id'] = 'y'
+        ref.setdefault('extras', {})['k'] = 'v'
+
+        self.assertEqual(self.db.get('token-a'),
+                         {'user': {'id': 'a', 'roles': ['x']},
+                          'metadata': {'roles': [{'id': 'x'}]}})
+        self.assertEqual(ref['user'], {'id': 'b', 'roles': ['x', 'y']})
+
+    def test_iteration_returns_views(self):
+        ref = self.db.get('token-a')
+        for value in ref.values():
+            value.clear()
+        for key, value in ref.items():
+            self.assertEqual(value, {})
+        for role in self.db.get('token-a')['metadata']['roles']:
+            role['id'] = 'y'
+        self.assertEqual(self.db['token-a']['metadata']['roles'],
+                         [{'id': 'x'}])
+
+    def test_repeated_reads_share_writes(self):
+        ref = self.db.get('token-a')
+        roles = ref['user']['roles']
+        ref['user']['roles'].append('y')
+        roles.append('z')
+        self.assertEqual(ref['user']['roles'], ['x', 'y', 'z'])
+
+    def test_untouched_values_are_shared(self):
+        ref = self.db.get('token-a')
+        self.assertIs(dict.__getitem__(ref, 'user'),
+                      self.db['token-a']['user'])
+        ref['user']
+        self.assertIsNot(dict.__getitem__(ref, 'user'),
+                         self.db['token-a']['user'])
+
+    def test_stored_records_are_read_only(self):
+        ref = self.db['token-a']
+        self.assertRaises(TypeError, ref.__setitem__, 'user', {})
+        self.assertRaises(TypeError, ref['user']['roles'].append, 'y')
+        # dict() copies the view without going through its methods
+        ref = dict(self.db.get('token-a'), name='x')
+        self.assertRaises(TypeError, ref['user'].__setitem__, 'id', 'b')
+        self.assertEqual(self.db['token-a']['user'],
+                         {'id': 'a', 'roles': ['x']})
+
+    def test_copies_are_mutable(self):
+        ref = copy.deepcopy(self.db['token-a'])
+        ref['user']['roles'].append('y')
+        ref = copy.deepcopy(self.db.get('token-a'))
+        ref['metadata']['roles'][0]['id'] = 'y'
+        self.assertEqual(self.db['token-a']['metadata']['roles'],
+                         [{'id': 'x'}])
+
+    def test_non_container_value(self):
+        self.db.set('s', 'abc')
+        self.assertEqual(self.db.get('s'), 'abc')
+        self.assertEqual(self.db['s'], 'abc')
+
+    def test_set_is_private(self):
+        ref = {'user': {'roles': ['x']}}
+        self.db.set('token-b', ref)
+        ref['user']['roles'].append('y')
+        self.assertEqual(self.db['token-b'], {'user': {'roles': ['x']}})
+
+    def test_set_view(self):
+        ref = self.db.get('token-a')
+        ref['user']['id'] = 'b'
+        self.db.set('token-b', ref)
+        self.db.get('token-b')['user']['roles'].append('y')
+        self.assertEqual(self.db['token-b']['user'],
+                         {'id': 'b', 'roles': ['x']})
+        self.assertEqual(self.db['token-a']['user'],
+                         {'id': 'a', 'roles': ['x']})
+        # only the part of the record that was modified was copied
+        self.assertIs(self.db['token-b']['metadata'],
+                      self.db['token-a']['metadata'])
+
+
+class FileKvs(test.TestCase):
+    def setUp(self):
+        super(FileKvs, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'kvs.log')
+        self.db = kvs.FileKvs(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+        super(FileKvs, self).tearDown()
+
+    def reopen(self):
+        self.db.close()
+        self.db = kvs.FileKvs(self.path)
+        return self.db
+
+    def test_persistence(self):
+        expires = datetime.datetime(2013, 1, 1)
+        self.db.set('token-a', {'expires': expires, 'roles': ['x']})
+        self.db.set('token-b', {'expires': None})
+        self.db.set('token-b', {'expires': expires})
+        self.db.set('token-c', {})
+        self.db.delete('token-c')
+
+        db = self.reopen()
+        self.assertEqual(db.get('token-a'),
+                         {'expires': expires, 'roles': ['x']})
+        self.assertEqual(db.get('token-b'), {'expires': expires})
+        self.assertRaises(exception.NotFound, db.get, 'token-c')
+
+    def test_shared_between_stores(self):
+        other = kvs.FileKvs(self.path)
+        other.add_index('user_tenant', 'user-',
+                        lambda ref: ref.get('tenants', []))
+        try:
+            self.db.set('user-a', {'tenants': ['x']})
+            self.assertEqual(other.get('user-a'), {'tenants': ['x']})
+            self.assertEqual(other.lookup('user_tenant', 'x'), ['user-a'])
+
+            other.delete('user-a')
+            self.assertRaises(exception.NotFound, self.db.get, 'user-a')
+            self.assertRaises(exception.NotFound, self.db.delete, 'user-a')
+
+            self.db.clear()
+            other.set('user-b', {})
+            self.assertEqual(self.db.keys(), ['user-b'])
+            self.assertEqual(other.lookup('user_tenant', 'x'), [])
+        finally:
+            other.close()
+
+    def test_dict_reads_refresh(self):
+        other = kvs.FileKvs(self.path)
+        try:
+            self.db.set('a', {'roles': ['x']})
+            self.assertTrue('a' in other)
+            self.assertEqual(other['a'], {'roles': ['x']})
+            self.assertEqual(other.items(), [('a', {'roles': ['x']})])
+            self.assertEqual(list(other), ['a'])
+            self.assertEqual(len(other), 1)
+
+            self.db.delete('a')
+            self.assertFalse('a' in other)
+            self.assertEqual(other.values(), [])
+        finally:
+            other.close()
+
+    def test_values_are_copied(self):
+        ref = {'user': {'roles': ['x']}}
+        self.db.set('a', ref)
+        ref['user']['roles'].append('y')
+        self.db.set('s', 'abc')
+
+        db = self.reopen()
+        self.assertEqual(db.get('a'), {'user': {'roles': ['x']}})
+        self.assertEqual(db.get('s'), 'abc')
+
+    def test_json_log(self):
+        expires = datetime.datetime(2013, 1, 1, 12, 30, 0, 5)
+        self.db.set('token-a', {'expires': expires, 'roles': [u'\xe9']})
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(json.loads(data[kvs.FileKvs.HEADER.size:]),
+                         ['token-a',
+                          {'expires': {'__datetime__':
+                                       '2013-01-01T12:30:00.000005'},
+                           'roles': [u'\xe9']}])
+        self.assertEqual(self.reopen().get('token-a'),
+                         {'expires': expires, 'roles': [u'\xe9']})
+        self.assertRaises(TypeError, self.db.set, 'a', {'x': object()})
+
+    def test_reads_skip_unchanged_log(self):
+        other = kvs.FileKvs(self.path)
+        try:
+            self.db.set('a', {})
+            stats = []
+            stat = os.stat
+
+            def counted_stat(path):
+                stats.append(path)
+                return stat(path)
+
+            self.stubs.Set(os, 'stat', counted_stat)
+            self.assertEqual(other.get('a'), {})
+            self.assertEqual(len(stats), 1)
+            other.get('a')
+            self.assertTrue('a' in self.db)
+            self.assertEqual(len(stats), 1)
+
+            # the writer always checks the log, the reader because it grew
+            self.db.set('b', {})
+            self.assertEqual(other.get('b'), {})
+            self.assertEqual(len(stats), 3)
+        finally:
+            other.close()
+
+    def test_compaction(self):
+        self.db.MIN_COMPACT_SIZE = 0
+        self.db.compact_ratio = 40
+        self.db.set('a', {'value': 'x' * 100})
+        self.db.set('b', {'value': 'x' * 100})
+        size = os.path.getsize(self.path)
+        self.db.set('a', {'value': 'y' * 100})
+        self.db.set('a', {'value': 'z' * 100})
+
+        # the log is compacted in the background, not by the write
+        self.assertTrue(os.path.getsize(self.path) > size)
+        self.db._compactor.wait()
+        self.assertTrue(os.path.getsize(self.path) <= size)
+        self.assertEqual(self.db.get('a'), {'value': 'z' * 100})
+        db = self.reopen()
+        self.assertEqual(db.get('a'), {'value': 'z' * 100})
+        self.assertEqual(db.get('b'), {'value': 'x' * 100})
+
+    def test_compaction_by_another_store(self):
+        other = kvs.FileKvs(self.path)
+        try:
+            self.db.set('a', {})
+            other.set('b', {})
+            other.compact()
+            self.db.set('c', {})
+            self.assertEqual(sorted(self.db.keys()), ['a', 'b', 'c'])
+            self.assertEqual(sorted(other.keys()), ['a', 'b', 'c'])
+        finally:
+            other.close()
+
+    def test_incomplete_record_discarded(self):
+        self.db.set('a', {})
+        self.db.set('b', {})
+        self.db.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(size - 1)
+
+        db = kvs.FileKvs(self.path)
+        self.assertEqual(db.keys(), ['a'])
+        db.set('c', {})
+        self.assertEqual(sorted(self.reopen().keys()), ['a', 'c'])
+
+    def test_default_db(self):
+        self.opt_in_group('kvs', path=self.path)
+        try:
+            self.assertIsInstance(kvs.Base().db, kvs.FileKvs)
+            self.assertIs(kvs.Base().db, kvs.Base().db)
+        finally:
+            kvs.FILEDBS.pop(self.path).close()
+        self.opt_in_group('kvs', path=None)
+        self.assertIs(kvs.Base().db, kvs.INMEMDB)
+
+
 class KvsIdentity(test.TestCase, test_backend.IdentityTests):
     def setUp(self):
         super(KvsIdentity, self).setUp()
@@ -74,6 +394,42 @@ class KvsToken(test.TestCase, test_backend.TokenTests):
         super(KvsToken, self).setUp()
         self.token_api = token_kvs.Token(db={})
 
+    def test_returned_token_is_private(self):
+        token_id = uuid.uuid4().hex
+        data = {'id': token_id, 'user': {'id': 'a'},
+                'metadata': {'roles': ['x']}}
+        ref = self.token_api.create_token(token_id, data)
+        ref['metadata']['roles'].append('y')
+        data['metadata']['roles'].append('z')
+
+        ref = self.token_api.get_token(token_id)
+        self.assertEqual(ref['metadata'], {'roles': ['x']})
+        ref['user']['id'] = 'b'
+        self.assertEqual(self.token_api.get_token(token_id)['user'],
+                         {'id': 'a'})
+
+    def test_list_revoked_tokens_regardless_of_expiry(self):
+        expired = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        for token_id, expires in (('expired', expired), ('never', None)):
+            self.token_api.db.set('revoked-token-%s' % token_id,
+                                  {'id': token_id, 'expires': expires})
+        revoked = dict((x['id'], x['expires'])
+                       for x in self.token_api.list_revoked_tokens())
+        self.assertEqual(revoked, {'expired': expired, 'never': None})
+
+
+class FileKvsToken(KvsToken):
+    def setUp(self):
+        super(FileKvsToken, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.token_api = token_kvs.Token(
+            db=kvs.FileKvs(os.path.join(self.tmpdir, 'kvs.log')))
+
+    def tearDown(self):
+        self.token_api.db.close()
+        shutil.rmtree(self.tmpdir)
+        super(FileKvsToken, self).tearDown()
+
 
 class KvsTrust(test.TestCase, test_backend.TrustTests):
     def setUp(self):
@@ -16,6 +16,9 @@
 
 import uuid
 
+import eventlet
+import sqlalchemy
+
 from keystone import catalog
 from keystone.common import sql
 from keystone import config
@@ -224,6 +227,40 @@ class SqlIdentity(SqlTests, test_backend.IdentityTests):
         self.assertEqual(arbitrary_value, ref[arbitrary_key])
         self.assertEqual(arbitrary_value, ref['extra'][arbitrary_key])
 
+    def test_delete_domain_contents_deletes_credentials_and_grants(self):
+        domain_id = uuid.uuid4().hex
+        self.identity_api.create_domain(domain_id, {'id': domain_id,
+                                                    'name': domain_id})
+        project = {'id': uuid.uuid4().hex,
+                   'name': uuid.uuid4().hex,
+                   'domain_id': domain_id}
+        self.identity_man.create_project({}, project['id'], project)
+        self.identity_api.add_role_to_user_and_project(
+            self.user_foo['id'], project['id'], 'member')
+        user = {'id': uuid.uuid4().hex,
+                'name': uuid.uuid4().hex,
+                'domain_id': domain_id,
+                'password': uuid.uuid4().hex}
+        self.identity_man.create_user({}, user['id'], user)
+        credential_ids = [uuid.uuid4().hex, uuid.uuid4().hex]
+        for credential_id, user_id in zip(credential_ids,
+                                          [user['id'], self.user_foo['id']]):
+            self.identity_api.create_credential(
+                credential_id, {'id': credential_id,
+                                'user_id': user_id,
+                                'project_id': None,
+                                'blob': uuid.uuid4().hex,
+                                'type': 'ec2'})
+
+        self.identity_api.delete_domain_contents(domain_id)
+        self.assertRaises(exception.CredentialNotFound,
+                          self.identity_api.get_credential,
+                          credential_ids[0])
+        self.identity_api.get_credential(credential_ids[1])
+        self.assertNotIn(
+            project['id'],
+            self.identity_api.get_projects_for_user(self.user_foo['id']))
+
 
 class SqlTrust(SqlTests, test_backend.TrustTests):
     pass
@@ -305,3 +342,188 @@ class SqlCatalog(SqlTests, test_backend.CatalogTests):
 
 class SqlPolicy(SqlTests, test_backend.PolicyTests):
     pass
+
+
+class SqlRequest(SqlTests):
+    def tearDown(self):
+        sql.end_request()
+        super(SqlRequest, self).tearDown()
+
+    def test_backends_share_connection(self):
+        sql.start_request()
+        identity_session = self.identity_api.get_session()
+        token_session = self.token_api.get_session()
+        self.assertIs(identity_session.bind, token_session.bind)
+        self.assertIs(identity_session.bind,
+                      self.catalog_api.get_session().bind)
+
+        # writes made through one backend are seen by the others
+        user = {'id': uuid.uuid4().hex, 'name': uuid.uuid4().hex,
+                'domain_id': DEFAULT_DOMAIN_ID, 'password': uuid.uuid4().hex}
+        self.identity_api.create_user(user['id'], user)
+        self.identity_api.get_user(user['id'])
+
+        connection = identity_session.bind
+        sql.end_request()
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.identity_api.get_session().bind, connection)
+
+    def test_nested_request(self):
+        sql.start_request()
+        connection = self.identity_api.get_session().bind
+        sql.start_request()
+        self.assertIs(self.token_api.get_session().bind, connection)
+        sql.end_request()
+        self.assertFalse(connection.closed)
+        self.assertIs(self.token_api.get_session().bind, connection)
+        sql.end_request()
+        self.assertTrue(connection.closed)
+
+    def test_rollback_within_request(self):
+        sql.start_request()
+        self.identity_api.create_user(self.user_foo['id'] + 'x', {
+            'id': self.user_foo['id'] + 'x',
+            'name': uuid.uuid4().hex,
+            'domain_id': DEFAULT_DOMAIN_ID})
+        self.assertRaises(exception.Conflict,
+                          self.identity_api.create_user,
+                          uuid.uuid4().hex,
+                          {'id': uuid.uuid4().hex,
+                           'name': self.user_foo['name'],
+                           'domain_id': DEFAULT_DOMAIN_ID})
+        # the connection is still usable after the failed transaction
+        self.identity_api.get_user(self.user_foo['id'] + 'x')
+
+    def test_requests_per_greenthread(self):
+        sql.start_request()
+        connection = self.identity_api.get_session().bind
+
+        def other_request():
+            outside = self.identity_api.get_session().bind
+            sql.start_request()
+            try:
+                inside = self.identity_api.get_session().bind
+                eventlet.sleep(0)
+                return outside, inside, self.token_api.get_session().bind
+            finally:
+                sql.end_request()
+
+        outside, inside, shared = eventlet.spawn(other_request).wait()
+        self.assertIsNot(outside, connection)
+        self.assertIsNot(inside, connection)
+        self.assertIs(shared, inside)
+        self.assertTrue(inside.closed)
+        self.assertIs(self.identity_api.get_session().bind, connection)
+        self.assertFalse(connection.closed)
+
+    def test_invalidated_connection_replaced(self):
+        engine = sqlalchemy.create_engine('sqlite://')
+        sql.start_request()
+        connection = sql.core._request_connection(engine)
+        self.assertIs(sql.core._request_connection(engine), connection)
+        connection.invalidate()
+        self.assertIsNot(sql.core._request_connection(engine), connection)
+
+
+class MySQLPingListener(test.TestCase):
+    class FakeConnection(object):
+        OperationalError = Exception
+
+        def __init__(self):
+            self.pings = 0
+
+        def cursor(self):
+            return self
+
+        def execute(self, statement):
+            self.pings += 1
+
+    class FakeRecord(object):
+        def __init__(self):
+            self.info = {}
+
+    def test_ping_rate_limited(self):
+        self.opt_in_group('sql', ping_interval=60)
+        listener = sql.MySQLPingListener()
+        dbapi_con = self.FakeConnection()
+        con_record = self.FakeRecord()
+        for i in range(3):
+            listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(dbapi_con.pings, 1)
+
+        # each connection is pinged on its own schedule
+        listener.checkout(dbapi_con, self.FakeRecord(), None)
+        self.assertEqual(dbapi_con.pings, 2)
+
+        con_record.info['pinged_at'] -= 60
+        listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(dbapi_con.pings, 3)
+
+    def test_ping_every_checkout(self):
+        self.opt_in_group('sql', ping_interval=0)
+        listener = sql.MySQLPingListener()
+        dbapi_con = self.FakeConnection()
+        con_record = self.FakeRecord()
+        for i in range(3):
+            listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(dbapi_con.pings, 3)
+
+
+class SqlPool(test.TestCase):
+    def setUp(self):
+        super(SqlPool, self).setUp()
+        self.config([test.etcdir('keystone.conf.sample'),
+                     test.testsdir('test_overrides.conf'),
+                     test.testsdir('backend_sql.conf')])
+        sql.set_global_engine(None)
+
+    def tearDown(self):
+        sql.set_global_engine(None)
+        super(SqlPool, self).tearDown()
+
+    def test_default_pool(self):
+        engine = sql.Base().get_engine()
+        checkouts = sql.pool_stats()['checkouts']
+        engine.connect().close()
+        stats = sql.pool_stats()
+        self.assertEqual(stats['pool_class'], 'StaticPool')
+        self.assertEqual(stats['checkouts'], checkouts + 1)
+        self.assertEqual(stats['timeouts'], 0)
+
+    def test_pool_options(self):
+        self.opt_in_group('sql',
+                          pool_class='QueuePool',
+                          pool_size=2,
+                          max_overflow=0,
+                          pool_timeout=1)
+        engine = sql.Base().get_engine(allow_global_engine=False)
+        self.assertEqual(sql.pool_stats(), {})
+        connections = [engine.connect(), engine.connect()]
+        stats = sql.pool_stats(engine)
+        self.assertEqual(stats['pool_class'], 'QueuePool')
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['checked_out'], 2)
+        self.assertEqual(stats['checkouts'], 2)
+
+        self.assertRaises(sql.TimeoutError, engine.connect)
+        stats = sql.pool_stats(engine)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertTrue(stats['max_wait_time'] >= 1)
+
+        for connection in connections:
+            connection.close()
+        self.assertEqual(sql.pool_stats(engine)['checked_out'], 0)
+
+    def test_pool_options_ignored(self):
+        self.opt_in_group('sql', pool_size=2, max_overflow=0, pool_timeout=1)
+        engine = sql.Base().get_engine(allow_global_engine=False)
+        self.assertEqual(sql.pool_stats(engine)['pool_class'], 'StaticPool')
+        engine.connect().close()
+
+    def test_stats_survive_recreate(self):
+        self.opt_in_group('sql', pool_class='QueuePool')
+        engine = sql.Base().get_engine(allow_global_engine=False)
+        engine.connect().close()
+        engine.dispose()
+        engine.connect().close()
+        self.assertEqual(sql.pool_stats(engine)['checkouts'], 2)
@@ -0,0 +1,157 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import uuid
+
+from keystoneclient.contrib.ec2 import utils as ec2_utils
+
+from keystone.contrib import ec2
+from keystone.contrib.ec2 import core
+from keystone import config
+from keystone import exception
+from keystone.openstack.common import timeutils
+from keystone import test
+
+import default_fixtures
+
+
+CONF = config.CONF
+
+
+class Ec2ContribCore(test.TestCase):
+    def setUp(self):
+        super(Ec2ContribCore, self).setUp()
+
+        self.load_backends()
+        self.load_fixtures(default_fixtures)
+
+        self.ec2_api = ec2.Manager()
+        self.controller = ec2.Ec2Controller()
+        core.TOKENS.clear()
+        core.CREDENTIALS.clear()
+
+        self.cred_ref = {'user_id': self.user_foo['id'],
+                         'tenant_id': self.tenant_bar['id'],
+                         'access': uuid.uuid4().hex,
+                         'secret': uuid.uuid4().hex}
+        self.ec2_api.create_credential({}, self.cred_ref['access'],
+                                       self.cred_ref)
+
+    def tearDown(self):
+        core.TOKENS.clear()
+        core.CREDENTIALS.clear()
+        super(Ec2ContribCore, self).tearDown()
+
+    def _authenticate(self, host='localhost'):
+        credentials = {'access': self.cred_ref['access'],
+                       'host': 'localhost',
+                       'verb': 'GET',
+                       'path': '/',
+                       'params': {'SignatureVersion': '2',
+                                  'SignatureMethod': 'HmacSHA256',
+                                  'AWSAccessKeyId': self.cred_ref['access']}}
+        signer = ec2_utils.Ec2Signer(self.cred_ref['secret'])
+        credentials['signature'] = signer.generate(credentials)
+        credentials['host'] = host
+        r = self.controller.authenticate({}, credentials=credentials)
+        return r['access']['token']['id']
+
+    def _replace_secret(self):
+        """Change the secret in the backend, as another process would."""
+        self.ec2_api.delete_credential({}, self.cred_ref['access'])
+        self.cred_ref['secret'] = uuid.uuid4().hex
+        self.ec2_api.create_credential({}, self.cred_ref['access'],
+                                       self.cred_ref)
+
+    def test_token_reused(self):
+        token_id = self._authenticate()
+        self.assertEqual(self._authenticate(), token_id)
+        token_ref = self.controller.token_api.get_token({}, token_id)
+        self.assertEqual(token_ref['user']['id'], self.user_foo['id'])
+
+    def test_token_reuse_disabled(self):
+        self.opt_in_group('ec2', token_cache_size=0)
+        self.assertNotEqual(self._authenticate(), self._authenticate())
+
+    def test_token_near_expiry_not_reused(self):
+        self.opt_in_group('ec2',
+                          token_reuse_margin=CONF.token.expiration + 1)
+        self.assertNotEqual(self._authenticate(), self._authenticate())
+
+    def test_revoked_token_not_reused(self):
+        token_id = self._authenticate()
+        self.controller.token_api.delete_tokens({}, self.user_foo['id'])
+        self.assertNotEqual(self._authenticate(), token_id)
+
+    def test_delete_credential_revokes_token(self):
+        token_id = self._authenticate()
+        self.controller.delete_credential({'is_admin': True},
+                                          self.user_foo['id'],
+                                          self.cred_ref['access'])
+        self.assertRaises(exception.TokenNotFound,
+                          self.controller.token_api.get_token,
+                          {}, token_id)
+
+    def test_disabled_project(self):
+        self._authenticate()
+        self.identity_api.update_project(self.tenant_bar['id'],
+                                         {'enabled': False})
+        self.assertRaises(exception.Unauthorized, self._authenticate)
+
+    def test_signature_without_port(self):
+        self._authenticate(host='localhost:8773')
+
+    def test_bad_signature(self):
+        self.cred_ref['secret'] = uuid.uuid4().hex
+        self.assertRaises(exception.Unauthorized, self._authenticate)
+        self.assertRaises(exception.Unauthorized, self._authenticate,
+                          host='localhost:8773')
+
+    def test_credentials_cached(self):
+        self._authenticate()
+        self.assertIn(self.cred_ref['access'], core.CREDENTIALS)
+        old_secret = self.cred_ref['secret']
+        self._replace_secret()
+        self.assertRaises(exception.Unauthorized, self._authenticate)
+
+        self.cred_ref['secret'] = old_secret
+        self._authenticate()
+
+    def test_credential_cache_expires(self):
+        timeutils.set_time_override(timeutils.utcnow())
+        try:
+            self._authenticate()
+            self._replace_secret()
+            timeutils.advance_time_delta(datetime.timedelta(
+                seconds=CONF.ec2.credential_cache_ttl))
+            self._authenticate()
+        finally:
+            timeutils.clear_time_override()
+
+    def test_credential_cache_disabled(self):
+        self.opt_in_group('ec2', credential_cache_ttl=0)
+        self._authenticate()
+        self.assertEqual(core.CREDENTIALS, {})
+        self._replace_secret()
+        self._authenticate()
+
+    def test_delete_credential_uncaches_credentials(self):
+        self._authenticate()
+        self.controller.delete_credential({'is_admin': True},
+                                          self.user_foo['id'],
+                                          self.cred_ref['access'])
+        self.assertNotIn(self.cred_ref['access'], core.CREDENTIALS)
@@ -0,0 +1,164 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sys
+
+import eventlet
+import routes
+import webob
+
+from keystone.common import wsgi
+from keystone.contrib import profiler
+from keystone import exception
+from keystone import test
+
+
+class WidgetController(wsgi.Application):
+    def get_widget(self, context, widget_id):
+        return {'widget': {'id': widget_id,
+                           'name': ''.join(reversed(widget_id))}}
+
+
+def make_router():
+    mapper = routes.Mapper()
+    mapper.connect('/widgets/{widget_id}',
+                   controller=WidgetController(),
+                   action='get_widget',
+                   conditions=dict(method=['GET']))
+    return wsgi.Router(mapper)
+
+
+class ProfilerTest(test.TestCase):
+    def setUp(self):
+        super(ProfilerTest, self).setUp()
+        self.profiler = profiler.Profiler()
+
+    def test_inactive_by_default(self):
+        self.assertFalse(self.profiler.acquire())
+
+    def test_request_limit(self):
+        self.profiler.start(requests=2)
+        self.assertTrue(self.profiler.acquire())
+        self.profiler.release('GET /', {})
+        self.assertTrue(self.profiler.acquire())
+        self.profiler.release('GET /', {})
+        self.assertFalse(self.profiler.active)
+        self.assertFalse(self.profiler.acquire())
+
+    def test_time_limit(self):
+        self.profiler.start(seconds=60)
+        self.assertTrue(self.profiler.acquire())
+        self.profiler.release('GET /', {})
+        self.profiler.expires -= 60
+        self.assertFalse(self.profiler.acquire())
+        self.assertFalse(self.profiler.active)
+
+    def test_one_request_at_a_time(self):
+        self.profiler.start(seconds=60)
+        self.assertTrue(self.profiler.acquire())
+        self.assertFalse(self.profiler.acquire())
+        self.profiler.release('GET /', {})
+        self.assertTrue(self.profiler.acquire())
+
+    def test_collapsed(self):
+        self.profiler.release('GET /a', {('f', 'g'): 0.002, ('f',): 0.001})
+        self.profiler.release('GET /a', {('f', 'g'): 0.001})
+        self.profiler.release('GET /b', {('h',): 0.0000001})
+        self.assertEqual(self.profiler.collapsed(),
+                         'GET /a;f 1000\nGET /a;f;g 3000\n')
+
+
+class ProfilerMiddlewareTest(test.TestCase):
+    def setUp(self):
+        super(ProfilerMiddlewareTest, self).setUp()
+        self.app = profiler.ProfilerMiddleware(make_router())
+
+    def tearDown(self):
+        profiler.PROFILER.stop()
+        profiler.PROFILER.stacks = {}
+        super(ProfilerMiddlewareTest, self).tearDown()
+
+    def test_disabled(self):
+        resp = webob.Request.blank('/widgets/abc').get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(profiler.PROFILER.stacks, {})
+
+    def test_profile_grouped_by_route(self):
+        profiler.PROFILER.start(requests=1)
+        resp = webob.Request.blank('/widgets/abc').get_response(self.app)
+        self.assertIn('cba', resp.body)
+
+        collapsed = profiler.PROFILER.collapsed()
+        self.assertTrue(collapsed)
+        for line in collapsed.splitlines():
+            self.assertTrue(line.startswith('GET /widgets/{widget_id};'))
+        self.assertIn('test_contrib_profiler.get_widget', collapsed)
+
+        # only one request was asked for
+        webob.Request.blank('/widgets/def').get_response(self.app)
+        self.assertEqual(profiler.PROFILER.collapsed(), collapsed)
+
+    def test_concurrent_greenthreads_not_profiled(self):
+        hooks = []
+
+        def concurrent_request():
+            hooks.append(sys.getprofile())
+            return ''.join(reversed('abc'))
+
+        def profiled_request():
+            return eventlet.spawn(concurrent_request).wait()
+
+        profile = profiler.RequestProfile()
+        self.assertEqual(profile.run(profiled_request), 'cba')
+        self.assertEqual(hooks, [None])
+        self.assertIsNone(sys.getprofile())
+        frames = set(frame for stack in profile.stacks for frame in stack)
+        self.assertIn('test_contrib_profiler.profiled_request', frames)
+        self.assertNotIn('test_contrib_profiler.concurrent_request', frames)
+
+
+class ProfilerControllerTest(test.TestCase):
+    def setUp(self):
+        super(ProfilerControllerTest, self).setUp()
+        self.controller = profiler.ProfilerController()
+        self.context = {'is_admin': True}
+
+    def tearDown(self):
+        profiler.PROFILER.stop()
+        profiler.PROFILER.stacks = {}
+        super(ProfilerControllerTest, self).tearDown()
+
+    def test_start_requires_a_limit(self):
+        for kwargs in ({}, {'seconds': -1}, {'requests': 'many'}):
+            self.assertRaises(exception.ValidationError,
+                              self.controller.start_profile,
+                              self.context,
+                              **kwargs)
+        self.assertFalse(profiler.PROFILER.active)
+
+    def test_start_get_and_delete(self):
+        ref = self.controller.start_profile(self.context, seconds='30')
+        self.assertEqual(ref, {'profile': {'seconds': 30, 'requests': None}})
+        self.assertTrue(profiler.PROFILER.active)
+
+        profiler.PROFILER.release('GET /', {('f',): 0.001})
+        resp = self.controller.get_profile(self.context)
+        self.assertEqual(resp.content_type, 'text/plain')
+        self.assertEqual(resp.body, 'GET /;f 1000\n')
+
+        self.controller.delete_profile(self.context)
+        self.assertFalse(profiler.PROFILER.active)
+        self.assertEqual(self.controller.get_profile(self.context).body, '')
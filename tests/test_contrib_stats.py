@@ -0,0 +1,249 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import webob
+
+from keystone.common import sql
+from keystone.common import wsgi
+from keystone import config
+from keystone.contrib import stats
+from keystone import test
+
+
+CONF = config.CONF
+
+
+class FakeApp(object):
+    def __call__(self, env, start_response):
+        env[wsgi.ACTION_ENV] = 'get_users'
+        resp = webob.Response()
+        resp.body = 'SUCCESS'
+        return resp(env, start_response)
+
+
+class StatsAggregatorTest(test.TestCase):
+    def test_increment(self):
+        aggregator = stats.StatsAggregator(max_values=10)
+        aggregator.increment('admin', 'method', 'GET')
+        aggregator.increment('admin', 'method', 'GET')
+        aggregator.increment('admin', 'method', 'POST')
+        aggregator.increment('public', 'method', 'GET')
+        self.assertEqual(aggregator.drain(), {
+            'admin': {'method': {'GET': 2, 'POST': 1}},
+            'public': {'method': {'GET': 1}}})
+        self.assertEqual(aggregator.drain(), {})
+
+    def test_cardinality_is_bounded(self):
+        aggregator = stats.StatsAggregator(max_values=3)
+        for i in range(100):
+            aggregator.increment('admin', 'path', '/popular')
+        for i in range(50):
+            aggregator.increment('admin', 'path', '/rare/%s' % i)
+        paths = aggregator.drain()['admin']['path']
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(paths['/popular'], 100)
+        self.assertEqual(sum(paths.values()), 150)
+
+    def test_top_values(self):
+        counters = {'a': 5, 'b': 1, 'c': 3}
+        self.assertEqual(stats.top_values(counters, 2), {'a': 5, 'c': 3})
+        self.assertEqual(stats.top_values(counters, 5), counters)
+
+
+class LatencyMetricsTest(test.TestCase):
+    def test_histogram_buckets(self):
+        histogram = stats.LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+        self.assertEqual(list(histogram.cumulative_counts()),
+                         [(0.1, 2), (1.0, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_render(self):
+        metrics = stats.LatencyMetrics()
+        labels = (('api', 'public'), ('action', 'authenticate'))
+        metrics.observe('keystone_action_latency_seconds', labels, 0.02)
+        lines = metrics.render().splitlines()
+        self.assertEqual(lines[1],
+                         '# TYPE keystone_action_latency_seconds histogram')
+        self.assertIn('keystone_action_latency_seconds_bucket{api="public",'
+                      'action="authenticate",le="0.01"} 0', lines)
+        self.assertIn('keystone_action_latency_seconds_bucket{api="public",'
+                      'action="authenticate",le="0.025"} 1', lines)
+        self.assertIn('keystone_action_latency_seconds_bucket{api="public",'
+                      'action="authenticate",le="+Inf"} 1', lines)
+        self.assertIn('keystone_action_latency_seconds_count{api="public",'
+                      'action="authenticate"} 1', lines)
+
+    def test_labels_are_escaped(self):
+        metrics = stats.LatencyMetrics()
+        metrics.observe('m', (('api', 'a"b\\c'),), 0.0)
+        self.assertIn('m_count{api="a\\"b\\\\c"} 1',
+                      metrics.render().splitlines())
+
+
+class StatsMiddlewareTest(test.TestCase):
+    def setUp(self):
+        super(StatsMiddlewareTest, self).setUp()
+        self.stats_api = stats.Manager()
+        stats.AGGREGATOR.drain()
+        stats.METRICS.reset()
+
+    def tearDown(self):
+        stats.AGGREGATOR.drain()
+        stats.METRICS.reset()
+        super(StatsMiddlewareTest, self).tearDown()
+
+    def _request(self, middleware, path):
+        req = webob.Request.blank(path)
+        req.host = 'localhost:%s' % CONF.admin_port
+        return req.get_response(middleware)
+
+    def _wait_for_flush(self, middleware):
+        if middleware._flusher is not None:
+            middleware._flusher.wait()
+
+    def test_counters_are_flushed_periodically(self):
+        self.opt_in_group('stats', flush_interval=60)
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        self._request(middleware, '/v2.0/users')
+        self.assertEqual(self.stats_api.get_stats(None, 'admin'), {})
+
+        middleware.last_flush -= 60
+        self._request(middleware, '/v2.0/tenants')
+        self._wait_for_flush(middleware)
+        stats_ref = self.stats_api.get_stats(None, 'admin')
+        self.assertEqual(stats_ref['path'],
+                         {'/v2.0/users': 2, '/v2.0/tenants': 1})
+        self.assertEqual(stats_ref['status_int'], {200: 3})
+
+    def test_flush_every_request(self):
+        self.opt_in_group('stats', flush_interval=0)
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        self._wait_for_flush(middleware)
+        stats_ref = self.stats_api.get_stats(None, 'admin')
+        self.assertEqual(stats_ref['method'], {'GET': 1})
+
+    def test_flush_is_not_inline(self):
+        self.opt_in_group('stats', flush_interval=0)
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        # the response is returned before the counters are written
+        self.assertIsNotNone(middleware._flusher)
+        self.assertEqual(self.stats_api.get_stats(None, 'admin'), {})
+        self._wait_for_flush(middleware)
+        self.assertIsNone(middleware._flusher)
+        self.assertEqual(self.stats_api.get_stats(None, 'admin')['method'],
+                         {'GET': 1})
+
+    def test_reset_discards_pending_counters(self):
+        self.opt_in_group('stats', flush_interval=60)
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        stats.StatsController().reset_stats({'is_admin': True})
+
+        middleware.last_flush -= 60
+        self._request(middleware, '/v2.0/tenants')
+        self._wait_for_flush(middleware)
+        stats_ref = self.stats_api.get_stats(None, 'admin')
+        self.assertEqual(stats_ref['path'], {'/v2.0/tenants': 1})
+
+    def test_latency_is_recorded(self):
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        histograms = stats.METRICS.histograms
+        action = histograms['keystone_action_latency_seconds']
+        self.assertEqual(
+            action[(('api', 'admin'), ('action', 'get_users'))].count, 1)
+        status = histograms['keystone_status_latency_seconds']
+        self.assertEqual(
+            status[(('api', 'admin'), ('status', '2xx'))].count, 1)
+
+    def test_get_metrics(self):
+        middleware = stats.StatsMiddleware(FakeApp())
+        self._request(middleware, '/v2.0/users')
+        controller = stats.StatsController()
+        response = controller.get_metrics({'is_admin': True})
+        self.assertEqual(response.content_type, 'text/plain')
+        self.assertIn('keystone_status_latency_seconds_count{api="admin",'
+                      'status="2xx"} 1', response.body.splitlines())
+
+        controller.reset_stats({'is_admin': True})
+        self.assertEqual(stats.METRICS.histograms, {})
+
+
+class StatsDriverTests(object):
+    def test_increment_stat(self):
+        self.stats_api.increment_stat('admin', 'method', 'GET')
+        self.stats_api.increment_stat('admin', 'method', 'GET')
+        stats_ref = self.stats_api.get_stats('admin')
+        self.assertEqual(stats_ref['method'].values(), [2])
+
+    def test_increment_stats(self):
+        self.stats_api.increment_stats('admin', {'method': {'GET': 2}})
+        self.stats_api.increment_stats('admin', {'method': {'GET': 3,
+                                                            'PUT': 1}})
+        stats_ref = self.stats_api.get_stats('admin')
+        self.assertEqual(sorted(stats_ref['method'].values()), [1, 5])
+        self.assertEqual(self.stats_api.get_stats('public'), {})
+
+    def test_increment_stats_keeps_top_values(self):
+        self.opt_in_group('stats', max_tracked_values=2)
+        self.stats_api.increment_stats(
+            'admin', {'path': {'/a': 5, '/b': 3, '/c': 1}})
+        self.stats_api.increment_stats('admin', {'path': {'/d': 4}})
+        stats_ref = self.stats_api.get_stats('admin')
+        self.assertEqual(sorted(stats_ref['path'].values()), [4, 5])
+
+    def test_set_stats(self):
+        self.stats_api.increment_stats('admin', {'method': {'GET': 2}})
+        self.stats_api.set_stats('admin', {})
+        self.assertEqual(self.stats_api.get_stats('admin'), {})
+
+
+class KvsStats(test.TestCase, StatsDriverTests):
+    def setUp(self):
+        super(KvsStats, self).setUp()
+        self.stats_api = stats.Manager().driver
+
+
+class SqlStats(test.TestCase, StatsDriverTests):
+    def setUp(self):
+        super(SqlStats, self).setUp()
+        self.config([test.etcdir('keystone.conf.sample'),
+                     test.testsdir('test_overrides.conf'),
+                     test.testsdir('backend_sql.conf')])
+        self.opt_in_group(
+            'stats', driver='keystone.contrib.stats.backends.sql.Stats')
+        self.stats_api = stats.Manager().driver
+
+    def tearDown(self):
+        sql.set_global_engine(None)
+        super(SqlStats, self).tearDown()
+
+    def test_pool_stats(self):
+        self.stats_api.get_stats('admin')
+        controller = stats.StatsController()
+        stats_refs = controller.get_stats({'is_admin': True})['OS-STATS:stats']
+        pool_stats = [x['extra'] for x in stats_refs if x['type'] == 'sql']
+        self.assertEqual(len(pool_stats), 1)
+        self.assertTrue(pool_stats[0]['checkouts'] > 0)
+
+        controller.reset_stats({'is_admin': True})
+        self.assertEqual(sql.pool_stats()['checkouts'], 0)
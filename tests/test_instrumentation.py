@@ -0,0 +1,130 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import uuid
+
+import eventlet
+
+from keystone.common import instrumentation
+from keystone.common import sql
+from keystone import identity
+from keystone import test
+from keystone import token
+
+import default_fixtures
+
+
+class InstrumentationTests(object):
+    def load_identity(self):
+        self.identity_man = identity.Manager()
+        self.identity_api = self.identity_man.driver
+        self.load_fixtures(default_fixtures)
+
+    def tearDown(self):
+        instrumentation.end_request()
+        super(InstrumentationTests, self).tearDown()
+
+    def test_nothing_recorded_outside_a_request(self):
+        self.identity_man.get_user({}, self.user_foo['id'])
+        self.assertIsNone(instrumentation.current())
+
+    def test_manager_calls(self):
+        instrumentation.start_request()
+        self.identity_man.get_user({}, self.user_foo['id'])
+        self.identity_man.get_user({}, self.user_foo['id'])
+        self.identity_man.get_project({}, self.tenant_bar['id'])
+        accounting = instrumentation.end_request()
+
+        self.assertEqual(accounting.call_count, 3)
+        count, elapsed = accounting.calls[('keystone.identity.core',
+                                           'get_user')]
+        self.assertEqual(count, 2)
+        self.assertTrue(elapsed >= 0)
+        self.assertEqual(len(accounting.breakdown()), 2)
+        self.assertIsNone(instrumentation.current())
+
+    def test_manager_methods(self):
+        # methods the token manager defines itself, rather than forwards
+        token_man = token.Manager()
+        token_id = uuid.uuid4().hex
+        instrumentation.start_request()
+        token_man.create_token({}, token_id, {'id': token_id,
+                                              'user': self.user_foo})
+        token_man.get_token({}, token_id)
+        accounting = instrumentation.end_request()
+
+        self.assertEqual(accounting.call_count, 2)
+        self.assertIn(('keystone.token.core', 'create_token'),
+                      accounting.calls)
+        self.assertIn(('keystone.token.core', 'get_token'),
+                      accounting.calls)
+
+    def test_nested_requests(self):
+        outer = instrumentation.start_request()
+        self.identity_man.get_user({}, self.user_foo['id'])
+        inner = instrumentation.start_request()
+        self.identity_man.get_user({}, self.user_foo['id'])
+        self.assertIs(instrumentation.end_request(), outer)
+        self.assertIs(inner, outer)
+        self.assertIs(instrumentation.current(), outer)
+        instrumentation.end_request()
+        self.assertEqual(outer.call_count, 2)
+        self.assertIsNone(instrumentation.current())
+
+    def test_concurrent_requests(self):
+        def serve():
+            accounting = instrumentation.start_request()
+            eventlet.sleep(0)
+            self.identity_man.get_user({}, self.user_foo['id'])
+            eventlet.sleep(0)
+            self.assertIs(instrumentation.end_request(), accounting)
+            return accounting
+
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda x: serve(), range(2)))
+        self.assertIsNot(results[0], results[1])
+        for accounting in results:
+            self.assertEqual(accounting.call_count, 1)
+        self.assertIsNone(instrumentation.current())
+
+
+class KvsInstrumentation(InstrumentationTests, test.TestCase):
+    def setUp(self):
+        super(KvsInstrumentation, self).setUp()
+        self.load_identity()
+
+
+class SqlInstrumentation(InstrumentationTests, test.TestCase):
+    def setUp(self):
+        super(SqlInstrumentation, self).setUp()
+        self.config([test.etcdir('keystone.conf.sample'),
+                     test.testsdir('test_overrides.conf'),
+                     test.testsdir('backend_sql.conf')])
+        self.opt(instrument_backends=True)
+        sql.set_global_engine(None)
+        self.load_identity()
+
+    def tearDown(self):
+        sql.set_global_engine(None)
+        super(SqlInstrumentation, self).tearDown()
+
+    def test_sql_statements(self):
+        instrumentation.start_request()
+        self.identity_man.get_user({}, self.user_foo['id'])
+        accounting = instrumentation.end_request()
+        self.assertTrue(accounting.sql_statements > 0)
+        self.assertIn('sql_statements=%d' % accounting.sql_statements,
+                      accounting.summary())
@@ -15,10 +15,13 @@
 # under the License.
 
 import webob
+import webob.dec
 
+from keystone.common import instrumentation
+from keystone.common import wsgi
 from keystone import config
+from keystone.contrib import access
 from keystone import middleware
-from keystone.openstack.common import jsonutils
 from keystone import test
 
 
@@ -142,15 +145,39 @@ class XmlBodyMiddlewareTest(test.TestCase):
         middleware.XmlBodyMiddleware(None).process_response(req, resp)
         self.assertNotIn('application/xml', resp.content_type)
 
-    def test_xml_replaced_by_json(self):
-        """XML requests should be replaced by JSON requests."""
+    def test_xml_deserialized_to_params(self):
+        """XML requests should be deserialized directly into params."""
         req = make_request(
             body='<container><element attribute="value" /></container>',
             content_type='application/xml',
             method='POST')
         middleware.XmlBodyMiddleware(None).process_request(req)
-        self.assertTrue(req.content_type, 'application/json')
-        self.assertTrue(jsonutils.loads(req.body))
+        params = req.environ[middleware.PARAMS_ENV]
+        self.assertEqual(params,
+                         {'container': {'element': {'attribute': 'value'}}})
+
+        # the JSON middleware should leave the deserialized params alone
+        middleware.JsonBodyMiddleware(None).process_request(req)
+        self.assertIs(req.environ[middleware.PARAMS_ENV], params)
+
+    def test_malformed_xml(self):
+        req = make_request(body='<container>',
+                           content_type='application/xml',
+                           method='POST')
+        resp = middleware.XmlBodyMiddleware(None).process_request(req)
+        self.assertEqual(resp.status_int, 400)
+
+    def test_client_wants_xml_rendered_directly(self):
+        """Applications should be asked to render XML themselves."""
+        req = make_request(accept='application/xml')
+        middleware.XmlBodyMiddleware(None).process_request(req)
+        self.assertTrue(req.environ[middleware.XML_RESPONSE_ENV])
+
+        resp = wsgi.render_response(body={'container': {'a': 'b'}}, xml=True)
+        body = resp.body
+        middleware.XmlBodyMiddleware(None).process_response(req, resp)
+        self.assertEqual(resp.content_type, 'application/xml')
+        self.assertEqual(resp.body, body)
 
     def test_json_unnaffected(self):
         """JSON-only requests should be unnaffected by the XML middleware."""
@@ -160,3 +187,54 @@ class XmlBodyMiddlewareTest(test.TestCase):
         middleware.XmlBodyMiddleware(None).process_request(req)
         self.assertEqual(req.body, body)
         self.assertEqual(req.content_type, content_type)
+
+
+class AccessLogMiddlewareTest(test.TestCase):
+    def setUp(self):
+        super(AccessLogMiddlewareTest, self).setUp()
+        self.entries = []
+        self.stubs.Set(access.LOG, 'info', self.entries.append)
+
+    def test_content_length(self):
+        app = access.AccessLogMiddleware(make_response(body='abcd'))
+        req = make_request()
+        req.get_response(app)
+        self.assertEqual(len(self.entries), 1)
+        self.assertTrue(self.entries[0].endswith(' 200 4'))
+
+    def test_streamed_content_length(self):
+        resp = wsgi.render_response(body={'a': iter(['b'])})
+        app = access.AccessLogMiddleware(resp)
+        req = make_request()
+        resp = req.get_response(app)
+        self.assertEqual(self.entries, [])
+        body = resp.body
+        self.assertEqual(len(self.entries), 1)
+        self.assertTrue(self.entries[0].endswith(' 200 %s' % len(body)))
+
+    def test_backend_instrumentation(self):
+        self.opt(instrument_backends=True)
+
+        @webob.dec.wsgify
+        def app(req):
+            accounting = instrumentation.current()
+            accounting.record_call('keystone.identity.core', 'get_user', 0.1)
+            accounting.record_statement()
+            return webob.Response(body='abcd')
+
+        req = make_request()
+        req.get_response(access.AccessLogMiddleware(app))
+        self.assertEqual(len(self.entries), 1)
+        self.assertTrue(self.entries[0].endswith(
+            ' 200 4 backend_calls=1 sql_statements=1'))
+        self.assertIsNone(instrumentation.current())
+
+    def test_no_backend_instrumentation_by_default(self):
+        @webob.dec.wsgify
+        def app(req):
+            self.assertIsNone(instrumentation.current())
+            return webob.Response(body='abcd')
+
+        req = make_request()
+        req.get_response(access.AccessLogMiddleware(app))
+        self.assertTrue(self.entries[0].endswith(' 200 4'))
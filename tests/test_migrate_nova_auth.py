@@ -20,6 +20,7 @@ from keystone.common.sql import nova
 from keystone.common.sql import util as sql_util
 from keystone import config
 from keystone.contrib.ec2.backends import sql as ec2_sql
+from keystone import exception
 from keystone.identity.backends import sql as identity_sql
 from keystone import test
 
@@ -90,6 +91,29 @@ class MigrateNovaAuth(test.TestCase):
         self._create_role('role1')
 
         nova.import_auth(FIXTURE)
+        self._check_import()
+
+    def test_import_in_small_batches(self):
+        self._create_role('role1')
+
+        nova.import_auth(FIXTURE, batch_size=2, workers=0)
+        self._check_import()
+
+    def test_import_into_non_empty_database(self):
+        user_id = uuid.uuid4().hex
+        self.identity_api.create_user(user_id, {
+            'id': user_id,
+            'name': uuid.uuid4().hex,
+            'domain_id': DEFAULT_DOMAIN_ID,
+            'password': uuid.uuid4().hex,
+            'enabled': True})
+
+        self.assertRaises(exception.Conflict, nova.import_auth, FIXTURE)
+        self.assertRaises(exception.ProjectNotFound,
+                          self.identity_api.get_project_by_name,
+                          'proj1', DEFAULT_DOMAIN_ID)
+
+    def _check_import(self):
 
         users = {}
         for user in ['user1', 'user2', 'user3', 'user4']:
@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import subprocess
+import uuid
+
+import eventlet
+import nose.exc
+
+from keystone.common import cms
+from keystone.common import signing
+from keystone import config
+from keystone import test
+
+
+CONF = config.CONF
+
+
+class SigningTest(test.TestCase):
+    def setUp(self):
+        super(SigningTest, self).setUp()
+        if signing.pkcs7 is None:
+            raise nose.exc.SkipTest('cryptography is not installed')
+        self.opt_in_group('signing', workers=2, worker_batch_size=4)
+
+    def tearDown(self):
+        for pool in signing.POOLS.values():
+            pool.close()
+        signing.POOLS.clear()
+        super(SigningTest, self).tearDown()
+
+    def _documents(self, count):
+        return [json.dumps({'id': uuid.uuid4().hex}) for i in range(count)]
+
+    def _verify(self, token_id):
+        return cms.verify_token(token_id,
+                                CONF.signing.certfile,
+                                CONF.signing.ca_certs)
+
+    def test_no_workers(self):
+        self.opt_in_group('signing', workers=0)
+        self.assertIsNone(signing.get_pool(CONF.signing.certfile,
+                                           CONF.signing.keyfile))
+        text = self._documents(1)[0]
+        token_id = signing.cms_sign_token(text,
+                                          CONF.signing.certfile,
+                                          CONF.signing.keyfile)
+        self.assertEqual(self._verify(token_id), text)
+        self.assertEqual(signing.POOLS, {})
+
+    def test_sign_token(self):
+        text = self._documents(1)[0]
+        token_id = signing.cms_sign_token(text,
+                                          CONF.signing.certfile,
+                                          CONF.signing.keyfile)
+        self.assertTrue(cms.is_ans1_token(token_id))
+        self.assertEqual(self._verify(token_id), text)
+
+    def test_pkiz_sign(self):
+        text = self._documents(1)[0]
+        token_id = signing.pkiz_sign(text,
+                                     CONF.signing.certfile,
+                                     CONF.signing.keyfile)
+        self.assertTrue(cms.is_pkiz(token_id))
+        self.assertEqual(self._verify(token_id), text)
+
+    def _digest_algorithms(self, der):
+        process = subprocess.Popen(['openssl', 'cms', '-cmsout', '-print',
+                                    '-inform', 'DER'],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        output = process.communicate(der)[0]
+        return [line.split()[1] for line in output.splitlines()
+                if line.strip().startswith('algorithm:')]
+
+    def test_same_digest_as_openssl(self):
+        text = self._documents(1)[0]
+        pooled = signing.cms_sign_text(text,
+                                       CONF.signing.certfile,
+                                       CONF.signing.keyfile,
+                                       outform='DER')
+        inline = cms.cms_sign_text(text,
+                                   CONF.signing.certfile,
+                                   CONF.signing.keyfile,
+                                   outform='DER')
+        self.assertEqual(self._digest_algorithms(pooled)[0], cms.DIGEST)
+        self.assertEqual(self._digest_algorithms(pooled),
+                         self._digest_algorithms(inline))
+        # each verifies like the other
+        for der in (pooled, inline):
+            self.assertEqual(cms.cms_verify(der,
+                                            CONF.signing.certfile,
+                                            CONF.signing.ca_certs,
+                                            inform='DER'),
+                             text)
+
+    def test_workers_are_not_forked(self):
+        pool = signing.get_pool(CONF.signing.certfile, CONF.signing.keyfile)
+        for process in pool._processes.values():
+            with open('/proc/%d/cmdline' % process.pid) as f:
+                args = f.read().split('\0')
+            self.assertIn(signing.__name__, args)
+
+    def test_concurrent_signing(self):
+        documents = self._documents(20)
+        pool = eventlet.GreenPool()
+        token_ids = list(pool.imap(
+            lambda text: signing.cms_sign_token(text,
+                                                CONF.signing.certfile,
+                                                CONF.signing.keyfile),
+            documents))
+        self.assertEqual(len(signing.POOLS), 1)
+        for text, token_id in zip(documents, token_ids):
+            self.assertEqual(self._verify(token_id), text)
+
+    def test_large_documents(self):
+        # each batch is far larger than a socket buffer, in both directions
+        documents = [json.dumps({'id': uuid.uuid4().hex * 16384})
+                     for i in range(8)]
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(None)
+                eventlet.sleep(0)
+
+        ticker = eventlet.spawn(tick)
+        try:
+            pool = eventlet.GreenPool()
+            token_ids = list(pool.imap(
+                lambda text: signing.cms_sign_token(text,
+                                                    CONF.signing.certfile,
+                                                    CONF.signing.keyfile),
+                documents))
+        finally:
+            ticker.kill()
+        self.assertTrue(ticks)
+        for text, token_id in zip(documents, token_ids):
+            self.assertEqual(self._verify(token_id), text)
+
+    def test_worker_failure(self):
+        text = self._documents(1)[0]
+        pool = signing.get_pool(CONF.signing.certfile, CONF.signing.keyfile)
+        for process in pool._processes.values():
+            process.terminate()
+            process.wait()
+        failures = 0
+        for i in range(3):
+            try:
+                pool.sign(text)
+            except subprocess.CalledProcessError:
+                failures += 1
+        # each dead worker fails one batch, and is replaced
+        self.assertEqual(failures, 2)
+        token_id = cms.cms_to_token(pool.sign(text))
+        self.assertEqual(self._verify(token_id), text)
@@ -755,6 +755,39 @@ class SqlUpgradeTests(test.TestCase):
                                 ["id", "expires", "extra", "valid",
                                  "trust_id", "user_id"])
 
+    def test_upgrade_stats(self):
+        self.upgrade(22)
+        self.assertTableDoesNotExist('stats')
+        self.upgrade(23)
+        self.assertTableColumns('stats',
+                                ['id', 'api', 'category', 'value', 'count'])
+        self.downgrade(22)
+        self.assertTableDoesNotExist('stats')
+
+    def test_upgrade_revocation_event(self):
+        self.upgrade(23)
+        self.assertTableDoesNotExist('revocation_event')
+        self.upgrade(24)
+        self.assertTableColumns('revocation_event',
+                                ['id', 'token_id', 'user_id', 'project_id',
+                                 'trust_id', 'issued_before', 'expires'])
+        self.downgrade(23)
+        self.assertTableDoesNotExist('revocation_event')
+
+    def test_upgrade_ec2_credential_user_id_index(self):
+        def index_columns():
+            inspector = sqlalchemy.engine.reflection.Inspector.from_engine(
+                self.engine)
+            return [index['column_names']
+                    for index in inspector.get_indexes('ec2_credential')]
+
+        self.upgrade(24)
+        self.assertNotIn(['user_id'], index_columns())
+        self.upgrade(25)
+        self.assertIn(['user_id'], index_columns())
+        self.downgrade(24)
+        self.assertNotIn(['user_id'], index_columns())
+
     def test_fixup_role(self):
         session = self.Session()
         self.assertEqual(self.schema.version, 0, "DB is at version 0")
@@ -21,7 +21,9 @@ from keystone.common import cms
 from keystone import auth
 from keystone import config
 from keystone import exception
+from keystone.token import encrypted
 
+import test_auth
 import test_v3
 
 
@@ -125,6 +127,26 @@ class TestTokenAPIs(test_v3.RestfulTestCase):
                                           CONF.signing.keyfile)
         self.assertEqual(token_signed, token_id)
 
+    def test_v3_pkiz_token_id(self):
+        self.opt_in_group('signing', token_format='PKIZ')
+        auth_data = self.build_authentication_request(
+            user_id=self.user['id'],
+            password=self.user['password'],
+            project_id=self.project['id'])
+        resp = self.post('/auth/tokens', body=auth_data)
+        token_id = resp.getheader('X-Subject-Token')
+        self.assertTrue(token_id.startswith(cms.PKIZ_PREFIX))
+        self.assertTrue(cms.is_ans1_token(token_id))
+        self.assertNotEqual(cms.cms_hash_token(token_id), token_id)
+        verified = cms.verify_token(token_id,
+                                    CONF.signing.certfile,
+                                    CONF.signing.ca_certs)
+        self.assertEqual(json.loads(verified), resp.body)
+
+        r = self.get('/auth/tokens',
+                     headers={'X-Subject-Token': token_id})
+        self.assertValidProjectScopedTokenResponse(r)
+
     def test_v3_v2_intermix_non_default_domain_failed(self):
         self.opt_in_group('signing', token_format='UUID')
         auth_data = self.build_authentication_request(
@@ -276,6 +298,27 @@ class TestTokenAPIs(test_v3.RestfulTestCase):
         self.assertEqual(v2_token['access']['user']['roles'][0]['id'],
                          token_data['token']['roles'][0]['id'])
 
+    def test_v3_v2_pkiz_token_intermix(self):
+        self.opt_in_group('signing', token_format='PKIZ')
+        auth_data = self.build_authentication_request(
+            user_id=self.default_domain_user['id'],
+            password=self.default_domain_user['password'],
+            project_id=self.default_domain_project['id'])
+        resp = self.post('/auth/tokens', body=auth_data)
+        token_data = resp.body
+        token = resp.getheader('X-Subject-Token')
+
+        # now validate the v3 token with v2 API
+        path = '/v2.0/tokens/%s' % (token)
+        resp = self.admin_request(path=path,
+                                  token='ADMIN',
+                                  method='GET')
+        v2_token = resp.body
+        self.assertEqual(v2_token['access']['user']['id'],
+                         token_data['token']['user']['id'])
+        self.assertEqual(v2_token['access']['user']['roles'][0]['id'],
+                         token_data['token']['roles'][0]['id'])
+
     def test_v2_v3_unscoped_uuid_token_intermix(self):
         self.opt_in_group('signing', token_format='UUID')
         body = {
@@ -405,6 +448,59 @@ class TestTokenAPIs(test_v3.RestfulTestCase):
         self.assertIn('signed', r.body)
 
 
+class TestEncryptedTokenAPIs(test_auth.EncryptedTokens,
+                             test_v3.RestfulTestCase):
+    def setUp(self):
+        super(TestEncryptedTokenAPIs, self).setUp()
+        auth_data = self.build_authentication_request(
+            user_id=self.default_domain_user['id'],
+            password=self.default_domain_user['password'],
+            project_id=self.default_domain_project['id'])
+        resp = self.post('/auth/tokens', body=auth_data)
+        self.token_data = resp.body
+        self.token = resp.getheader('X-Subject-Token')
+        self.headers = {'X-Subject-Token': self.token}
+
+    def test_v3_encrypted_token_id(self):
+        self.assertTrue(encrypted.is_encrypted_token(self.token))
+        self.assertValidProjectScopedTokenResponse(
+            self.post('/auth/tokens', body=self.build_authentication_request(
+                user_id=self.user['id'],
+                password=self.user['password'],
+                project_id=self.project['id'])))
+
+    def test_check_token(self):
+        self.head('/auth/tokens', headers=self.headers, expected_status=204)
+
+    def test_validate_token(self):
+        r = self.get('/auth/tokens', headers=self.headers)
+        self.assertValidProjectScopedTokenResponse(
+            r, user=self.default_domain_user)
+        self.assertEqual(self.token_data['token']['expires_at'],
+                         r.body['token']['expires_at'])
+        self.assertEqual(self.token_data['token']['roles'],
+                         r.body['token']['roles'])
+
+    def test_revoke_token(self):
+        headers = {'X-Subject-Token': self.get_scoped_token()}
+        self.delete('/auth/tokens', headers=headers, expected_status=204)
+        self.head('/auth/tokens', headers=headers, expected_status=401)
+        self.head('/auth/tokens', headers=self.headers, expected_status=204)
+
+    def test_v3_v2_encrypted_token_intermix(self):
+        path = '/v2.0/tokens/%s' % (self.token)
+        resp = self.admin_request(path=path,
+                                  token='ADMIN',
+                                  method='GET')
+        v2_token = resp.body
+        self.assertEqual(v2_token['access']['user']['id'],
+                         self.token_data['token']['user']['id'])
+        self.assertEqual(v2_token['access']['token']['tenant']['id'],
+                         self.token_data['token']['project']['id'])
+        self.assertIn(v2_token['access']['token']['expires'][:-1],
+                      self.token_data['token']['expires_at'])
+
+
 class TestTokenRevoking(test_v3.RestfulTestCase):
     """Test token revoking for relevant v3 identity apis"""
 
@@ -711,6 +807,11 @@ class TestTokenRevoking(test_v3.RestfulTestCase):
                   expected_status=401)
 
 
+class TestEncryptedTokenRevoking(test_auth.EncryptedTokens,
+                                 TestTokenRevoking):
+    pass
+
+
 class TestAuthJSON(test_v3.RestfulTestCase):
     content_type = 'json'
 
@@ -212,6 +212,15 @@ class IdentityTestCase(test_v3.RestfulTestCase):
             'domain_id': self.domain2['id']},
             body={'domain': {'enabled': False}})
         self.assertValidDomainResponse(r, self.domain2)
+
+        # A token of a user of another domain, scoped to project2, which
+        # disabling the domain did not revoke
+        token = uuid.uuid4().hex
+        self.token_api.create_token(token, {
+            'id': token,
+            'user': self.default_domain_user,
+            'tenant': self.project2})
+
         self.delete('/domains/%(domain_id)s' % {
             'domain_id': self.domain2['id']})
 
@@ -232,6 +241,11 @@ class IdentityTestCase(test_v3.RestfulTestCase):
                           self.identity_api.get_credential,
                           credential_id=self.credential2['id'])
 
+        # ...and that the token scoped to project2 was revoked
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token,
+                          token)
+
         # ...and that all self.domain entities are still here
         r = self.identity_api.get_domain(self.domain['id'])
         self.assertDictEqual(r, self.domain)
@@ -282,6 +296,34 @@ class IdentityTestCase(test_v3.RestfulTestCase):
             body={'project': ref})
         self.assertValidProjectResponse(r, ref)
 
+    def test_create_projects(self):
+        """POST /batch/projects"""
+        refs = [self.new_project_ref(domain_id=self.domain_id)
+                for i in range(3)]
+        duplicate = self.new_project_ref(domain_id=self.domain_id)
+        duplicate['name'] = refs[0]['name']
+        r = self.post(
+            '/batch/projects',
+            body={'projects': refs + [duplicate]})
+        results = r.body['projects']
+        self.assertEqual(len(results), 4)
+        for ref, result in zip(refs, results):
+            self.assertValidEntity(result['project'], ref)
+            self.assertValidProject(result['project'], ref)
+        self.assertEqual(results[3]['error']['code'], 409)
+
+    def test_update_projects(self):
+        """PATCH /batch/projects"""
+        ref = self.new_project_ref(domain_id=self.domain_id)
+        ref['id'] = self.project_id
+        r = self.patch(
+            '/batch/projects',
+            body={'projects': [ref, {'id': uuid.uuid4().hex}, {}]})
+        results = r.body['projects']
+        self.assertValidEntity(results[0]['project'], ref)
+        self.assertEqual(results[1]['error']['code'], 404)
+        self.assertEqual(results[2]['error']['code'], 400)
+
     def test_delete_project(self):
         """DELETE /projects/{project_id}
 
@@ -419,6 +461,41 @@ class IdentityTestCase(test_v3.RestfulTestCase):
             body={'user': user})
         self.assertValidUserResponse(r, user)
 
+    def test_create_users(self):
+        """POST /batch/users"""
+        refs = [self.new_user_ref(domain_id=self.domain_id)
+                for i in range(3)]
+        duplicate = self.new_user_ref(domain_id=self.domain_id)
+        duplicate['name'] = refs[0]['name']
+        r = self.post(
+            '/batch/users',
+            body={'users': refs + [duplicate]})
+        results = r.body['users']
+        self.assertEqual(len(results), 4)
+        for ref, result in zip(refs, results):
+            self.assertValidEntity(result['user'], ref)
+            self.assertValidUser(result['user'], ref)
+        self.assertEqual(results[3]['error']['code'], 409)
+
+    def test_create_users_requires_list(self):
+        """POST /batch/users"""
+        self.post(
+            '/batch/users',
+            body={'users': self.new_user_ref(domain_id=self.domain_id)},
+            expected_status=400)
+
+    def test_update_users(self):
+        """PATCH /batch/users"""
+        user = self.new_user_ref(domain_id=self.domain_id)
+        user['id'] = self.user['id']
+        r = self.patch(
+            '/batch/users',
+            body={'users': [user, {'id': uuid.uuid4().hex}]})
+        results = r.body['users']
+        self.assertValidEntity(results[0]['user'], user)
+        self.assertValidUser(results[0]['user'], user)
+        self.assertEqual(results[1]['error']['code'], 404)
+
     def test_delete_user(self):
         """DELETE /users/{user_id}
 
@@ -618,6 +695,45 @@ class IdentityTestCase(test_v3.RestfulTestCase):
         #self.assertValidRoleListResponse(r, expected_length=0)
         #self.assertIn(collection_url, r.body['links']['self'])
 
+    def test_create_grants(self):
+        """PUT /batch/grants"""
+        role = self.new_role_ref()
+        self.identity_api.create_role(role['id'], role)
+        grants = [
+            {'role_id': role['id'],
+             'user_id': self.user['id'],
+             'project_id': self.project_id},
+            {'role_id': role['id'],
+             'group_id': self.group_id,
+             'domain_id': self.domain_id},
+            {'role_id': uuid.uuid4().hex,
+             'user_id': self.user['id'],
+             'project_id': self.project_id},
+            {'role_id': role['id'],
+             'user_id': self.user['id'],
+             'group_id': self.group_id,
+             'project_id': self.project_id}]
+        r = self.put(
+            '/batch/grants',
+            body={'grants': grants},
+            expected_status=200)
+        results = r.body['grants']
+        self.assertEqual(results[0]['grant'], grants[0])
+        self.assertEqual(results[1]['grant'], grants[1])
+        self.assertEqual(results[2]['error']['code'], 404)
+        self.assertEqual(results[3]['error']['code'], 400)
+
+        self.head(
+            '/projects/%(project_id)s/users/%(user_id)s/roles/%(role_id)s' % {
+                'project_id': self.project_id,
+                'user_id': self.user['id'],
+                'role_id': role['id']})
+        self.head(
+            '/domains/%(domain_id)s/groups/%(group_id)s/roles/%(role_id)s' % {
+                'domain_id': self.domain_id,
+                'group_id': self.group_id,
+                'role_id': role['id']})
+
     def test_crud_user_domain_role_grants(self):
         collection_url = (
             '/domains/%(domain_id)s/users/%(user_id)s/roles' % {
@@ -53,6 +53,48 @@ class ApplicationTest(BaseWSGITest):
         resp = req.get_response(FakeApp())
         self.assertEqual(jsonutils.loads(resp.body), {'1': '2'})
 
+    def test_xml_response_requested(self):
+        req = self._make_request()
+        req.environ[wsgi.XML_RESPONSE_ENV] = True
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.content_type, 'application/xml')
+        self.assertIn('<a xmlns=', resp.body)
+
+    def _xml_request(self, app):
+        req = self._make_request()
+        req.environ[wsgi.XML_RESPONSE_ENV] = True
+        return req.get_response(app)
+
+    def test_xml_serialization_fails(self):
+        class FakeApp(wsgi.Application):
+            def index(self, context):
+                return {'a': 'b', 'c': 'd'}
+
+        resp = self._xml_request(FakeApp())
+        self.assertEqual(resp.status_int, 500)
+        self.assertEqual(resp.content_type, 'application/xml')
+        self.assertIn('<error', resp.body)
+
+    def test_xml_invalid_characters(self):
+        class FakeApp(wsgi.Application):
+            def index(self, context):
+                return {'a': {'b': u'\x01'}}
+
+        resp = self._xml_request(FakeApp())
+        self.assertEqual(resp.status_int, 500)
+        self.assertIn('<error', resp.body)
+
+    def test_xml_error_with_invalid_characters(self):
+        class FakeApp(wsgi.Application):
+            def index(self, context):
+                raise exception.ValidationError(attribute=u'\x01',
+                                                target='x')
+
+        resp = self._xml_request(FakeApp())
+        self.assertEqual(resp.status_int, 400)
+        self.assertEqual(resp.content_type, 'application/json')
+        self.assertEqual(jsonutils.loads(resp.body)['error']['code'], 400)
+
     def test_render_response(self):
         data = {'attribute': 'value'}
         body = '{"attribute": "value"}'
@@ -64,6 +106,73 @@ class ApplicationTest(BaseWSGITest):
         self.assertEqual(resp.headers.get('Vary'), 'X-Auth-Token')
         self.assertEqual(resp.headers.get('Content-Length'), str(len(body)))
 
+    def test_render_response_streams_iterators(self):
+        data = {'attribute': (x for x in ['a', 'b'])}
+        body = '{"attribute": ["a", "b"]}'
+
+        resp = wsgi.render_response(body=data)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.headers.get('Content-Length'), None)
+        self.assertEqual(resp.content_type, 'application/json')
+        self.assertEqual(''.join(resp.app_iter), body)
+
+    def test_render_response_streams_empty_iterator(self):
+        resp = wsgi.render_response(body={'a': iter([]), 'b': {'c': 1}})
+        self.assertEqual(jsonutils.loads(resp.body), {'a': [], 'b': {'c': 1}})
+
+    def test_render_response_stream_fails_early(self):
+        def members():
+            raise exception.NotFound(target='x')
+            yield
+
+        self.assertRaises(exception.NotFound,
+                          wsgi.render_response,
+                          body={'a': members()})
+
+    def test_stream_fails_early(self):
+        class FakeApp(wsgi.Application):
+            def index(self, context):
+                def members():
+                    raise exception.NotFound(target='x')
+                    yield
+
+                return {'a': members()}
+
+        resp = self._make_request().get_response(FakeApp())
+        self.assertEqual(resp.status_int, 404)
+        self.assertIn('error', jsonutils.loads(resp.body))
+
+    def test_render_response_stream_fails_late(self):
+        def members():
+            yield 'x' * wsgi.STREAM_CHUNK_SIZE
+            raise exception.NotFound(target='x')
+
+        resp = wsgi.render_response(body={'a': members()})
+        self.assertEqual(resp.status_int, 200)
+        app_iter = iter(resp.app_iter)
+        self.assertTrue(next(app_iter).startswith('{"a": ["xxx'))
+        self.assertRaises(exception.NotFound, next, app_iter)
+
+    def test_render_response_xml(self):
+        resp = wsgi.render_response(body={'container': {'a': 'b'}}, xml=True)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.content_type, 'application/xml')
+        self.assertIn('<container', resp.body)
+        self.assertEqual(resp.headers.get('Content-Length'),
+                         str(len(resp.body)))
+
+    def test_render_response_xml_streams_iterators(self):
+        data = {'containers': (x for x in [{'a': 'b'}]), 'links': {}}
+        resp = wsgi.render_response(body=data, xml=True)
+        self.assertEqual(resp.headers.get('Content-Length'), None)
+        self.assertIn('<container a="b"/>', ''.join(resp.app_iter))
+
+    def test_render_exception_xml(self):
+        resp = wsgi.render_exception(exception.NotFound(target='x'), xml=True)
+        self.assertEqual(resp.status_int, 404)
+        self.assertEqual(resp.content_type, 'application/xml')
+        self.assertIn('<error', resp.body)
+
     def test_render_response_custom_status(self):
         resp = wsgi.render_response(status=(501, 'Not Implemented'))
         self.assertEqual(resp.status, '501 Not Implemented')